@@ -0,0 +1,186 @@
+"""Benchmarks for fetching records from tabix-indexed files.
+
+Benchmarks use pytest-benchmark and run on synthetic gtf and bed files,
+which are generated (once per session) for each of the requested scales.
+Scales are given as a comma-separated list of record counts, e.g.:
+
+    pytest benchmarks --scales=10000,100000,1000000 \\
+        --benchmark-json=results.json
+
+Besides timings, the peak (Python-tracked) memory usage of a single run
+of each benchmark is stored in the extra_info of the results. Results of
+different commits can be compared using pytest-benchmark compare.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+# noinspection PyUnresolvedReferences
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from ngs_tk.io import tabix
+
+
+CONTIGS = ('1', '2', '3', '4', '5')
+
+# Number of gtf records per gene (gene, transcript and exons).
+EXONS_PER_GENE = 3
+RECORDS_PER_GENE = EXONS_PER_GENE + 2
+
+GENE_SPACING = 10000
+
+
+def pytest_addoption(parser):
+    parser.addoption('--scales', default='10000',
+                     help='Comma-separated record counts of the synthetic '
+                          'files to benchmark (default: 10000).')
+
+
+def pytest_generate_tests(metafunc):
+    if 'scale' in metafunc.fixturenames:
+        scales = [int(float(s)) for s in
+                  metafunc.config.getoption('scales').split(',')]
+        metafunc.parametrize('scale', scales, indirect=True,
+                             scope='session')
+
+
+@pytest.fixture(scope='session')
+def scale(request):
+    return request.param
+
+
+def write_gtf(file_path, n_records, seed=0):
+    """Writes a synthetic (unsorted) gtf file with about n_records
+       records, consisting of genes with a transcript and exons."""
+
+    random = np.random.RandomState(seed)
+    n_genes = max(n_records // RECORDS_PER_GENE, 1)
+
+    contigs = random.choice(CONTIGS, size=n_genes)
+    starts = random.randint(1, n_genes * GENE_SPACING // len(CONTIGS) + 1,
+                            size=n_genes)
+    strands = random.choice(['+', '-'], size=n_genes)
+
+    with open(file_path, 'w') as file_:
+        file_.write('#!genome-build synthetic\n')
+
+        for i in range(n_genes):
+            gene_id = 'GENE{:010d}'.format(i)
+            attrs = ('gene_id "{}"; gene_name "Gene{}"; '
+                     'gene_biotype "protein_coding";').format(gene_id, i)
+            tr_attrs = attrs + ' transcript_id "TR{:010d}";'.format(i)
+
+            start, end = starts[i], starts[i] + 5000
+            prefix = '{}\tsynthetic\t'.format(contigs[i])
+            suffix = '\t.\t{}\t.\t'.format(strands[i])
+
+            lines = [prefix + 'gene\t{}\t{}'.format(start, end) +
+                     suffix + attrs,
+                     prefix + 'transcript\t{}\t{}'.format(start, end) +
+                     suffix + tr_attrs]
+
+            for j in range(EXONS_PER_GENE):
+                exon_start = start + j * 2000
+                lines.append(
+                    prefix + 'exon\t{}\t{}'.format(
+                        exon_start, min(exon_start + 1000, end)) +
+                    suffix + tr_attrs + ' exon_number "{}";'.format(j + 1))
+
+            file_.write('\n'.join(lines) + '\n')
+
+    return file_path
+
+
+def write_bed(file_path, n_records, seed=0, contigs=CONTIGS):
+    """Writes a synthetic (unsorted) bed6 file with n_records records
+       on the given contigs."""
+
+    random = np.random.RandomState(seed)
+
+    chroms = random.choice(contigs, size=n_records)
+    starts = random.randint(0, n_records * 1000 // len(contigs) + 1,
+                            size=n_records)
+    lengths = random.randint(50, 2000, size=n_records)
+    scores = random.randint(0, 1000, size=n_records)
+    strands = random.choice(['+', '-'], size=n_records)
+
+    with open(file_path, 'w') as file_:
+        for i in range(n_records):
+            file_.write('{}\t{}\t{}\tpeak_{}\t{}\t{}\n'.format(
+                chroms[i], starts[i], starts[i] + lengths[i], i,
+                scores[i], strands[i]))
+
+    return file_path
+
+
+@pytest.fixture(scope='session')
+def gtf_source(tmpdir_factory, scale):
+    """Path of an uncompressed synthetic gtf file."""
+    tmp_dir = tmpdir_factory.mktemp('gtf_{}'.format(scale))
+    return write_gtf(str(tmp_dir.join('synthetic.gtf')), scale)
+
+
+@pytest.fixture(scope='session')
+def gtf_path(gtf_source):
+    """Path of the compressed and indexed synthetic gtf file."""
+    return tabix.GtfFile.compress(gtf_source, create_gene_index=True)
+
+
+@pytest.fixture(scope='session')
+def gene_ids(scale):
+    """Ids of (up to) 10 genes spread over the synthetic gtf file."""
+
+    n_genes = max(scale // RECORDS_PER_GENE, 1)
+    step = max(n_genes // 10, 1)
+
+    return ['GENE{:010d}'.format(i) for i in range(0, n_genes, step)][:10]
+
+
+@pytest.fixture(scope='session')
+def bed_source(tmpdir_factory, scale):
+    """Path of an uncompressed synthetic bed file."""
+    tmp_dir = tmpdir_factory.mktemp('bed_{}'.format(scale))
+    return write_bed(str(tmp_dir.join('synthetic.bed')), scale)
+
+
+@pytest.fixture(scope='session')
+def other_bed_source(tmpdir_factory, scale):
+    """Path of a second (ten times smaller) uncompressed bed file, for
+       benchmarks that compare two files. The file shares only some of
+       its contigs with bed_source."""
+    tmp_dir = tmpdir_factory.mktemp('other_bed_{}'.format(scale))
+    return write_bed(str(tmp_dir.join('other.bed')), max(scale // 10, 1),
+                     seed=1, contigs=CONTIGS[1:] + ('6',))
+
+
+@pytest.fixture(scope='session')
+def bed_path(bed_source):
+    """Path of the compressed and indexed synthetic bed file."""
+    return tabix.BedFile.compress(bed_source)
+
+
+@pytest.fixture
+def measure(benchmark):
+    """Benchmarks the given function, recording the peak memory usage
+       of a single (additional) call in the benchmark extra_info."""
+
+    def _measure(func, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        benchmark.extra_info['peak_memory'] = peak
+
+        return benchmark(func, *args, **kwargs)
+
+    return _measure
@@ -0,0 +1,154 @@
+"""Benchmarks of the interval arithmetic of BedFrame against bedtools.
+
+Each benchmark times a BedFrame method on synthetic bed files and checks
+that its output matches the output of the corresponding bedtools command,
+which is run once on the same (sorted) files. The runtime of the bedtools
+command is stored as bedtools_time in the extra_info of the results.
+Benchmarks are skipped if bedtools is not on the PATH.
+"""
+
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+# noinspection PyUnresolvedReferences
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+
+import io
+import shutil
+import subprocess
+import time
+
+import pandas as pd
+import pytest
+
+from ngs_tk.io import tabix
+
+pytest.importorskip('pytest_benchmark')
+
+pytestmark = pytest.mark.skipif(shutil.which('bedtools') is None,
+                                reason='bedtools is not on the PATH')
+
+BED_COLUMNS = list(tabix.BedFile.FIELDS[:6])
+
+WINDOW = 1000
+
+
+@pytest.fixture(scope='session')
+def bed_paths(tmpdir_factory, bed_source, other_bed_source, scale):
+    """Paths of two sorted synthetic bed files and of a genome file."""
+
+    tmp_dir = tmpdir_factory.mktemp('intervals_{}'.format(scale))
+
+    a_path = tabix.BedFile.sort(bed_source, str(tmp_dir.join('a.bed')))
+    b_path = tabix.BedFile.sort(other_bed_source, str(tmp_dir.join('b.bed')))
+
+    # Use contig sizes that extend beyond the last record of each contig.
+    ends = pd.concat([_read_bed(a_path), _read_bed(b_path)]) \
+        .groupby('chrom')['chromEnd'].max()
+
+    genome_path = str(tmp_dir.join('genome.txt'))
+    with open(genome_path, 'w') as file_:
+        for contig, end in sorted(ends.items()):
+            file_.write('{}\t{}\n'.format(contig, end + 1000))
+
+    return a_path, b_path, genome_path
+
+
+@pytest.fixture(scope='session')
+def frames(bed_paths):
+    a_path, b_path, _ = bed_paths
+    return _read_bed(a_path), _read_bed(b_path)
+
+
+def _read_bed(file_path):
+    return tabix.BedFrame(pd.read_csv(
+        file_path, sep='\t', header=None, names=BED_COLUMNS,
+        dtype={'chrom': str, 'name': str}))
+
+
+def _bedtools(benchmark, *args):
+    """Runs a bedtools command, returning its (tab-separated) output as
+       a list of rows and recording its runtime in the extra_info."""
+
+    start = time.time()
+    output = subprocess.check_output(('bedtools',) + args)
+    benchmark.extra_info['bedtools_time'] = time.time() - start
+
+    frame = pd.read_csv(io.BytesIO(output), sep='\t', header=None,
+                        dtype={0: str})
+
+    return frame.values.tolist()
+
+
+def _rows(frame, columns):
+    return pd.DataFrame(frame)[columns].values.tolist()
+
+
+class TestIntervalsBench(object):
+
+    def test_merge_regions(self, measure, benchmark, frames, bed_paths):
+        a_frame, _ = frames
+
+        result = measure(a_frame.merge_regions)
+        expected = _bedtools(benchmark, 'merge', '-i', bed_paths[0])
+
+        assert _rows(result, BED_COLUMNS[:3]) == expected
+
+    def test_complement_regions(self, measure, benchmark, frames,
+                                bed_paths):
+        a_frame, _ = frames
+        a_path, _, genome_path = bed_paths
+
+        result = measure(a_frame.complement_regions, genome_path)
+        expected = _bedtools(benchmark, 'complement', '-i', a_path,
+                             '-g', genome_path)
+
+        assert _rows(result, BED_COLUMNS[:3]) == expected
+
+    def test_subtract_regions(self, measure, benchmark, frames, bed_paths):
+        a_frame, b_frame = frames
+        a_path, b_path, _ = bed_paths
+
+        result = measure(a_frame.subtract_regions, b_frame)
+        expected = _bedtools(benchmark, 'subtract', '-a', a_path,
+                             '-b', b_path)
+
+        assert _rows(result, BED_COLUMNS) == expected
+
+    def test_nearest(self, measure, benchmark, frames, bed_paths):
+        a_frame, b_frame = frames
+        a_path, b_path, _ = bed_paths
+
+        result = measure(a_frame.nearest, b_frame)
+        expected = _bedtools(benchmark, 'closest', '-a', a_path,
+                             '-b', b_path, '-d', '-t', 'first')
+
+        # Compare the row, the name of the nearest row and the distance.
+        # For rows without any row of other on the same contig, bedtools
+        # reports a name of '.' and a distance of -1.
+        result = result.assign(name_other=result['name_other'].fillna('.'),
+                               distance=result['distance'].fillna(-1))
+
+        assert _rows(result, BED_COLUMNS[:3] + ['name_other']) == \
+            [row[:3] + [row[9]] for row in expected]
+        assert result['distance'].astype(int).tolist() == \
+            [row[-1] for row in expected]
+
+    @pytest.mark.parametrize('window', [0, WINDOW])
+    def test_count_overlaps(self, measure, benchmark, frames, bed_paths,
+                            window):
+        a_frame, b_frame = frames
+        a_path, b_path, _ = bed_paths
+
+        result = measure(a_frame.count_overlaps, b_frame, window=window)
+
+        if window == 0:
+            expected = _bedtools(benchmark, 'intersect', '-a', a_path,
+                                 '-b', b_path, '-c')
+        else:
+            expected = _bedtools(benchmark, 'window', '-a', a_path,
+                                 '-b', b_path, '-w', str(window), '-c')
+
+        assert _rows(result, BED_COLUMNS + ['count']) == expected
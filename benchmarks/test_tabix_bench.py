@@ -0,0 +1,115 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+# noinspection PyUnresolvedReferences
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+
+import itertools
+
+import pysam
+import pytest
+
+from ngs_tk.io import tabix
+
+pytest.importorskip('pytest_benchmark')
+
+# Region covering roughly 50 genes at the start of the first contig.
+REGION = ('1', 1, 100000)
+
+
+def _consume(iterable):
+    for _ in iterable:
+        pass
+
+
+class TestTabixIteratorBench(object):
+
+    def test_fetch_region(self, measure, gtf_path):
+        """Single-region latency of the raw record iterator."""
+
+        iterator = tabix.TabixIterator(gtf_path, parser=pysam.asGTF())
+        measure(lambda: _consume(iterator.fetch(*REGION)))
+
+    def test_fetch_region_persistent(self, measure, gtf_path):
+        """Single-region latency using pooled file handles."""
+
+        with tabix.TabixIterator(gtf_path, parser=pysam.asGTF()) as iterator:
+            measure(lambda: _consume(iterator.fetch(*REGION)))
+
+    def test_fetch_all(self, measure, gtf_path):
+        """Iterating over all records of the file."""
+
+        iterator = tabix.TabixIterator(gtf_path, parser=pysam.asGTF())
+        measure(lambda: _consume(iterator.fetch()))
+
+
+class TestGtfFileBench(object):
+
+    @pytest.mark.parametrize('engine', ['records', 'columnar'])
+    def test_gtf_get_region(self, measure, gtf_path, engine):
+        """Single-region latency of get_region."""
+
+        gtf = tabix.GtfFile(gtf_path)
+        measure(gtf.get_region, *REGION, engine=engine)
+
+    @pytest.mark.parametrize('engine', ['records', 'columnar'])
+    def test_gtf_load(self, measure, gtf_path, engine, scale):
+        """Loading the whole file as a frame."""
+
+        if engine == 'records' and scale > 10 ** 5:
+            pytest.skip('records engine is too slow at this scale')
+
+        gtf = tabix.GtfFile(gtf_path)
+        measure(gtf.get_region, engine=engine)
+
+    def test_gtf_get_gene_indexed(self, measure, gtf_path, gene_ids):
+        """Filtered gene lookup using the sidecar gene index."""
+
+        gtf = tabix.GtfFile(gtf_path)
+        measure(lambda: [gtf.get_gene(gene_id) for gene_id in gene_ids])
+
+    def test_gtf_get_gene_scan(self, measure, gtf_path, gene_ids):
+        """Filtered gene lookup by scanning the file."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        measure(gtf.get_gene, gene_ids[-1], use_index=False)
+
+    def test_gtf_compress(self, benchmark, gtf_source, tmpdir):
+        """Sorting, compressing and indexing the file."""
+
+        paths = ('{}.{}.gz'.format(tmpdir.join('out'), i)
+                 for i in itertools.count())
+
+        benchmark.pedantic(
+            lambda: tabix.GtfFile.compress(gtf_source, out_path=next(paths)),
+            rounds=3, iterations=1)
+
+
+class TestBedFileBench(object):
+
+    @pytest.mark.parametrize('engine', ['records', 'columnar'])
+    def test_bed_get_region(self, measure, bed_path, engine):
+        """Single-region latency of get_region."""
+
+        bed = tabix.BedFile(bed_path)
+        measure(bed.get_region, *REGION, engine=engine)
+
+    def test_bed_load(self, measure, bed_path):
+        """Loading the whole file as a frame."""
+
+        bed = tabix.BedFile(bed_path)
+        measure(bed.get_region, engine='columnar')
+
+    def test_bed_compress(self, benchmark, bed_source, tmpdir):
+        """Sorting, compressing and indexing the file."""
+
+        paths = ('{}.{}.gz'.format(tmpdir.join('out'), i)
+                 for i in itertools.count())
+
+        benchmark.pedantic(
+            lambda: tabix.BedFile.compress(bed_source, out_path=next(paths),
+                                           tmp_dir=str(tmpdir)),
+            rounds=3, iterations=1)
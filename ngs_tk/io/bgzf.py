@@ -0,0 +1,146 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+# noinspection PyUnresolvedReferences
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+from future.utils import native_str
+
+import collections
+import struct
+import zlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Maximum amount of uncompressed data per block, as used by htslib.
+BLOCK_SIZE = 0xff00
+
+# Maximum total size of a compressed block.
+MAX_BLOCK_SIZE = 0x10000
+
+# Empty block marking the end of a BGZF file.
+EOF_BLOCK = (b'\x1f\x8b\x08\x04\x00\x00\x00\x00\x00\xff\x06\x00\x42\x43'
+             b'\x02\x00\x1b\x00\x03\x00\x00\x00\x00\x00\x00\x00\x00\x00')
+
+_HEADER = struct.Struct(native_str('<4BI2BH2BHH'))
+_FOOTER = struct.Struct(native_str('<II'))
+
+
+def compress_block(data, level=6):
+    """Compresses data (at most BLOCK_SIZE bytes) into a single BGZF block."""
+
+    compressed = _deflate(data, level)
+
+    # Fall back to storing data uncompressed if compression does
+    # not reduce the data enough to fit within a single block.
+    if len(compressed) + _HEADER.size + _FOOTER.size > MAX_BLOCK_SIZE:
+        compressed = _deflate(data, 0)
+
+    block_size = len(compressed) + _HEADER.size + _FOOTER.size
+
+    header = _HEADER.pack(31, 139, 8, 4, 0, 0, 255, 6,
+                          66, 67, 2, block_size - 1)
+    footer = _FOOTER.pack(zlib.crc32(data) & 0xffffffff, len(data))
+
+    return header + compressed + footer
+
+
+def _deflate(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+class BgzfWriter(object):
+    """Writes BGZF compressed files, such as those used by tabix.
+
+    Data is split into blocks that are compressed independently. If
+    threads > 1, blocks are compressed in parallel using a thread pool
+    (zlib releases the GIL while compressing) and written in order.
+    """
+
+    def __init__(self, file_path, threads=1, level=6):
+        self._file = open(file_path, 'wb')
+        self._level = level
+        self._buffer = bytearray()
+
+        if threads > 1:
+            self._executor = ThreadPoolExecutor(max_workers=threads)
+            self._max_pending = threads * 4
+        else:
+            self._executor = None
+            self._max_pending = 0
+
+        self._pending = collections.deque()
+
+    def write(self, data):
+        """Writes (bytes) data to the file."""
+
+        self._buffer.extend(data)
+
+        if len(self._buffer) >= BLOCK_SIZE:
+            n_blocks = len(self._buffer) // BLOCK_SIZE
+            buffer_ = bytes(self._buffer)
+
+            for i in range(n_blocks):
+                self._write_block(
+                    buffer_[i * BLOCK_SIZE:(i + 1) * BLOCK_SIZE])
+
+            self._buffer = bytearray(buffer_[n_blocks * BLOCK_SIZE:])
+
+    def writelines(self, lines):
+        """Writes an iterable of (bytes) lines to the file."""
+        for line in lines:
+            self.write(line)
+
+    def _write_block(self, block):
+        if self._executor is None:
+            self._file.write(compress_block(block, level=self._level))
+        else:
+            self._pending.append(self._executor.submit(
+                compress_block, block, level=self._level))
+
+            # Write finished blocks in order, bounding the number
+            # of blocks that are kept in memory.
+            while len(self._pending) > self._max_pending:
+                self._file.write(self._pending.popleft().result())
+
+    def close(self):
+        """Flushes any remaining data and closes the file."""
+
+        if self._file.closed:
+            return
+
+        if len(self._buffer) > 0:
+            self._write_block(bytes(self._buffer))
+            self._buffer = bytearray()
+
+        while self._pending:
+            self._file.write(self._pending.popleft().result())
+
+        if self._executor is not None:
+            self._executor.shutdown()
+
+        self._file.write(EOF_BLOCK)
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def bgzip(file_path, out_path=None, threads=1, level=6):
+    """Compresses a file using BGZF compression."""
+
+    if out_path is None:
+        out_path = file_path + '.gz'
+
+    with open(file_path, 'rb') as in_file:
+        with BgzfWriter(out_path, threads=threads, level=level) as writer:
+            for chunk in iter(lambda: in_file.read(BLOCK_SIZE * 16), b''):
+                writer.write(chunk)
+
+    return out_path
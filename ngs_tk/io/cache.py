@@ -0,0 +1,355 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+# noinspection PyUnresolvedReferences
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+try:
+    from pyarrow import feather
+except ImportError:
+    feather = None
+
+
+def _replace(src, dest):
+    try:
+        os.replace(src, dest)
+    except AttributeError:
+        # Python 2 has no os.replace, rename is atomic on posix.
+        os.rename(src, dest)
+
+
+class FrameCache(object):
+    """On-disk cache of parsed frames, stored in the (uncompressed) Arrow
+       feather format, so that frames can be read using memory-mapping.
+
+    Entries are keyed on the path, modification time and size of the
+    source file, together with any options used to parse the frame.
+    Categorical columns are preserved. Entries are evicted if they are
+    older than max_age seconds (since they were last used) or, least
+    recently used first, if the total cache size exceeds max_size bytes.
+    """
+
+    SUFFIX = '.feather'
+
+    def __init__(self, cache_dir=None, max_size=None, max_age=None):
+        if feather is None:
+            raise ImportError('FrameCache requires pyarrow')
+
+        if cache_dir is None:
+            cache_dir = os.environ.get(
+                'NGS_TK_CACHE_DIR',
+                os.path.join(os.path.expanduser('~'), '.cache', 'ngs_tk'))
+
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+        self._cache_dir = cache_dir
+        self._max_size = max_size
+        self._max_age = max_age
+
+    @property
+    def cache_dir(self):
+        return self._cache_dir
+
+    def key(self, source_path, **options):
+        """Returns the cache key for a frame parsed from the
+           given source file with the given options."""
+
+        source_path = os.path.abspath(str(source_path))
+        stat = os.stat(source_path)
+
+        payload = json.dumps(
+            {'path': source_path, 'mtime': stat.st_mtime,
+             'size': stat.st_size, 'options': options},
+            sort_keys=True, default=repr)
+
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self._cache_dir, key + self.SUFFIX)
+
+    def __contains__(self, key):
+        return os.path.exists(self._entry_path(key))
+
+    def get(self, key, columns=None):
+        """Reads the frame for the given key, returning None if the key
+           is not in the cache. If given, only the given columns are read."""
+
+        entry_path = self._entry_path(key)
+
+        try:
+            table = feather.read_table(entry_path, memory_map=True)
+        except (IOError, OSError):
+            return None
+
+        # Select columns (skipping missing columns). As the table is
+        # memory-mapped, unselected columns are never actually read.
+        if columns is not None:
+            table = table.select([c for c in columns
+                                  if c in table.column_names])
+
+        # Mark entry as recently used.
+        os.utime(entry_path, None)
+
+        return table.to_pandas()
+
+    def put(self, key, frame):
+        """Writes the frame to the cache under the given key."""
+
+        entry_path = self._entry_path(key)
+
+        # Write to temp file first, so that readers never see
+        # a partially written entry.
+        fd, tmp_path = tempfile.mkstemp(dir=self._cache_dir,
+                                        suffix='.tmp')
+        os.close(fd)
+
+        try:
+            feather.write_feather(frame.reset_index(drop=True), tmp_path,
+                                  compression='uncompressed')
+            _replace(tmp_path, entry_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+        self.evict()
+
+    def get_or_create(self, key, create, columns=None):
+        """Reads the frame for the given key, creating (and caching)
+           the frame using the given function if it is not cached."""
+
+        frame = self.get(key, columns=columns)
+
+        if frame is None:
+            frame = create()
+            self.put(key, frame)
+
+            if columns is not None:
+                frame = frame[[c for c in columns if c in frame.columns]]
+
+        return frame
+
+    def entries(self):
+        """Returns (path, size, last used) tuples of all cache entries."""
+
+        entries = []
+        for file_name in os.listdir(self._cache_dir):
+            if file_name.endswith(self.SUFFIX):
+                path = os.path.join(self._cache_dir, file_name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def size(self):
+        """Returns the total size of the cache entries in bytes."""
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Evicts entries that exceed the maximum age or cache size."""
+
+        entries = sorted(self.entries(), key=lambda e: e[2])
+
+        if self._max_age is not None:
+            min_time = time.time() - self._max_age
+            expired = [e for e in entries if e[2] < min_time]
+            entries = [e for e in entries if e[2] >= min_time]
+            self._remove(expired)
+
+        if self._max_size is not None:
+            total_size = sum(e[1] for e in entries)
+
+            evicted = []
+            for entry in entries:
+                if total_size <= self._max_size:
+                    break
+                evicted.append(entry)
+                total_size -= entry[1]
+
+            self._remove(evicted)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        self._remove(self.entries())
+
+    @staticmethod
+    def _remove(entries):
+        for path, _, _ in entries:
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+
+
+CacheStats = collections.namedtuple(
+    'CacheStats', ['hits', 'misses', 'evictions', 'entries', 'size'])
+
+
+class RegionCache(object):
+    """In-memory LRU cache of region query results.
+
+    Entries are keyed on the source file and the options of the query.
+    Entries are evicted (least recently used first) if the total size of
+    the cached frames exceeds max_size bytes. Entries of a source file are
+    invalidated once the modification time or size of the file changes.
+    Frames are copied when they are put in or read from the cache, so that
+    callers cannot modify cached frames. The cache is thread-safe.
+    """
+
+    def __init__(self, max_size=256 * 1024 ** 2):
+        self._max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._sources = {}
+        self._size = 0
+        self._lock = threading.Lock()
+
+        self._hits = self._misses = self._evictions = 0
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    @staticmethod
+    def key(source_path, **options):
+        """Returns the cache key for a query on the
+           given source file with the given options."""
+
+        return (os.path.abspath(str(source_path)),
+                json.dumps(options, sort_keys=True, default=repr))
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        """Returns the frame for the given key, or None if the key is not
+           in the cache (or if its source file has changed)."""
+
+        source = self._source_token(key[0])
+
+        with self._lock:
+            self._check_source(key[0], source)
+
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            # Mark entry as recently used.
+            self._entries[key] = self._entries.pop(key)
+            self._hits += 1
+
+        return entry[0].copy()
+
+    def put(self, key, frame):
+        """Stores the frame under the given key. Frames larger than
+           the maximum cache size are not cached."""
+
+        source = self._source_token(key[0])
+        size = int(frame.memory_usage(index=True, deep=True).sum())
+
+        if self._max_size is not None and size > self._max_size:
+            return
+
+        frame = frame.copy()
+
+        with self._lock:
+            self._check_source(key[0], source)
+
+            if key in self._entries:
+                self._size -= self._entries.pop(key)[1]
+
+            self._entries[key] = (frame, size)
+            self._size += size
+
+            self._evict()
+
+    def get_or_create(self, key, create):
+        """Returns the frame for the given key, creating (and caching)
+           the frame using the given function if it is not cached."""
+
+        frame = self.get(key)
+
+        if frame is None:
+            frame = create()
+            self.put(key, frame)
+
+        return frame
+
+    def stats(self):
+        """Returns the hit, miss and eviction counts of the cache, together
+           with the number of entries and their total size in bytes."""
+
+        with self._lock:
+            return CacheStats(hits=self._hits, misses=self._misses,
+                              evictions=self._evictions,
+                              entries=len(self._entries), size=self._size)
+
+    def clear(self, source_path=None):
+        """Removes all entries (of the given source file) from the cache."""
+
+        with self._lock:
+            if source_path is None:
+                self._entries.clear()
+                self._sources.clear()
+                self._size = 0
+            else:
+                self._remove_source(os.path.abspath(str(source_path)))
+
+    @staticmethod
+    def _source_token(source_path):
+        try:
+            stat = os.stat(source_path)
+        except OSError:
+            return None
+        return stat.st_mtime, stat.st_size
+
+    def _check_source(self, source_path, token):
+        # Drop entries of the source if the file changed since caching.
+        if self._sources.get(source_path, token) != token:
+            self._remove_source(source_path)
+        self._sources[source_path] = token
+
+    def _remove_source(self, source_path):
+        for key in [k for k in self._entries if k[0] == source_path]:
+            self._size -= self._entries.pop(key)[1]
+        self._sources.pop(source_path, None)
+
+    def _evict(self):
+        if self._max_size is None:
+            return
+
+        while self._size > self._max_size and len(self._entries) > 0:
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size -= size
+            self._evictions += 1
+
+
+_DEFAULT_CACHE = None
+
+
+def get_cache(cache=True):
+    """Returns the given cache, or the default cache if cache is True."""
+
+    global _DEFAULT_CACHE
+
+    if cache is True:
+        if _DEFAULT_CACHE is None:
+            _DEFAULT_CACHE = FrameCache()
+        return _DEFAULT_CACHE
+
+    return cache
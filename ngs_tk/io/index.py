@@ -0,0 +1,236 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+# noinspection PyUnresolvedReferences
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+from future.utils import native_str
+
+import json
+import os
+import re
+import struct
+
+import numpy as np
+from pysam.libcbgzf import BGZFile
+
+
+class GtfGeneIndex(object):
+    """Sidecar index mapping gene ids, gene names and transcript ids
+       to their position and BGZF virtual offset in a bgzipped gtf file.
+
+    The index is stored as a small json header followed by contiguous
+    column arrays, which are memory-mapped when the index is loaded. Keys
+    are sorted, so that lookups only touch a few pages of the index.
+    """
+
+    KEYS = ('gene_id', 'gene_name', 'transcript_id')
+    SUFFIX = '.gidx'
+
+    _MAGIC = b'NGSTKGI2'
+    _ALIGN = 16
+    _COLUMNS = ('key', 'kind', 'contig', 'start', 'end', 'offset')
+
+    def __init__(self, columns, source_mtime=None, source_size=None):
+        self._columns = columns
+        self._source_mtime = source_mtime
+        self._source_size = source_size
+
+    def __len__(self):
+        return len(self._columns['key'])
+
+    @classmethod
+    def index_path(cls, gtf_path):
+        """Returns the sidecar index path for the given gtf file."""
+        return str(gtf_path) + cls.SUFFIX
+
+    @classmethod
+    def open(cls, gtf_path, index_path=None, rebuild=True):
+        """Loads the index for the given gtf file, (re)building the
+           index if it is missing or if the gtf file has changed."""
+
+        index_path = index_path or cls.index_path(gtf_path)
+
+        if os.path.exists(index_path):
+            try:
+                index = cls.load(index_path)
+            except ValueError:
+                # Index was written by an older (incompatible) version.
+                index = None
+
+            if index is not None and not index.is_stale(gtf_path):
+                return index
+
+        if not rebuild:
+            raise ValueError('Missing or outdated gene '
+                             'index for {}'.format(gtf_path))
+
+        return cls.build(gtf_path, index_path=index_path)
+
+    def is_stale(self, gtf_path):
+        """Checks if the gtf file changed since the index was built."""
+        stat = os.stat(str(gtf_path))
+        return (stat.st_mtime != self._source_mtime or
+                stat.st_size != self._source_size)
+
+    @classmethod
+    def build(cls, gtf_path, index_path=None):
+        """Builds the index for a bgzipped gtf file and writes
+           it to the sidecar index path."""
+
+        gtf_path = str(gtf_path)
+        index_path = index_path or cls.index_path(gtf_path)
+
+        stat = os.stat(gtf_path)
+        entries = cls._scan(gtf_path)
+
+        # Sort entries by key, then by kind and contig.
+        keys = sorted(entries.keys(), key=lambda k: (k[1], k[0], k[2]))
+
+        columns = {
+            'key': np.array([k[1] for k in keys],
+                            dtype=_bytes_dtype(keys, 1)),
+            'kind': np.array([k[0] for k in keys], dtype=np.uint8),
+            'contig': np.array([k[2] for k in keys],
+                               dtype=_bytes_dtype(keys, 2)),
+            'start': np.array([entries[k][1] for k in keys], dtype=np.int64),
+            'end': np.array([entries[k][2] for k in keys], dtype=np.int64),
+            'offset': np.array([entries[k][3] for k in keys],
+                               dtype=np.uint64)
+        }
+
+        index = cls(columns, source_mtime=stat.st_mtime,
+                    source_size=stat.st_size)
+        index.write(index_path)
+
+        return cls.load(index_path)
+
+    @classmethod
+    def _scan(cls, gtf_path):
+        """Scans the gtf file, returning a dict mapping (kind, key, contig)
+           tuples to (contig, start, end, virtual offset) tuples. Keys
+           occurring on multiple contigs get an entry for each contig."""
+
+        key_regex = re.compile(
+            r'(?:^|;)\s*({})\s+"?([^";]*)"?'.format('|'.join(cls.KEYS))
+            .encode('ascii'))
+        kinds = {k.encode('ascii'): i for i, k in enumerate(cls.KEYS)}
+
+        entries = {}
+
+        with BGZFile(native_str(gtf_path), 'rb') as file_:
+            while True:
+                offset = file_.tell()
+                line = file_.readline()
+
+                if not line:
+                    break
+                elif line.startswith(b'#'):
+                    continue
+
+                fields = line.rstrip(b'\n').split(b'\t', 8)
+                contig, start, end = fields[0], int(fields[3]), int(fields[4])
+
+                for name, value in key_regex.findall(fields[8]):
+                    key = (kinds[name], value, contig)
+
+                    if key in entries:
+                        entry = entries[key]
+                        entries[key] = (entry[0], min(entry[1], start),
+                                        max(entry[2], end), entry[3])
+                    else:
+                        entries[key] = (contig, start, end, offset)
+
+        return entries
+
+    def write(self, index_path):
+        """Writes the index to the given path."""
+
+        # Determine (aligned) offsets of the column blocks,
+        # relative to the start of the data section.
+        header = {'source_mtime': self._source_mtime,
+                  'source_size': self._source_size,
+                  'length': len(self),
+                  'columns': []}
+
+        offset = 0
+        for name in self._COLUMNS:
+            column = self._columns[name]
+            header['columns'].append(
+                {'name': name, 'dtype': column.dtype.str, 'offset': offset})
+            offset = self._align(offset + column.nbytes)
+
+        payload = json.dumps(header).encode('utf-8')
+        data_start = self._align(len(self._MAGIC) + 4 + len(payload))
+
+        # Write header, followed by the column blocks.
+        with open(index_path, 'wb') as file_:
+            file_.write(self._MAGIC)
+            file_.write(struct.pack(native_str('<I'), len(payload)))
+            file_.write(payload)
+
+            for column_header in header['columns']:
+                column = np.ascontiguousarray(
+                    self._columns[column_header['name']])
+                file_.seek(data_start + column_header['offset'])
+                file_.write(column.tobytes())
+
+    @classmethod
+    def _align(cls, offset):
+        return ((offset + cls._ALIGN - 1) // cls._ALIGN) * cls._ALIGN
+
+    @classmethod
+    def load(cls, index_path):
+        """Loads an index from the given path using memory-mapping."""
+
+        with open(index_path, 'rb') as file_:
+            if file_.read(len(cls._MAGIC)) != cls._MAGIC:
+                raise ValueError('{} is not a gene index'.format(index_path))
+
+            size, = struct.unpack(native_str('<I'), file_.read(4))
+            header = json.loads(file_.read(size).decode('utf-8'))
+
+        data_start = cls._align(len(cls._MAGIC) + 4 + size)
+
+        columns = {}
+        for column in header['columns']:
+            dtype = np.dtype(str(column['dtype']))
+
+            if header['length'] > 0:
+                columns[column['name']] = np.memmap(
+                    index_path, mode='r', dtype=dtype,
+                    offset=data_start + column['offset'],
+                    shape=(header['length'],))
+            else:
+                columns[column['name']] = np.array([], dtype=dtype)
+
+        return cls(columns, source_mtime=header['source_mtime'],
+                   source_size=header['source_size'])
+
+    def lookup(self, key, field_name='gene_id'):
+        """Looks up the (contig, start, end, virtual offset) entries of
+           records with the given value for the given attribute."""
+
+        if field_name not in self.KEYS:
+            raise ValueError('Attribute {} is not indexed'.format(field_name))
+
+        kind = self.KEYS.index(field_name)
+        key = str(key).encode('utf-8')
+
+        keys = self._columns['key']
+        left = np.searchsorted(keys, key, side='left')
+        right = np.searchsorted(keys, key, side='right')
+
+        return [(self._columns['contig'][i].decode('utf-8'),
+                 int(self._columns['start'][i]),
+                 int(self._columns['end'][i]),
+                 int(self._columns['offset'][i]))
+                for i in range(left, right)
+                if self._columns['kind'][i] == kind and keys[i] == key]
+
+
+def _bytes_dtype(values, index):
+    """Returns a fixed-width bytes dtype fitting the given tuple field."""
+    width = max([len(v[index]) for v in values] + [1])
+    return np.dtype('S{}'.format(width))
@@ -0,0 +1,490 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+# noinspection PyUnresolvedReferences
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+
+import numpy as np
+import pandas as pd
+
+
+def _expand_ranges(lower, upper):
+    """Expands [lower, upper) ranges into a flat array of positions,
+       together with the index of the range of each position."""
+
+    counts = np.maximum(upper - lower, 0)
+    range_idx = np.repeat(np.arange(len(lower)), counts)
+
+    offsets = np.cumsum(counts) - counts
+    positions = (np.arange(counts.sum()) - np.repeat(offsets, counts) +
+                 np.repeat(lower, counts))
+
+    return range_idx, positions
+
+
+class RegionIndex(object):
+    """Per-contig sorted interval index over the rows of a frame.
+
+    Rows are grouped by contig and by length class (intervals with lengths
+    within the same power of two) and sorted by start position. Together
+    with the maximum interval length of each group, this allows overlap
+    queries to bisect the candidate rows instead of scanning the full
+    frame, without a few long intervals widening the search window for all
+    other intervals. Intervals are treated as closed, in line with
+    TabixFrame.get_region.
+    """
+
+    def __init__(self, contigs, starts, ends):
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+
+        codes, uniques = pd.factorize(np.asarray(contigs, dtype=object))
+
+        # Assign rows to length classes.
+        lengths = ends - starts
+        with np.errstate(invalid='ignore'):
+            classes = np.floor(np.log2(
+                np.where(lengths > 1, lengths, 1))).astype(np.int64)
+
+        # Sort rows by contig, length class and start,
+        # dropping rows without contig.
+        order = np.lexsort((starts, classes, codes))
+        order = order[codes[order] >= 0]
+
+        self._n_rows = len(codes)
+        self._order = order
+        self._starts = starts[order]
+        self._ends = ends[order]
+
+        # For sorted rows, also keep the spans of each contig.
+        self._spans = self._sorted_spans(codes, uniques, starts)
+        self._row_starts = starts if self._spans is not None else None
+
+        # Determine bounds and maximum interval length of each group.
+        group_keys = codes[order] * (classes.max(initial=0) + 1) + \
+            classes[order]
+        bounds = np.flatnonzero(np.diff(group_keys)) + 1
+        bounds = np.concatenate([[0], bounds, [len(order)]])
+
+        lengths = lengths[order]
+
+        self._contigs = {}
+        for lower, upper in zip(bounds[:-1], bounds[1:]):
+            if lower == upper:
+                continue
+
+            contig = uniques[codes[order[lower]]]
+            max_len = max(np.nanmax(lengths[lower:upper]), 0)
+
+            self._contigs.setdefault(contig, []).append(
+                (lower, upper, max_len))
+
+    @staticmethod
+    def _sorted_spans(codes, uniques, starts):
+        """Returns (lower, upper) spans of the rows of each contig if the
+           rows are sorted by contig and start, as each contig then covers
+           a contiguous range of rows."""
+
+        if len(codes) == 0 or (codes < 0).any():
+            return None
+
+        contig_changes = np.diff(codes) != 0
+        if (np.diff(codes) < 0).any() or \
+                not (contig_changes | (np.diff(starts) >= 0)).all():
+            return None
+
+        bounds = np.concatenate(
+            [[0], np.flatnonzero(contig_changes) + 1, [len(codes)]])
+
+        return {uniques[codes[lower]]: (lower, upper)
+                for lower, upper in zip(bounds[:-1], bounds[1:])}
+
+    @classmethod
+    def from_frame(cls, frame, ref_col='contig',
+                   start_col='start', end_col='end'):
+        """Builds an index over the rows of the given frame."""
+        return cls(frame[ref_col].values, frame[start_col].values,
+                   frame[end_col].values)
+
+    def __len__(self):
+        return len(self._order)
+
+    @property
+    def contigs(self):
+        return list(self._contigs.keys())
+
+    @property
+    def is_sorted(self):
+        """Whether the indexed rows are sorted by contig and start."""
+        return self._spans is not None
+
+    def span(self, reference, start=None, end=None):
+        """Returns the [lower, upper) range of row positions containing all
+           rows overlapping the region, if the rows are sorted by contig and
+           start (see is_sorted). Rows in the range do not necessarily
+           overlap the region."""
+
+        if self._spans is None:
+            raise ValueError('Spans require rows sorted by contig and start')
+
+        if reference not in self._spans:
+            return 0, 0
+
+        lower, upper = self._spans[reference]
+
+        # Bisect the (sorted) starts of the rows of the contig.
+        starts = self._row_starts[lower:upper]
+
+        if end is not None:
+            upper = lower + np.searchsorted(starts, end, side='right')
+
+        if start is not None:
+            # Find the first overlapping row within each length class, so
+            # that a few long rows don't widen the span to the full contig.
+            first = upper
+            for group in self._contigs[reference]:
+                positions = self._query_group(group, start, end)
+                if len(positions) > 0:
+                    first = min(first, positions[0])
+            lower = first
+
+        return lower, max(lower, upper)
+
+    def query(self, reference, start=None, end=None):
+        """Returns the (sorted) positions of rows overlapping the region."""
+
+        if reference not in self._contigs:
+            return np.array([], dtype=np.int64)
+
+        positions = [self._query_group(group, start, end)
+                     for group in self._contigs[reference]]
+
+        return np.sort(np.concatenate(positions))
+
+    def _query_group(self, group, start, end):
+        lower, upper, max_len = group
+        starts = self._starts[lower:upper]
+
+        # Select rows starting before the end of the region.
+        if end is not None:
+            upper = lower + np.searchsorted(starts, end, side='right')
+
+        # Select rows that end after the start of the region. As no row
+        # is longer than max_len, we can skip rows starting before
+        # (start - max_len) and only need to check the remaining rows.
+        if start is not None:
+            lower += np.searchsorted(starts, start - max_len, side='left')
+            candidates = np.arange(lower, max(lower, upper))
+            candidates = candidates[self._ends[candidates] >= start]
+        else:
+            candidates = np.arange(lower, max(lower, upper))
+
+        return self._order[candidates]
+
+    def query_many(self, references, starts, ends):
+        """Returns (query index, row position) arrays of the rows
+           overlapping each of the given regions, ordered by query
+           and then by row position."""
+
+        starts = np.asarray(starts)
+        ends = np.asarray(ends)
+
+        # Sort queries by contig and start (which speeds up bisection),
+        # factorizing contigs once rather than comparing them per contig.
+        order, uniques, bounds = _sorted_groups(references, starts)
+
+        query_idx, positions, ranks = [], [], []
+        n_found = np.zeros(len(starts), dtype=np.int64)
+
+        for i, reference in enumerate(uniques):
+            if reference not in self._contigs:
+                continue
+
+            queries = order[bounds[i]:bounds[i + 1]]
+            q_starts, q_ends = starts[queries], ends[queries]
+
+            for lower, upper, max_len in self._contigs[reference]:
+                group_starts = self._starts[lower:upper]
+
+                # Bisect the candidate rows for all queries at once.
+                q_upper = lower + np.searchsorted(
+                    group_starts, q_ends, side='right')
+                q_lower = lower + np.searchsorted(
+                    group_starts, q_starts - max_len, side='left')
+
+                range_idx, candidates = _expand_ranges(q_lower, q_upper)
+
+                # Drop candidates that end before the start of their query.
+                mask = self._ends[candidates] >= q_starts[range_idx]
+
+                group_queries = queries[range_idx[mask]]
+
+                query_idx.append(group_queries)
+                positions.append(self._order[candidates[mask]])
+                ranks.append(_run_ranks(group_queries, n_found))
+
+        if len(query_idx) == 0:
+            empty = np.array([], dtype=np.int64)
+            return empty, empty
+
+        # Group overlaps by query (in linear time), using the rank of
+        # each overlap among the overlaps found for its query.
+        offsets = np.cumsum(n_found) - n_found
+        dest = offsets[np.concatenate(query_idx)] + np.concatenate(ranks)
+
+        grouped_idx = np.empty(len(dest), dtype=np.int64)
+        grouped_idx[dest] = np.concatenate(query_idx)
+
+        grouped_pos = np.empty(len(dest), dtype=np.int64)
+        grouped_pos[dest] = np.concatenate(positions)
+
+        # Order by position within each query, using a single combined
+        # key. Keys now consist of a few sorted runs per query, which a
+        # stable (merge-based) sort orders considerably faster than an
+        # unstable sort of the ungrouped keys.
+        key = grouped_idx * max(self._n_rows, 1) + grouped_pos
+        order = np.argsort(key, kind='stable')
+
+        return grouped_idx[order], grouped_pos[order]
+
+
+def _run_ranks(queries, n_found):
+    """Ranks overlaps among the overlaps found so far for their query,
+       given the (contiguous) runs of overlaps of each query in a group,
+       updating the number of overlaps found per query in place."""
+
+    if len(queries) == 0:
+        return np.array([], dtype=np.int64)
+
+    firsts = np.flatnonzero(np.r_[True, queries[1:] != queries[:-1]])
+    lengths = np.diff(np.r_[firsts, len(queries)])
+
+    run_queries = queries[firsts]
+
+    ranks = np.arange(len(queries)) - np.repeat(firsts, lengths) + \
+        np.repeat(n_found[run_queries], lengths)
+    n_found[run_queries] += lengths
+
+    return ranks
+
+
+def _lexsort_codes(codes, values):
+    """Sorts rows by (integer) code and value. For integer values, rows
+       are sorted on a single combined key if possible, which is
+       considerably faster than a lexsort for many rows."""
+
+    if len(values) > 0 and np.issubdtype(values.dtype, np.integer):
+        low, high = int(values.min()), int(values.max())
+        span = high - low + 1
+
+        if (int(codes.max()) + 2) * span < np.iinfo(np.int64).max:
+            key = (codes.astype(np.int64) + 1) * span + (values - low)
+            return np.argsort(key, kind='stable')
+
+    return np.lexsort((values, codes))
+
+
+def _sorted_groups(groups, starts):
+    """Sorts rows by group and start, returning the sort order, the
+       group labels and the [lower, upper) bounds of each group."""
+
+    codes, uniques = pd.factorize(np.asarray(groups, dtype=object))
+
+    order = _lexsort_codes(codes, np.asarray(starts))
+    order = order[codes[order] >= 0]
+
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+    return order, uniques, bounds
+
+
+def merge_intervals(groups, starts, ends, distance=0):
+    """Merges overlapping (half-open) intervals within each group.
+
+    Intervals that overlap, or that are at most distance bases apart, are
+    merged. Returns the position of the first row of each merged interval
+    (which can be used to look up its group), together with the start, end
+    and number of rows of each merged interval. Merged intervals are
+    ordered by group and start.
+    """
+
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    order, _, bounds = _sorted_groups(groups, starts)
+    rows, m_starts, m_ends, counts = [], [], [], []
+
+    for lower, upper in zip(bounds[:-1], bounds[1:]):
+        if lower == upper:
+            continue
+
+        group_order = order[lower:upper]
+        g_starts, g_ends = starts[group_order], ends[group_order]
+
+        # Start a new interval if a row starts after the end of all
+        # previous rows in the group (plus the allowed distance).
+        reach = np.maximum.accumulate(g_ends)
+        new = np.ones(len(g_starts), dtype=bool)
+        new[1:] = g_starts[1:] > reach[:-1] + distance
+
+        first = np.flatnonzero(new)
+
+        rows.append(group_order[first])
+        m_starts.append(g_starts[first])
+        m_ends.append(np.maximum.reduceat(g_ends, first))
+        counts.append(np.diff(np.append(first, len(g_starts))))
+
+    if len(rows) == 0:
+        empty = np.array([], dtype=np.int64)
+        return empty, empty, empty, empty
+
+    return (np.concatenate(rows), np.concatenate(m_starts),
+            np.concatenate(m_ends), np.concatenate(counts))
+
+
+def complement_intervals(starts, ends, size):
+    """Returns the (half-open) gaps between the given merged, sorted
+       intervals of a contig of the given size."""
+
+    gap_starts = np.concatenate([[0], ends])
+    gap_ends = np.concatenate([starts, [size]])
+
+    mask = gap_ends > gap_starts
+    return gap_starts[mask], gap_ends[mask]
+
+
+def subtract_intervals(contigs, starts, ends,
+                       other_contigs, other_starts, other_ends):
+    """Subtracts the other (half-open) intervals from the given intervals.
+
+    Returns the row position of each remaining piece, together with the
+    start and end of the piece. Pieces are ordered by row and start.
+    """
+
+    contigs = np.asarray(contigs, dtype=object)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    # Merge other intervals, giving sorted, disjoint intervals per contig.
+    rows, m_starts, m_ends, _ = merge_intervals(
+        other_contigs, other_starts, other_ends)
+    m_contigs = np.asarray(other_contigs, dtype=object)[rows]
+
+    row_idx = [np.flatnonzero(pd.isnull(contigs))]
+    p_starts, p_ends = [starts[row_idx[0]]], [ends[row_idx[0]]]
+
+    for contig in pd.unique(contigs[~pd.isnull(contigs)]):
+        queries = np.flatnonzero(contigs == contig)
+        q_starts, q_ends = starts[queries], ends[queries]
+
+        mask = m_contigs == contig
+        c_starts, c_ends = m_starts[mask], m_ends[mask]
+
+        # Keep rows unchanged if there is nothing to subtract.
+        if len(c_starts) == 0:
+            row_idx.append(queries)
+            p_starts.append(q_starts)
+            p_ends.append(q_ends)
+            continue
+
+        # Determine the range of merged intervals overlapping each row.
+        # A row overlapped by k intervals is split into (at most) k + 1
+        # pieces, lying before, between or after these intervals.
+        lower = np.searchsorted(c_ends, q_starts, side='right')
+        upper = np.searchsorted(c_starts, q_ends, side='left')
+
+        range_idx, positions = _expand_ranges(lower, upper + 1)
+
+        piece_starts = np.where(
+            positions == lower[range_idx], q_starts[range_idx],
+            c_ends[np.maximum(positions - 1, 0)])
+        piece_ends = np.where(
+            positions == upper[range_idx], q_ends[range_idx],
+            c_starts[np.minimum(positions, len(c_starts) - 1)])
+
+        piece_starts = np.maximum(piece_starts, q_starts[range_idx])
+        piece_ends = np.minimum(piece_ends, q_ends[range_idx])
+        keep = piece_ends > piece_starts
+
+        row_idx.append(queries[range_idx[keep]])
+        p_starts.append(piece_starts[keep])
+        p_ends.append(piece_ends[keep])
+
+    row_idx = np.concatenate(row_idx)
+    p_starts, p_ends = np.concatenate(p_starts), np.concatenate(p_ends)
+
+    order = np.lexsort((p_starts, row_idx))
+    return row_idx[order], p_starts[order], p_ends[order]
+
+
+def nearest_intervals(contigs, starts, ends,
+                      other_contigs, other_starts, other_ends):
+    """Finds the nearest other (half-open) interval of each interval.
+
+    Returns the position of the nearest other interval for each interval
+    (or -1 if the contig has no other intervals), together with the
+    distance between the intervals. The distance is 0 for overlapping
+    intervals and 1 for adjacent intervals, as in bedtools closest. Ties
+    are resolved in favour of the first of the other intervals.
+    """
+
+    contigs = np.asarray(contigs, dtype=object)
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+
+    other_contigs = np.asarray(other_contigs, dtype=object)
+    other_starts = np.asarray(other_starts, dtype=np.int64)
+    other_ends = np.asarray(other_ends, dtype=np.int64)
+
+    nearest = np.full(len(contigs), -1, dtype=np.int64)
+    distances = np.zeros(len(contigs), dtype=np.int64)
+
+    # Find overlapping intervals using a closed index, by shrinking
+    # the (half-open) query intervals to closed intervals.
+    index = RegionIndex(other_contigs, other_starts, other_ends)
+    query_idx, positions = index.query_many(contigs, starts + 1, ends - 1)
+
+    has_overlap = np.zeros(len(contigs), dtype=bool)
+    if len(query_idx) > 0:
+        first = np.flatnonzero(np.diff(query_idx, prepend=-1) != 0)
+        nearest[query_idx[first]] = positions[first]
+        has_overlap[query_idx[first]] = True
+
+    for contig in pd.unique(contigs[~pd.isnull(contigs)]):
+        targets = np.flatnonzero(other_contigs == contig)
+        if len(targets) == 0:
+            continue
+
+        queries = np.flatnonzero((contigs == contig) & ~has_overlap)
+        q_starts, q_ends = starts[queries], ends[queries]
+
+        # Candidate upstream of each row: the target with the largest
+        # end before the row start. Candidate downstream: the target with
+        # the smallest start after the row end. Both are tie-broken on
+        # position, by sorting with the position as secondary key.
+        by_end = targets[np.lexsort((-targets, other_ends[targets]))]
+        by_start = targets[np.lexsort((targets, other_starts[targets]))]
+
+        up = np.searchsorted(other_ends[by_end], q_starts, side='right') - 1
+        down = np.searchsorted(other_starts[by_start], q_ends, side='left')
+
+        has_up, has_down = up >= 0, down < len(targets)
+        up_idx = by_end[np.maximum(up, 0)]
+        down_idx = by_start[np.minimum(down, len(targets) - 1)]
+
+        big = np.iinfo(np.int64).max
+        up_dist = np.where(has_up, q_starts - other_ends[up_idx] + 1, big)
+        down_dist = np.where(
+            has_down, other_starts[down_idx] - q_ends + 1, big)
+
+        use_up = (up_dist < down_dist) | \
+            ((up_dist == down_dist) & (up_idx < down_idx))
+        found = has_up | has_down
+
+        nearest[queries[found]] = np.where(
+            use_up, up_idx, down_idx)[found]
+        distances[queries[found]] = np.minimum(up_dist, down_dist)[found]
+
+    return nearest, distances
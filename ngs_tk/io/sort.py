@@ -0,0 +1,316 @@
+from __future__ import (absolute_import, division,
+                        print_function, unicode_literals)
+
+# noinspection PyUnresolvedReferences
+from builtins import (ascii, bytes, chr, dict, filter, hex, input,
+                      int, map, next, oct, open, pow, range, round,
+                      str, super, zip)
+
+import collections
+import heapq
+import itertools
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+
+# Approximate memory used by the sort key and list entry of a line.
+_KEY_SIZE = 128
+
+
+def sort_lines(lines, key, buffer_size=256 * 1024 ** 2, tmp_dir=None):
+    """Sorts lines using an external merge sort.
+
+    Lines are read into memory until the buffer size (the approximate
+    memory used by the buffered lines, in bytes) is exceeded, after which
+    the buffered lines are sorted and spilled to disk as a sorted run.
+    Runs are merged lazily while the sorted lines are consumed. Lines that
+    fit within a single buffer are sorted entirely in memory. Sorting is
+    stable with respect to the key.
+    """
+
+    run_dir = None
+    run_paths = []
+
+    try:
+        buffer_, buffer_bytes = [], 0
+
+        for line in lines:
+            if not line.endswith('\n'):
+                line += '\n'
+
+            buffer_.append(line)
+            buffer_bytes += sys.getsizeof(line) + _KEY_SIZE
+
+            if buffer_bytes >= buffer_size:
+                if run_dir is None:
+                    run_dir = tempfile.mkdtemp(dir=tmp_dir)
+
+                run_paths.append(_write_run(buffer_, key, run_dir,
+                                            index=len(run_paths)))
+                buffer_, buffer_bytes = [], 0
+
+        buffer_.sort(key=key)
+
+        if len(run_paths) == 0:
+            # Everything fits in memory, no need to merge.
+            for line in buffer_:
+                yield line
+        else:
+            # Merge runs and remaining lines. Keys are decorated with
+            # the run index to keep the merge stable.
+            run_files = [open(path, 'r') for path in run_paths]
+
+            try:
+                runs = [_decorate(run, key, i)
+                        for i, run in enumerate(run_files)]
+                runs.append(_decorate(buffer_, key, len(run_files)))
+
+                for _, _, line in heapq.merge(*runs):
+                    yield line
+            finally:
+                for run_file in run_files:
+                    run_file.close()
+    finally:
+        if run_dir is not None:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def _write_run(lines, key, run_dir, index):
+    lines.sort(key=key)
+
+    run_path = os.path.join(run_dir, 'run_{}.txt'.format(index))
+    with open(run_path, 'w') as run_file:
+        run_file.writelines(lines)
+
+    return run_path
+
+
+def _decorate(lines, key, index):
+    return ((key(line), index, line) for line in lines)
+
+
+def split_comments(lines, comment_char='#'):
+    """Splits lines into comment lines and other lines.
+
+    Returns a list that is filled with the comment lines while
+    the returned iterable of other (non-empty) lines is consumed.
+    """
+
+    comments = []
+
+    def _records():
+        for line in lines:
+            if line.startswith(comment_char):
+                comments.append(line)
+            elif line.strip():
+                yield line
+
+    return comments, _records()
+
+
+def sort_file(lines, key, buffer_size=256 * 1024 ** 2,
+              tmp_dir=None, comment_char='#'):
+    """Sorts lines of a file, yielding any comment lines first,
+       followed by the sorted remaining lines."""
+
+    comments, records = split_comments(lines, comment_char=comment_char)
+    sorted_lines = sort_lines(records, key=key, buffer_size=buffer_size,
+                              tmp_dir=tmp_dir)
+
+    # Take the first sorted line, which requires consuming all input
+    # lines. After this, all comment lines have been collected.
+    first = list(itertools.islice(sorted_lines, 1))
+
+    for line in comments:
+        if not line.endswith('\n'):
+            line += '\n'
+        yield line
+
+    for line in itertools.chain(first, sorted_lines):
+        yield line
+
+
+def gtf_key(line):
+    """Sort key for gtf lines, ordering on contig and start position."""
+    fields = line.split('\t', 4)
+    return fields[0], int(fields[3])
+
+
+def bed_key(line):
+    """Sort key for bed lines, ordering on chrom, start and end position."""
+    fields = line.split('\t', 3)
+    return fields[0], int(fields[1]), int(fields[2])
+
+
+def _bed_position_key(line):
+    fields = line.split('\t', 3)
+    return int(fields[1]), int(fields[2])
+
+
+def natural_key(value):
+    """Sort key for natural ordering of strings (e.g. chr2 < chr10)."""
+    return tuple(int(token) if token.isdigit() else token
+                 for token in re.split(r'(\d+)', value))
+
+
+def read_contig_order(fai_path):
+    """Reads the order of contigs from a reference (.fai) index."""
+    with open(fai_path, 'r') as file_:
+        return [line.split('\t', 1)[0].strip() for line in file_
+                if line.strip()]
+
+
+class BedKey(object):
+    """Sort key for bed lines, ordering on chrom, start and end position.
+
+    Chromosomes are ordered lexicographically (contig_order=None),
+    naturally ('natural', so that chr2 sorts before chr10) or in the
+    order of a given sequence of chromosomes, such as the order of a
+    reference genome. Chromosomes missing from the given sequence are
+    ordered naturally after the given chromosomes.
+    """
+
+    def __init__(self, contig_order=None):
+        if contig_order is None or contig_order == 'natural':
+            self._ranks = None
+        else:
+            self._ranks = {contig: i for i, contig in enumerate(contig_order)}
+
+        self._natural = contig_order is not None
+        self._cache = {}
+
+    def contig_key(self, contig):
+        """Returns the sort key of the given chromosome."""
+
+        try:
+            return self._cache[contig]
+        except KeyError:
+            if not self._natural:
+                key = contig
+            elif self._ranks is None:
+                key = natural_key(contig)
+            elif contig in self._ranks:
+                key = (0, self._ranks[contig])
+            else:
+                key = (1, natural_key(contig))
+
+            self._cache[contig] = key
+            return key
+
+    def __call__(self, line):
+        fields = line.split('\t', 3)
+        return (self.contig_key(fields[0]),
+                int(fields[1]), int(fields[2]))
+
+
+def sort_bed(lines, contig_order=None, buffer_size=256 * 1024 ** 2,
+             tmp_dir=None, comment_char='#'):
+    """Sorts bed lines on chrom, start and end position, yielding the
+       sorted lines. See BedKey for the supported chromosome orders."""
+
+    return sort_file(lines, key=BedKey(contig_order),
+                     buffer_size=buffer_size, tmp_dir=tmp_dir,
+                     comment_char=comment_char)
+
+
+def sort_bed_parallel(lines, processes=None, contig_order=None,
+                      buffer_size=256 * 1024 ** 2, tmp_dir=None,
+                      comment_char='#'):
+    """Sorts bed lines in parallel per chromosome, yielding sorted lines.
+
+    Lines are first partitioned into temporary files per chromosome, which
+    are then sorted in a pool of processes. Each process sorts externally
+    using the given buffer size, so memory usage is bounded by roughly
+    processes * buffer_size. Sorted chromosomes are yielded in order as
+    soon as they become available.
+    """
+
+    key = BedKey(contig_order)
+    work_dir = tempfile.mkdtemp(dir=tmp_dir)
+
+    try:
+        comments, records = split_comments(lines, comment_char=comment_char)
+        contig_paths = _partition_contigs(records, work_dir)
+
+        for line in comments:
+            if not line.endswith('\n'):
+                line += '\n'
+            yield line
+
+        contigs = sorted(contig_paths.keys(), key=key.contig_key)
+        tasks = [(contig_paths[contig], buffer_size, work_dir)
+                 for contig in contigs]
+
+        pool = multiprocessing.Pool(processes)
+
+        try:
+            for sorted_path in pool.imap(_sort_contig_file, tasks):
+                with open(sorted_path, 'r') as file_:
+                    for line in file_:
+                        yield line
+                os.unlink(sorted_path)
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def _partition_contigs(lines, work_dir, max_open=256):
+    """Writes lines into separate files per contig.
+
+    At most max_open files are kept open at once, closing the least
+    recently written file if needed (and reopening it for appending if
+    more lines follow), so that assemblies with many (small) contigs
+    don't exhaust the available file handles.
+    """
+
+    files, paths = collections.OrderedDict(), {}
+
+    try:
+        for line in lines:
+            contig = line.split('\t', 1)[0]
+
+            try:
+                file_ = files.pop(contig)
+            except KeyError:
+                if len(files) >= max_open:
+                    files.popitem(last=False)[1].close()
+
+                if contig in paths:
+                    file_ = open(paths[contig], 'a')
+                else:
+                    paths[contig] = os.path.join(
+                        work_dir, 'contig_{}.bed'.format(len(paths)))
+                    file_ = open(paths[contig], 'w')
+
+            # (Re-)insert file as the most recently used file.
+            files[contig] = file_
+
+            if not line.endswith('\n'):
+                line += '\n'
+            file_.write(line)
+    finally:
+        for file_ in files.values():
+            file_.close()
+
+    return paths
+
+
+def _sort_contig_file(args):
+    file_path, buffer_size, tmp_dir = args
+    sorted_path = file_path + '.sorted'
+
+    with open(file_path, 'r') as in_file:
+        with open(sorted_path, 'w') as out_file:
+            out_file.writelines(sort_lines(
+                in_file, key=_bed_position_key,
+                buffer_size=buffer_size, tmp_dir=tmp_dir))
+
+    os.unlink(file_path)
+
+    return sorted_path
@@ -6,16 +6,50 @@ from builtins import (ascii, bytes, chr, dict, filter, hex, input,
                       int, map, next, oct, open, pow, range, round,
                       str, super, zip)
 from future.utils import native_str
+from future.moves.itertools import zip_longest
 
+import collections
+import concurrent.futures
 import contextlib
+import functools
 import itertools
+import multiprocessing
+import operator
 import os
-import subprocess
+import re
+import threading
 
 import pysam
+from pysam.libcbgzf import BGZFile
 import numpy as np
 import pandas as pd
 
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+try:
+    import numexpr as ne
+except ImportError:
+    ne = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+except ImportError:
+    pa = pc = None
+
+from . import bgzf, sort as sort_
+from .cache import RegionCache, get_cache
+from .index import GtfGeneIndex
+from . import intervals as intervals_
+from .intervals import RegionIndex
+
+
+# Version of the parsed frame format, used to invalidate cached frames.
+_FRAME_VERSION = 2
+
 
 def _parse_float(value):
     try:
@@ -24,6 +58,130 @@ def _parse_float(value):
         return np.nan
 
 
+def _parse_float_array(values):
+    return pd.to_numeric(pd.Series(values, dtype=object),
+                         errors='coerce').values.astype(float)
+
+
+def _parse_int_array(values):
+    return np.array(values, dtype=np.int64)
+
+
+_GTF_ATTRIBUTE_REGEX = re.compile(r'\s*([^\s";]+)\s+"?([^";]*)"?\s*;?')
+
+
+def _parse_gtf_attributes(value, keys=None):
+    """Parses a gtf attribute string into a dict, optionally
+       only keeping the given attribute keys."""
+
+    attrs = dict(_GTF_ATTRIBUTE_REGEX.findall(value))
+
+    if keys is not None:
+        attrs = {k: v for k, v in attrs.items() if k in keys}
+
+    return attrs
+
+
+def _parse_gtf_attribute_column(attr_strings, attributes=None):
+    """Parses a column of gtf attribute strings into a dict of attribute
+       columns, optionally only keeping the given attributes.
+
+    Attributes missing from a record are NaN. If pyarrow is available,
+    attribute strings are tokenized using vectorized arrow string kernels,
+    otherwise each string is tokenized using a compiled regex.
+    """
+
+    n_rows = len(attr_strings)
+
+    if pa is not None:
+        rows, keys, values = _tokenize_gtf_attributes_arrow(attr_strings)
+    else:
+        rows, keys, values = _tokenize_gtf_attributes(attr_strings)
+
+    codes, uniques = pd.factorize(keys)
+
+    if attributes is None:
+        attributes = list(uniques)
+
+    # Group tokens by key. Sorting is stable, so that values of duplicate
+    # keys within a record are assigned in order (the last one is kept).
+    order = np.argsort(codes, kind='stable')
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    key_bounds = {key: (bounds[i], bounds[i + 1])
+                  for i, key in enumerate(uniques)}
+
+    columns = {}
+    for key in attributes:
+        column = np.full(n_rows, np.nan, dtype=object)
+
+        if key in key_bounds:
+            lower, upper = key_bounds[key]
+            selected = order[lower:upper]
+            column[rows[selected]] = values[selected]
+
+        columns[key] = column
+
+    return columns
+
+
+def _tokenize_gtf_attributes(attr_strings):
+    """Tokenizes attribute strings into (row, key, value) arrays."""
+
+    rows, keys, values = [], [], []
+
+    for i, attr_str in enumerate(attr_strings):
+        for key, value in _GTF_ATTRIBUTE_REGEX.findall(attr_str):
+            rows.append(i)
+            keys.append(key)
+            values.append(value)
+
+    return (np.array(rows, dtype=np.int64), np.array(keys, dtype=object),
+            np.array(values, dtype=object))
+
+
+def _tokenize_gtf_attributes_arrow(attr_strings):
+    """Tokenizes attribute strings into (row, key, value)
+       arrays using vectorized arrow string kernels."""
+
+    attr_strings = pa.array(np.asarray(attr_strings, dtype=object),
+                            type=pa.string(), from_pandas=True)
+
+    # Split into 'key value' pairs, tracking the record of each pair.
+    pairs = pc.split_pattern(attr_strings, ';')
+    rows = pc.list_parent_indices(pairs)
+    pairs = pc.utf8_split_whitespace(
+        pc.utf8_trim_whitespace(pc.list_flatten(pairs)), max_splits=1)
+
+    # Drop empty pairs (e.g. after a trailing separator).
+    mask = pc.equal(pc.list_value_length(pairs), 2)
+    pairs, rows = pairs.filter(mask), rows.filter(mask)
+
+    keys = pc.list_element(pairs, 0)
+    values = pc.utf8_trim(pc.list_element(pairs, 1), '"')
+
+    return (rows.to_numpy(),
+            keys.to_numpy(zero_copy_only=False).astype(object),
+            values.to_numpy(zero_copy_only=False).astype(object))
+
+
+def _downcast_positions(values):
+    """Downcasts (integer) positions to the smallest 32-bit integer
+       type that fits the values, keeping larger values as is."""
+
+    if len(values) == 0:
+        return values.astype(np.int32)
+
+    min_value, max_value = values.min(), values.max()
+
+    if min_value >= np.iinfo(np.int32).min and \
+            max_value <= np.iinfo(np.int32).max:
+        return values.astype(np.int32)
+    elif min_value >= 0 and max_value <= np.iinfo(np.uint32).max:
+        return values.astype(np.uint32)
+
+    return values
+
+
 def _reorder_columns(frame, order):
     columns = list(order)
     extra_columns = sorted([c for c in frame.columns
@@ -31,86 +189,401 @@ def _reorder_columns(frame, order):
     return frame[columns + extra_columns]
 
 
+def _is_multi_value(value):
+    """Whether a filter value is a collection of values to match."""
+    return isinstance(value, (list, tuple, set, frozenset,
+                              np.ndarray, pd.Index, pd.Series))
+
+
+def _region_mask(frame, reference=None, start=None, end=None, filters=None,
+                 incl_left=True, incl_right=True, ref_col='contig',
+                 start_col='start', end_col='end', overlap=True):
+    """Builds a boolean mask selecting the rows of frame that overlap the
+       given (closed) region and match the given filters.
+
+    Start and end can be scalars or arrays (with one bound per row). If
+    overlap is False, rows are assumed to overlap the region and only
+    inclusiveness and filters are checked.
+    Positional checks are combined into a single mask in one pass, using
+    numexpr for large frames if available, or otherwise by combining
+    the checks in-place into a single mask buffer. Filters match rows
+    equal to the given value or, for collections of values, rows
+    matching any of the values.
+    """
+
+    checks = []
+
+    if overlap and end is not None:
+        checks.append((frame[start_col].values, '<=', end))
+
+    if overlap and start is not None:
+        checks.append((frame[end_col].values, '>=', start))
+
+    if not incl_left and start is not None:
+        checks.append((frame[start_col].values, '>', start))
+
+    if not incl_right and end is not None:
+        checks.append((frame[end_col].values, '<', end))
+
+    mask = _combine_checks(checks, len(frame))
+
+    if reference is not None:
+        mask &= (frame[ref_col] == reference).values
+
+    if filters is not None:
+        for name, value in filters.items():
+            if _is_multi_value(value):
+                mask &= frame[name].isin(list(value)).values
+            else:
+                mask &= (frame[name] == value).values
+
+    return mask
+
+
+_NUMEXPR_MIN_ROWS = 2 ** 16
+
+_COMPARISONS = {'<=': np.less_equal, '>=': np.greater_equal,
+                '<': np.less, '>': np.greater}
+
+
+def _combine_checks(checks, n_rows):
+    """Combines (values, operator, bound) comparisons into a single mask."""
+
+    if ne is not None and len(checks) > 1 and n_rows >= _NUMEXPR_MIN_ROWS:
+        local_dict, terms = {}, []
+        for i, (values, op, bound) in enumerate(checks):
+            local_dict['v{}'.format(i)] = values
+            local_dict['b{}'.format(i)] = bound
+            terms.append('(v{0} {1} b{0})'.format(i, op))
+        return ne.evaluate(' & '.join(terms), local_dict=local_dict)
+
+    mask = np.ones(n_rows, dtype=bool)
+    buffer = np.empty(n_rows, dtype=bool)
+
+    for values, op, bound in checks:
+        with np.errstate(invalid='ignore'):
+            _COMPARISONS[op](values, bound, out=buffer)
+        np.logical_and(mask, buffer, out=mask)
+
+    return mask
+
+
 def _get_region(frame, reference, start=None, end=None,
                 filters=None, incl_left=True, incl_right=True,
                 ref_col='contig', start_col='start', end_col='end'):
-    # Filter on passed range.
-    mask = frame[ref_col] == reference
+    mask = _region_mask(frame, reference, start, end, filters=filters,
+                        incl_left=incl_left, incl_right=incl_right,
+                        ref_col=ref_col, start_col=start_col,
+                        end_col=end_col)
+    return frame.iloc[np.flatnonzero(mask)]
+
+
+def _filter_region(frame, starts, ends, filters=None, incl_left=True,
+                   incl_right=True, start_col='start', end_col='end'):
+    """Applies inclusiveness and additional filters to
+       (the candidate rows of) a region query."""
+
+    return _region_mask(frame, start=starts, end=ends, filters=filters,
+                        incl_left=incl_left, incl_right=incl_right,
+                        start_col=start_col, end_col=end_col,
+                        overlap=False)
+
+
+def _array_token(values):
+    # Identifies the memory backing an array, used
+    # to detect replaced (or copied-on-write) columns.
+    if isinstance(values, pd.Categorical):
+        return _array_token(values.codes), len(values.categories)
+    elif isinstance(values, np.ndarray):
+        return (values.__array_interface__['data'][0],
+                values.shape, values.strides)
+    return id(values)
+
+
+_GTF_STR_FIELDS = frozenset(['contig', 'source', 'feature',
+                             'strand', 'frame'])
+_GTF_NUM_FIELDS = frozenset(['start', 'end', 'score'])
+
+
+def _compile_filter(name, value, parser=None):
+    """Compiles a single (name == value) record filter into a check. If
+       value is a collection, records matching any of its values pass.
 
-    if start is not None:
-        mask &= frame[start_col] <= end
+    For gtf records, fields are compared directly on the raw field values.
+    Attributes are first checked for a substring match on the raw attribute
+    string, so that attributes are only parsed for records that survive.
+    """
 
-    if end is not None:
-        mask &= frame[end_col] >= start
+    name = native_str(name)
+
+    if _is_multi_value(value):
+        values = frozenset(value)
+        matches = values.__contains__
+    else:
+        values = (value, )
+        matches = functools.partial(operator.eq, value)
+
+    if isinstance(parser, pysam.asGTF) and name not in _GTF_NUM_FIELDS:
+        if name in _GTF_STR_FIELDS:
+            getter = operator.attrgetter(name)
+
+            def _check_field(record):
+                return matches(getter(record))
+
+            return _check_field
+        else:
+            needles = [native_str(v) for v in values]
+
+            def _check_attribute(record):
+                attr_str = record.attributes
+                return (any(needle in attr_str for needle in needles) and
+                        matches(_parse_gtf_attributes(attr_str).get(name)))
+
+            return _check_attribute
+
+    def _check(record):
+        try:
+            return matches(getattr(record, name))
+        except (AttributeError, KeyError):
+            return False
+
+    return _check
+
+
+def _compile_predicate(filters, parser=None, start=None, end=None,
+                       incl_left=True, incl_right=True):
+    """Compiles record filters and inclusiveness checks into a single
+       predicate, returning None if no records need to be filtered."""
+
+    checks = []
+
+    if filters is not None:
+        checks += [_compile_filter(name, value, parser=parser)
+                   for name, value in filters.items()]
 
-    # Filter for inclusiveness.
     if not incl_left:
-        mask &= frame['start'] > start
+        checks.append(lambda r: r.start > start)
 
     if not incl_right:
-        mask &= frame['end'] < end
+        checks.append(lambda r: r.end < end)
 
-    # Apply any additional filters.
-    if filters is not None:
-        for name, value in filters.items():
-            mask &= frame[name] == value
+    if len(checks) == 0:
+        return None
+    elif len(checks) == 1:
+        return checks[0]
 
-    return frame.ix[mask]
+    def _predicate(record):
+        for check in checks:
+            if not check(record):
+                return False
+        return True
 
+    return _predicate
 
-def bgzip(file_path, out_path=None):
-    if out_path is None:
-        out_path = file_path + '.gz'
 
-    with open(out_path, 'w') as out_file:
-        subprocess.check_call(['bgzip', '-c', str(file_path)], stdout=out_file)
+def _merge_regions(regions, ref_col='contig',
+                   start_col='start', end_col='end'):
+    """Merges overlapping regions into windows, returning a list of
+       (reference, start, end) windows and an array with the positional
+       indices of the regions contained in each window."""
 
-    return out_path
+    if len(regions) == 0:
+        return [], []
+
+    refs = regions[ref_col].astype(str).values
+    starts = regions[start_col].values.astype(np.int64)
+    ends = regions[end_col].values.astype(np.int64)
+
+    order = np.lexsort((starts, refs))
+    refs, starts, ends = refs[order], starts[order], ends[order]
+
+    # Start a new window if the reference changes or if the region
+    # starts beyond the end of all preceding regions in the window.
+    new_ref = np.r_[True, refs[1:] != refs[:-1]]
+
+    ref_groups = np.split(np.arange(len(order)), np.flatnonzero(new_ref)[1:])
+
+    windows, window_queries = [], []
+    for ref_idx in ref_groups:
+        max_ends = np.maximum.accumulate(ends[ref_idx])
+        breaks = np.flatnonzero(starts[ref_idx][1:] > max_ends[:-1]) + 1
+
+        for win_idx in np.split(ref_idx, breaks):
+            windows.append((refs[win_idx[0]], int(starts[win_idx].min()),
+                            int(ends[win_idx].max())))
+            window_queries.append(order[win_idx])
+
+    return windows, window_queries
+
+
+def bgzip(file_path, out_path=None, threads=1):
+    return bgzf.bgzip(str(file_path), out_path=out_path, threads=threads)
 
 
 def tabix(file_path, preset):
-    subprocess.check_call(['tabix', '-p', preset, file_path])
+    pysam.tabix_index(native_str(file_path), preset=native_str(preset),
+                      force=True)
+
+
+def _compress_lines(lines, out_path, preset, threads=1):
+    """Compresses (sorted) lines directly into a bgzipped file,
+       optionally indexing the file using tabix."""
+
+    with bgzf.BgzfWriter(out_path, threads=threads) as writer:
+        writer.writelines(line.encode('utf-8') for line in lines)
+
+    if preset is not None:
+        tabix(out_path, preset=preset)
+
+    return out_path
+
+
+class TabixHandlePool(object):
+    """Bounded pool of open pysam.TabixFile handles.
+
+    Handles are kept per thread and per process, so that a handle is never
+    shared between threads or used after a fork. Idle handles are evicted
+    (least recently used first) once the pool exceeds max_size handles.
+    """
+
+    def __init__(self, max_size=8):
+        self._max_size = max_size
+        self._local = threading.local()
+
+    @property
+    def max_size(self):
+        return self._max_size
+
+    def _idle_handles(self):
+        # Discard any handles inherited from a parent process,
+        # as the underlying file offsets are shared after a fork.
+        pid = os.getpid()
+        if getattr(self._local, 'pid', None) != pid:
+            self._local.pid = pid
+            self._local.handles = collections.OrderedDict()
+        return self._local.handles
+
+    def acquire(self, file_path):
+        """Takes an idle handle for the given file from the pool,
+           opening a new handle if no idle handle is available."""
+
+        file_path = native_str(file_path)
+        handles = self._idle_handles()
+
+        for key in reversed(list(handles.keys())):
+            if key[0] == file_path:
+                return handles.pop(key)
+
+        return pysam.TabixFile(file_path)
+
+    def release(self, file_path, handle):
+        """Returns a handle to the pool, closing the least recently
+           used idle handles if the pool is full."""
+
+        handles = self._idle_handles()
+        handles[(native_str(file_path), id(handle))] = handle
+
+        while len(handles) > self._max_size:
+            _, evicted = handles.popitem(last=False)
+            evicted.close()
+
+    def clear(self, file_path=None):
+        """Closes idle handles (for the given file) in the current thread."""
+
+        handles = self._idle_handles()
+
+        for key in list(handles.keys()):
+            if file_path is None or key[0] == native_str(file_path):
+                handles.pop(key).close()
+
+
+_HANDLE_POOL = TabixHandlePool()
 
 
 class TabixIterator(object):
 
-    def __init__(self, file_path, parser=None):
+    def __init__(self, file_path, parser=None, persistent=False, pool=None):
         self._file_path = file_path
         self._parser = parser
+        self._persistent = persistent
+        self._pool = pool or _HANDLE_POOL
+
+    def open(self):
+        """Switches to long-lived handles, which are taken from the handle
+           pool and reused between fetches to avoid reloading the index."""
+        self._persistent = True
+        return self
+
+    def close(self):
+        """Closes any pooled handles and stops using long-lived handles."""
+        self._persistent = False
+        self._pool.clear(self._file_path)
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+    @contextlib.contextmanager
+    def _open(self):
+        if self._persistent:
+            tb_file = self._pool.acquire(self._file_path)
+            try:
+                yield tb_file
+            finally:
+                self._pool.release(self._file_path, tb_file)
+        else:
+            file_obj = pysam.TabixFile(native_str(self._file_path))
+            with contextlib.closing(file_obj) as tb_file:
+                yield tb_file
 
     def fetch(self, reference=None, start=None, end=None,
               filters=None, incl_left=True, incl_right=True):
-        file_obj = pysam.TabixFile(native_str(self._file_path),
-                                   parser=self._parser)
-
-        with contextlib.closing(file_obj) as tb_file:
+        with self._open() as tb_file:
             if reference is not None:
                 reference = native_str(reference)
 
             records = self._fetch(tb_file, reference=reference,
-                                  start=start, end=end)
-
-            # Filter records on additional filters.
-            if filters is not None:
-                def _filter(records, name, value):
-                    for r in records:
-                        if hasattr(r, name) and getattr(r, name) == value:
-                            yield r
+                                  start=start, end=end, parser=self._parser)
 
-                for name, value in filters.items():
-                    records = _filter(records, name, value)
+            # Filter records on additional filters and inclusiveness.
+            predicate = _compile_predicate(
+                filters, parser=self._parser, start=start, end=end,
+                incl_left=incl_left, incl_right=incl_right)
 
-            # Filter inclusive/exclusive if needed.
-            if not incl_left:
-                records = filter(lambda r: r.start > start, records)
-
-            if not incl_right:
-                records = filter(lambda r: r.end < end, records)
+            if predicate is not None:
+                records = filter(predicate, records)
 
             # Yield records.
             for record in records:
                 yield record
 
+    def fetch_regions(self, regions, filters=None):
+        """Fetches records for multiple (reference, start, end) regions
+           using a single file handle, yielding (index, record) tuples."""
+
+        predicate = _compile_predicate(filters, parser=self._parser)
+
+        with self._open() as tb_file:
+            contigs = set(tb_file.contigs)
+
+            for i, (reference, start, end) in enumerate(regions):
+                reference = native_str(reference)
+
+                # Skip references that are absent from the index.
+                if reference not in contigs:
+                    continue
+
+                records = tb_file.fetch(reference=reference, start=start,
+                                        end=end, parser=self._parser)
+
+                if predicate is not None:
+                    records = filter(predicate, records)
+
+                for record in records:
+                    yield i, record
+
     def _fetch(self, tb_file, reference=None, **kwargs):
         # For some reason pysam does not fetch all records if reference
         # is None under Python 2.7. To fix this, here we simply chain all
@@ -127,11 +600,143 @@ class TabixIterator(object):
             yield record
 
 
+_ASYNC_EXECUTOR = None
+
+
+def _get_async_executor(executor=None):
+    """Returns the given executor, or the shared thread pool used
+       for the coroutine variants of TabixFile methods."""
+
+    global _ASYNC_EXECUTOR
+
+    if asyncio is None:
+        raise ImportError('Coroutine methods require asyncio')
+
+    if executor is not None:
+        return executor
+
+    if _ASYNC_EXECUTOR is None:
+        _ASYNC_EXECUTOR = concurrent.futures.ThreadPoolExecutor(
+            max_workers=min(32, (os.cpu_count() or 1) + 4))
+
+    return _ASYNC_EXECUTOR
+
+
+def _get_region_task(file_cls, file_path, args, kwargs):
+    """Fetches a region as a frame. Used for running
+       TabixFile.aget_region in a process pool."""
+    return file_cls(file_path).get_region(*args, **kwargs)
+
+
+def _get_event_loop():
+    """Returns the running event loop, falling back to the current
+       event loop outside of coroutines (or before python 3.7)."""
+
+    try:
+        return asyncio.get_running_loop()
+    except (AttributeError, RuntimeError):
+        return asyncio.get_event_loop()
+
+
+class _AsyncIterator(object):
+    """Asynchronous iterator over a (blocking) iterable, which advances
+       the iterable in batches of batch_size items on an executor."""
+
+    _EXHAUSTED = object()
+
+    def __init__(self, iterable, executor, batch_size=1):
+        self._iterable = iterable
+        self._iterator = None
+        self._executor = executor
+        self._batch_size = batch_size
+        self._buffer = collections.deque()
+        self._batch = None
+        self._error = None
+        self._exhausted = False
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        future = _get_event_loop().create_future()
+        self._fill(future)
+        return future
+
+    def _fill(self, future):
+        if future.cancelled():
+            return
+
+        if self._buffer:
+            future.set_result(self._buffer.popleft())
+        elif self._error is not None:
+            future.set_exception(self._error)
+        elif self._exhausted:
+            future.set_exception(StopAsyncIteration())
+        elif self._batch is not None:
+            # Wait for the batch that is being read (e.g. for a
+            # cancelled future), rather than reading another one.
+            self._batch.add_done_callback(lambda _: self._fill(future))
+        else:
+            self._batch = asyncio.wrap_future(
+                self._executor.submit(self._next_batch))
+            self._batch.add_done_callback(
+                lambda batch: self._resolve(batch, future))
+
+    def _next_batch(self):
+        if self._iterator is None:
+            self._iterator = iter(self._iterable)
+        return list(itertools.islice(self._iterator, self._batch_size))
+
+    def _resolve(self, batch, future):
+        # Keep the batch (or its error) even if the future was
+        # cancelled, so that its items are passed to the next future.
+        self._batch = None
+
+        if batch.exception() is not None:
+            self._error = batch.exception()
+        else:
+            self._buffer.extend(batch.result())
+
+            if len(batch.result()) < self._batch_size:
+                self._exhausted = True
+
+        self._fill(future)
+
+
 class TabixFile(object):
 
-    def __init__(self, file_path, parser):
+    def __init__(self, file_path, parser, persistent=False,
+                 region_cache=None):
         self._file_path = file_path
-        self._iterator = TabixIterator(file_path, parser=parser)
+        self._iterator = TabixIterator(file_path, parser=parser,
+                                       persistent=persistent)
+
+        if region_cache is True:
+            region_cache = RegionCache()
+        elif region_cache is False:
+            region_cache = None
+
+        self._region_cache = region_cache
+
+    @property
+    def region_cache(self):
+        """In-memory cache of get_region results (None if disabled)."""
+        return self._region_cache
+
+    def open(self):
+        """Keeps (pooled) file handles open between fetches."""
+        self._iterator.open()
+        return self
+
+    def close(self):
+        """Closes any file handles kept open between fetches."""
+        self._iterator.close()
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
 
     def fetch(self, reference=None, start=None, end=None,
               filters=None, incl_left=True, incl_right=True):
@@ -143,22 +748,354 @@ class TabixFile(object):
             yield record
 
     def get_region(self, reference=None, start=None, end=None,
-                   filters=None, incl_left=True, incl_right=True):
+                   filters=None, incl_left=True, incl_right=True,
+                   engine='records', attributes=None, workers=1,
+                   chunk_size=None, cache=None):
+        """Fetches records in the given region as a frame.
+
+        The 'records' engine builds the frame from one series per record,
+        whereas the 'columnar' engine collects the record fields directly
+        into column arrays and builds the frame once, which is considerably
+        faster and more memory efficient for large regions. If given,
+        attributes restricts the extra (non-positional) columns that
+        are parsed into the frame. Both engines include selected
+        attributes that are absent from all records as missing values.
+
+        If workers > 1, the region is fetched in parallel using a pool of
+        worker processes, which each fetch the records of a single contig
+        using the columnar engine. If chunk_size is given (and the region
+        has a start and end), contigs are further split into chunks of
+        chunk_size bases. Chunks are concatenated in contig order.
+
+        If cache is given (either a FrameCache or True for the default
+        cache), the parsed frame is cached on disk and read from the cache
+        for subsequent calls. The full frame is cached, so that different
+        attribute selections can be read from the same cache entry.
+
+        If the file was opened with a region_cache, results are also cached
+        in memory, keyed on the region, filters, inclusiveness, engine and
+        attributes of the query.
+        """
+
+        if self._region_cache is not None:
+            key = self._region_cache.key(
+                self._file_path, reference=reference, start=start, end=end,
+                filters=filters, incl_left=incl_left, incl_right=incl_right,
+                engine=engine, attributes=attributes)
+
+            def _create_region():
+                return self._get_region(
+                    reference, start, end, filters=filters,
+                    incl_left=incl_left, incl_right=incl_right,
+                    engine=engine, attributes=attributes, workers=workers,
+                    chunk_size=chunk_size, cache=cache)
+
+            frame = self._region_cache.get_or_create(key, _create_region)
+            return self._frame_constructor()(frame)
+
+        return self._get_region(
+            reference, start, end, filters=filters, incl_left=incl_left,
+            incl_right=incl_right, engine=engine, attributes=attributes,
+            workers=workers, chunk_size=chunk_size, cache=cache)
+
+    def _get_region(self, reference=None, start=None, end=None,
+                    filters=None, incl_left=True, incl_right=True,
+                    engine='records', attributes=None, workers=1,
+                    chunk_size=None, cache=None):
+        if cache is not None and cache is not False:
+            cache = get_cache(cache)
+
+            key = cache.key(
+                self._file_path, method='get_region',
+                version=_FRAME_VERSION, reference=reference, start=start,
+                end=end, filters=filters, incl_left=incl_left,
+                incl_right=incl_right)
+
+            def _create():
+                return self._get_region(
+                    reference, start, end, filters=filters,
+                    incl_left=incl_left, incl_right=incl_right,
+                    engine=engine, workers=workers, chunk_size=chunk_size)
+
+            frame = cache.get_or_create(
+                key, _create, columns=self._attribute_columns(attributes))
+
+            return self._frame_constructor()(frame)
+
+        if workers > 1:
+            frame = self._get_region_parallel(
+                reference, start, end, filters=filters, incl_left=incl_left,
+                incl_right=incl_right, attributes=attributes,
+                workers=workers, chunk_size=chunk_size)
+        elif engine == 'records':
+            records = self.fetch(reference, start, end, filters=filters,
+                                 incl_left=incl_left, incl_right=incl_right)
+            frame = self._frame_constructor().from_records(records)
+
+            if attributes is not None:
+                frame = self._select_attributes(frame, attributes)
+        elif engine == 'columnar':
+            records = self._iterator.fetch(
+                reference=reference, start=start, end=end, filters=filters,
+                incl_left=incl_left, incl_right=incl_right)
+            frame = self._to_frame(records, attributes=attributes)
+        else:
+            raise ValueError('Unknown engine {!r}'.format(engine))
+
+        return frame
+
+    def iter_chunks(self, reference=None, start=None, end=None,
+                    filters=None, incl_left=True, incl_right=True,
+                    chunksize=100000, attributes=None):
+        """Iterates over records in the given region (or the whole file)
+           in frames of at most chunksize records.
+
+        Only a single chunk of records is held in memory at a time. Frames
+        are built using the columnar engine and are indexed consecutively,
+        so that concatenating the chunks gives the same frame as get_region.
+        """
+
+        if chunksize < 1:
+            raise ValueError('chunksize should be a positive integer')
+
+        records = self._iterator.fetch(
+            reference=reference, start=start, end=end, filters=filters,
+            incl_left=incl_left, incl_right=incl_right)
+
+        offset = 0
+        while True:
+            chunk = list(itertools.islice(records, chunksize))
+
+            if len(chunk) == 0:
+                break
+
+            frame = self._to_frame(chunk, attributes=attributes)
+            frame.index = pd.RangeIndex(offset, offset + len(frame))
+            offset += len(frame)
+
+            yield frame
+
+    def afetch(self, reference=None, start=None, end=None, filters=None,
+               incl_left=True, incl_right=True, batch_size=1000,
+               executor=None):
+        """Asynchronous variant of fetch, returning an async iterator over
+           the records in the given region.
+
+        Records are fetched and parsed in batches of batch_size records on
+        the given thread pool (a shared pool by default), so that the
+        event loop is not blocked while reading the file.
+        """
+
         records = self.fetch(reference, start, end, filters=filters,
                              incl_left=incl_left, incl_right=incl_right)
-        return self._frame_constructor().from_records(records)
+
+        return _AsyncIterator(records, _get_async_executor(executor),
+                              batch_size=batch_size)
+
+    def aget_region(self, reference=None, start=None, end=None,
+                    executor=None, **kwargs):
+        """Coroutine variant of get_region, which fetches the region on the
+           given executor (a shared thread pool by default).
+
+        Keyword arguments are passed to get_region. If executor is a
+        process pool, the region is fetched in a worker process using a
+        new instance of this file (without any region cache).
+        """
+
+        executor = _get_async_executor(executor)
+
+        if isinstance(executor, concurrent.futures.ProcessPoolExecutor):
+            future = executor.submit(
+                _get_region_task, type(self), self._file_path,
+                (reference, start, end), kwargs)
+        else:
+            future = executor.submit(self.get_region, reference,
+                                     start, end, **kwargs)
+
+        return asyncio.wrap_future(future)
+
+    def aiter_chunks(self, reference=None, start=None, end=None,
+                     executor=None, **kwargs):
+        """Asynchronous variant of iter_chunks, returning an async iterator
+           over frames of the records in the given region.
+
+        Chunks are read and parsed on the given thread pool (a shared pool
+        by default). Keyword arguments are passed to iter_chunks.
+        """
+
+        chunks = self.iter_chunks(reference, start, end, **kwargs)
+        return _AsyncIterator(chunks, _get_async_executor(executor))
+
+    def get_regions(self, regions, filters=None, incl_left=True,
+                    incl_right=True, ref_col='contig', start_col='start',
+                    end_col='end', id_col='query_id', attributes=None):
+        """Fetches records for many regions at once.
+
+        Regions are given as a frame with reference, start and end columns.
+        Overlapping regions are merged into windows, which are each fetched
+        only once from the file. The returned frame contains the records
+        of every region (in the order of the regions frame), tagged with
+        the index of the corresponding region in the id_col column.
+        Regions on references that are absent from the file are skipped.
+        """
+
+        windows, window_queries = _merge_regions(
+            regions, ref_col=ref_col, start_col=start_col, end_col=end_col)
+
+        # Fetch records for each window, keeping track of the window
+        # and the (zero-based, half-open) position of each record.
+        records, record_windows, rec_starts, rec_ends = [], [], [], []
+
+        for i, record in self._iterator.fetch_regions(windows, filters):
+            records.append(record)
+            record_windows.append(i)
+            rec_starts.append(record.start)
+            rec_ends.append(record.end)
+
+        record_windows = np.array(record_windows, dtype=np.int64)
+        rec_starts = np.array(rec_starts, dtype=np.int64)
+        rec_ends = np.array(rec_ends, dtype=np.int64)
+
+        # Match records to the overlapping regions of their window, using
+        # a (closed) index over the records that is grouped by window.
+        q_starts = regions[start_col].values.astype(np.int64)
+        q_ends = regions[end_col].values.astype(np.int64)
+
+        q_windows = np.full(len(regions), None, dtype=object)
+        for i, queries in enumerate(window_queries):
+            q_windows[queries] = i
+
+        index = RegionIndex(record_windows, rec_starts, rec_ends - 1)
+        query_idx, rec_idx = index.query_many(q_windows, q_starts,
+                                              q_ends - 1)
+
+        if not incl_left or not incl_right:
+            mask = np.ones(len(rec_idx), dtype=bool)
+
+            if not incl_left:
+                mask &= rec_starts[rec_idx] > q_starts[query_idx]
+
+            if not incl_right:
+                mask &= rec_ends[rec_idx] < q_ends[query_idx]
+
+            query_idx, rec_idx = query_idx[mask], rec_idx[mask]
+
+        # Build frame from the matching records and add query ids.
+        frame = self._to_frame((records[i] for i in rec_idx),
+                               attributes=attributes)
+        frame.insert(0, id_col, regions.index.values[query_idx])
+
+        return frame
+
+    def _get_region_parallel(self, reference, start, end, filters=None,
+                             incl_left=True, incl_right=True,
+                             attributes=None, workers=2, chunk_size=None):
+        chunks = self._split_region(reference, start, end,
+                                    chunk_size=chunk_size)
+
+        tasks = [(type(self), self._file_path, chunk, (start, end), filters,
+                  incl_left, incl_right, attributes) for chunk in chunks]
+
+        pool = multiprocessing.Pool(workers)
+
+        try:
+            frames = pool.map(_fetch_chunk_frame, tasks)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return self._concat_frames(frames)
+
+    def _split_region(self, reference, start, end, chunk_size=None):
+        """Splits a region into (reference, start, end, min_start) chunks,
+           in which min_start is the minimum (zero-based) start position of
+           records that belong to the chunk, so that records overlapping
+           multiple chunks are only included in a single chunk."""
+
+        if reference is None:
+            file_obj = pysam.TabixFile(native_str(self._file_path))
+            with contextlib.closing(file_obj) as tb_file:
+                references = list(tb_file.contigs)
+        else:
+            references = [native_str(reference)]
+
+        if chunk_size is None or start is None or end is None:
+            return [(ref, start, end, None) for ref in references]
+
+        return [(ref, chunk_start, min(chunk_start + chunk_size, end),
+                 None if chunk_start == start else chunk_start)
+                for ref in references
+                for chunk_start in range(start, end, chunk_size)]
+
+    @classmethod
+    def _concat_frames(cls, frames):
+        frames = [frame for frame in frames if len(frame) > 0]
+
+        if len(frames) == 0:
+            return cls._to_frame([])
+
+        return cls._frame_constructor()(pd.concat(frames, ignore_index=True))
+
+    @classmethod
+    def _select_attributes(cls, frame, attributes):
+        return frame
+
+    @classmethod
+    def _attribute_columns(cls, attributes):
+        return None
 
     @classmethod
     def _to_series(cls, record):
         raise NotImplementedError()
 
+    @classmethod
+    def _to_frame(cls, records, attributes=None):
+        raise NotImplementedError()
+
     @classmethod
     def _frame_constructor(cls):
         raise NotImplementedError()
 
 
+def _fetch_chunk_frame(args):
+    """Fetches the records of a single chunk as a frame. Used
+       by worker processes of TabixFile.get_region."""
+
+    (file_cls, file_path, chunk, (start, end), filters,
+     incl_left, incl_right, attributes) = args
+    reference, chunk_start, chunk_end, min_start = chunk
+
+    tabix_file = file_cls(file_path)
+    records = tabix_file._iterator.fetch(
+        reference=reference, start=chunk_start, end=chunk_end,
+        filters=filters)
+
+    # Apply inclusiveness using the bounds of the full region.
+    predicate = _compile_predicate(None, start=start, end=end,
+                                   incl_left=incl_left, incl_right=incl_right)
+
+    if predicate is not None:
+        records = filter(predicate, records)
+
+    # Skip records that belong to a previous chunk.
+    if min_start is not None:
+        records = (r for r in records if r.start >= min_start)
+
+    return tabix_file._to_frame(records, attributes=attributes)
+
+
 class TabixFrame(pd.DataFrame):
 
+    # Columns describing the region of each row.
+    REGION_COLUMNS = ('contig', 'start', 'end')
+
+    # Whether regions are zero-based and half-open (as in bed files),
+    # rather than one-based and closed (as in gtf files).
+    HALF_OPEN = False
+
+    # Cached region index (with its cache key), see region_index.
+    _region_index_cache = None
+
     @property
     def _constructor(self):
         raise NotImplementedError()
@@ -167,11 +1104,401 @@ class TabixFrame(pd.DataFrame):
               filters=None, incl_left=True, incl_right=True):
         raise NotImplementedError()
 
+    def _region_columns(self, ref_col=None, start_col=None, end_col=None):
+        default_ref, default_start, default_end = self.REGION_COLUMNS
+        return (ref_col or default_ref, start_col or default_start,
+                end_col or default_end)
+
+    def region_index(self, ref_col=None, start_col=None, end_col=None):
+        """Returns a RegionIndex over the rows of the frame.
+
+        The index is built lazily and cached on the frame. The cache is
+        invalidated if the index or any of the region columns of the
+        frame are replaced. As the cache holds on to the indexed columns,
+        in-place edits of these columns trigger a copy-on-write under
+        pandas copy-on-write semantics, which also invalidates the cache.
+        For older versions of pandas, use invalidate_region_index after
+        editing region columns in-place.
+        """
+
+        columns = self._region_columns(ref_col, start_col, end_col)
+        series = [self[col] for col in columns]
+
+        key = (columns, len(self), id(self.index),
+               tuple(_array_token(s.values) for s in series))
+
+        cache = self._region_index_cache
+        if cache is None or cache[0] != key:
+            index = RegionIndex(*(s.values for s in series))
+            self._region_index_cache = (key, index, series)
+
+        return self._region_index_cache[1]
+
+    def invalidate_region_index(self):
+        """Drops any cached region index."""
+        self._region_index_cache = None
+
+    def __setitem__(self, key, value):
+        self.invalidate_region_index()
+        super().__setitem__(key, value)
+
     def get_region(self, reference=None, start=None, end=None,
-                   filters=None, incl_left=True, incl_right=True, **kwargs):
-        return _get_region(
-            self, reference, start, end, filters=filters,
-            incl_left=incl_left, incl_right=incl_right, **kwargs)
+                   filters=None, incl_left=True, incl_right=True,
+                   ref_col=None, start_col=None, end_col=None):
+        """Selects rows overlapping the given (closed) region.
+
+        Candidate rows are selected using the cached region index,
+        avoiding a scan of the whole frame for every query. If the frame
+        is sorted by contig and start, candidates are selected as a
+        positional slice of the frame, which avoids copying the rows if
+        all candidates match. Filter values can be single values or
+        collections of values (matching any of the values).
+        """
+
+        ref_col, start_col, end_col = self._region_columns(
+            ref_col, start_col, end_col)
+
+        if reference is None:
+            return _get_region(
+                self, reference, start, end, filters=filters,
+                incl_left=incl_left, incl_right=incl_right, ref_col=ref_col,
+                start_col=start_col, end_col=end_col)
+
+        index = self.region_index(ref_col, start_col, end_col)
+
+        if index.is_sorted:
+            lower, upper = index.span(reference, start, end)
+            frame = self.iloc[lower:upper]
+
+            mask = _region_mask(
+                frame, start=start, end=end, filters=filters,
+                incl_left=incl_left, incl_right=incl_right,
+                start_col=start_col, end_col=end_col)
+        else:
+            frame = self.iloc[index.query(reference, start, end)]
+
+            mask = _filter_region(
+                frame, start, end, filters=filters, incl_left=incl_left,
+                incl_right=incl_right, start_col=start_col, end_col=end_col)
+
+        if not mask.all():
+            frame = frame.iloc[np.flatnonzero(mask)]
+
+        return frame
+
+    def get_regions(self, regions, filters=None, incl_left=True,
+                    incl_right=True, id_col='query_id', ref_col=None,
+                    start_col=None, end_col=None):
+        """Selects rows overlapping each of the given regions.
+
+        Regions are given as a frame with the same region columns as
+        this frame. Rows are returned in the order of the regions frame,
+        tagged with the index of the corresponding region in id_col.
+        """
+
+        ref_col, start_col, end_col = self._region_columns(
+            ref_col, start_col, end_col)
+
+        q_starts = regions[start_col].values
+        q_ends = regions[end_col].values
+
+        index = self.region_index(ref_col, start_col, end_col)
+        query_idx, positions = index.query_many(
+            regions[ref_col].values, q_starts, q_ends)
+
+        frame = self.iloc[positions]
+
+        mask = _filter_region(
+            frame, q_starts[query_idx], q_ends[query_idx], filters=filters,
+            incl_left=incl_left, incl_right=incl_right,
+            start_col=start_col, end_col=end_col)
+
+        frame = frame.iloc[np.flatnonzero(mask)]
+        frame.insert(0, id_col, regions.index.values[query_idx[mask]])
+
+        return frame
+
+    def overlap(self, other, how='inner', min_overlap=1, strand=None,
+                suffixes=('', '_other'), overlap_col='overlap'):
+        """Joins rows of this frame with the overlapping rows of other.
+
+        Rows overlapping by at least min_overlap bases are joined (taking
+        the coordinate system of each frame into account), with the number
+        of overlapping bases in overlap_col. If strand is 'same' or
+        'opposite', only rows on the same or opposite strands are joined.
+        For how='left', rows without any overlap are kept with missing
+        values for the columns of other. Rows are ordered by the rows of
+        this frame and then by the rows of other. Overlapping column
+        names are suffixed using the given suffixes.
+        """
+
+        if how not in {'inner', 'left'}:
+            raise ValueError('Unknown join type {!r}'.format(how))
+
+        if strand not in {None, 'same', 'opposite'}:
+            raise ValueError('Unknown strand mode {!r}'.format(strand))
+
+        other_type = other if isinstance(other, TabixFrame) else self
+        ref_col, start_col, end_col = self._region_columns()
+        o_ref_col, o_start_col, o_end_col = other_type._region_columns()
+
+        # Convert positions to zero-based, half-open intervals.
+        q_starts, q_ends = self._half_open_positions(start_col, end_col)
+        t_starts, t_ends = other_type._half_open_positions(
+            o_start_col, o_end_col, frame=other)
+
+        # Select candidates using the (closed) region index of other,
+        # widening queries so that candidates include touching intervals.
+        if isinstance(other, TabixFrame):
+            index = other.region_index(o_ref_col, o_start_col, o_end_col)
+        else:
+            index = RegionIndex.from_frame(other, o_ref_col,
+                                           o_start_col, o_end_col)
+
+        offset = 0 if other_type.HALF_OPEN else 1
+        query_idx, target_idx = index.query_many(
+            self[ref_col].values, q_starts + offset - 1, q_ends + offset)
+
+        overlap = (np.minimum(q_ends[query_idx], t_ends[target_idx]) -
+                   np.maximum(q_starts[query_idx], t_starts[target_idx]))
+        mask = overlap >= min_overlap
+
+        if strand is not None:
+            q_strands = _strand_values(self['strand'])[query_idx]
+            t_strands = _strand_values(other['strand'])[target_idx]
+
+            if strand == 'same':
+                mask &= q_strands == t_strands
+            else:
+                mask &= (((q_strands == '+') & (t_strands == '-')) |
+                         ((q_strands == '-') & (t_strands == '+')))
+
+        query_idx, target_idx = query_idx[mask], target_idx[mask]
+        overlap = overlap[mask]
+
+        if how == 'left':
+            # Add rows without overlap, pointing to a missing target row.
+            unmatched = np.setdiff1d(np.arange(len(self)), query_idx)
+
+            query_idx = np.concatenate([query_idx, unmatched])
+            target_idx = np.concatenate(
+                [target_idx, np.full(len(unmatched), -1, dtype=np.int64)])
+            overlap = np.concatenate(
+                [overlap, np.zeros(len(unmatched), dtype=overlap.dtype)])
+
+            order = np.argsort(query_idx, kind='stable')
+            query_idx, target_idx = query_idx[order], target_idx[order]
+            overlap = overlap[order]
+
+        frame = self._join_rows(other, query_idx, target_idx, suffixes)
+        frame[overlap_col] = overlap
+
+        return self._constructor(frame)
+
+    def merge_regions(self, distance=0, strand=False):
+        """Merges overlapping rows into single regions, as in bedtools merge.
+
+        Rows that overlap, or that are at most distance bases apart, are
+        merged. If strand is True, only rows on the same strand are merged.
+        Returns a frame with the region columns (and strand) of the merged
+        regions, ordered by contig and start.
+        """
+
+        ref_col, start_col, end_col = self._region_columns()
+        starts, ends = self._half_open_positions(start_col, end_col)
+
+        groups = self[ref_col].values
+        if strand:
+            groups = self.groupby([ref_col, 'strand'], sort=False,
+                                  dropna=False).ngroup().values
+
+        rows, starts, ends, _ = intervals_.merge_intervals(
+            groups, starts, ends, distance=distance)
+
+        columns = [ref_col, 'strand'] if strand else [ref_col]
+        frame = pd.DataFrame(self[columns]).iloc[rows].reset_index(drop=True)
+
+        return self._region_frame(frame, starts, ends)
+
+    def complement_regions(self, sizes):
+        """Returns the regions of the genome not covered by any row, as in
+           bedtools complement.
+
+        Contig sizes are given as a mapping of contig to size or as the path
+        of a tab-separated sizes file (such as a fasta index), listing contig
+        names and sizes in the first two columns. Regions are ordered by the
+        order of the contigs in sizes.
+        """
+
+        if not hasattr(sizes, 'items'):
+            sizes = _read_sizes(sizes)
+
+        ref_col, start_col, end_col = self._region_columns()
+
+        merged = self.merge_regions()
+        m_starts, m_ends = merged._half_open_positions(start_col, end_col)
+        m_contigs = merged[ref_col].values
+
+        contigs, starts, ends = [], [], []
+        for contig, size in sizes.items():
+            mask = m_contigs == contig
+            gap_starts, gap_ends = intervals_.complement_intervals(
+                m_starts[mask], m_ends[mask], size)
+
+            contigs.append(np.repeat(contig, len(gap_starts)))
+            starts.append(gap_starts)
+            ends.append(gap_ends)
+
+        frame = pd.DataFrame({ref_col: np.concatenate(contigs or [[]])})
+        return self._region_frame(
+            frame, np.concatenate(starts or [[]]).astype(np.int64),
+            np.concatenate(ends or [[]]).astype(np.int64))
+
+    def subtract_regions(self, other):
+        """Removes the parts of rows overlapped by rows of other, as in
+           bedtools subtract.
+
+        Rows that are partially overlapped are trimmed or split into
+        several rows, keeping the other columns of the row. Rows that are
+        fully overlapped are dropped. Rows are ordered as in this frame.
+        """
+
+        ref_col, start_col, end_col = self._region_columns()
+        starts, ends = self._half_open_positions(start_col, end_col)
+
+        other_type = other if isinstance(other, TabixFrame) else self
+        o_ref_col, o_start_col, o_end_col = other_type._region_columns()
+        t_starts, t_ends = other_type._half_open_positions(
+            o_start_col, o_end_col, frame=other)
+
+        rows, starts, ends = intervals_.subtract_intervals(
+            self[ref_col].values, starts, ends,
+            other[o_ref_col].values, t_starts, t_ends)
+
+        frame = pd.DataFrame(self).iloc[rows].reset_index(drop=True)
+        return self._region_frame(frame, starts, ends)
+
+    def nearest(self, other, suffixes=('', '_other'),
+                distance_col='distance'):
+        """Joins each row with the nearest row of other, as in bedtools
+           closest.
+
+        The distance between the rows is given in distance_col, which is 0
+        for overlapping rows and 1 for adjacent rows. Ties are resolved in
+        favour of the first row of other. Rows without any row of other
+        on the same contig are kept with missing values for the columns
+        of other.
+        """
+
+        ref_col, start_col, end_col = self._region_columns()
+        starts, ends = self._half_open_positions(start_col, end_col)
+
+        other_type = other if isinstance(other, TabixFrame) else self
+        o_ref_col, o_start_col, o_end_col = other_type._region_columns()
+        t_starts, t_ends = other_type._half_open_positions(
+            o_start_col, o_end_col, frame=other)
+
+        target_idx, distances = intervals_.nearest_intervals(
+            self[ref_col].values, starts, ends,
+            other[o_ref_col].values, t_starts, t_ends)
+
+        frame = self._join_rows(other, np.arange(len(self)),
+                                target_idx, suffixes)
+        frame[distance_col] = np.where(target_idx >= 0, distances, np.nan)
+
+        return self._constructor(frame)
+
+    def count_overlaps(self, other, window=0, count_col='count'):
+        """Counts the rows of other overlapping each row, as in bedtools
+           window -c (or bedtools intersect -c for a window of 0).
+
+        Rows are extended by window bases on both sides before counting.
+        Returns a copy of the frame with the counts in count_col.
+        """
+
+        ref_col, start_col, end_col = self._region_columns()
+        starts, ends = self._half_open_positions(start_col, end_col)
+        starts, ends = starts - window, ends + window
+
+        other_type = other if isinstance(other, TabixFrame) else self
+        o_ref_col, o_start_col, o_end_col = other_type._region_columns()
+        t_starts, t_ends = other_type._half_open_positions(
+            o_start_col, o_end_col, frame=other)
+
+        # Find overlaps using a closed index over the half-open intervals
+        # of other, by shrinking the queries to closed intervals.
+        index = RegionIndex(other[o_ref_col].values, t_starts, t_ends)
+        query_idx, _ = index.query_many(
+            self[ref_col].values, starts + 1, ends - 1)
+
+        frame = self.copy()
+        frame[count_col] = np.bincount(query_idx, minlength=len(self))
+
+        return frame
+
+    def _join_rows(self, other, query_idx, target_idx, suffixes):
+        """Joins rows of this frame with rows of other (or missing values
+           for a target index of -1), suffixing overlapping column names."""
+
+        shared = set(self.columns) & set(other.columns)
+
+        left = pd.DataFrame(self).iloc[query_idx].reset_index(drop=True)
+        left.columns = [c + suffixes[0] if c in shared else c
+                        for c in left.columns]
+
+        right = (pd.DataFrame(other).reset_index(drop=True)
+                 .reindex(target_idx).reset_index(drop=True))
+        right.columns = [c + suffixes[1] if c in shared else c
+                         for c in right.columns]
+
+        return pd.concat([left, right], axis=1)
+
+    def _region_frame(self, frame, starts, ends):
+        """Sets the region columns of frame from half-open positions,
+           returning a frame of the same type as this frame."""
+
+        _, start_col, end_col = self._region_columns()
+
+        frame = frame.copy()
+        frame[start_col] = starts if self.HALF_OPEN else starts + 1
+        frame[end_col] = ends
+
+        # Keep the column order of this frame.
+        columns = [c for c in self.columns if c in frame.columns]
+        columns += [c for c in frame.columns if c not in columns]
+
+        return self._constructor(frame[columns])
+
+    def _half_open_positions(self, start_col, end_col, frame=None):
+        frame = self if frame is None else frame
+
+        starts = frame[start_col].values.astype(np.int64)
+        ends = frame[end_col].values.astype(np.int64)
+
+        if not self.HALF_OPEN:
+            starts = starts - 1
+
+        return starts, ends
+
+
+def _read_sizes(file_path):
+    """Reads contig sizes from a tab-separated file, such as a fasta
+       index (.fai) or a bedtools genome file."""
+
+    sizes = pd.read_csv(file_path, sep='\t', header=None, usecols=[0, 1],
+                        dtype={0: str, 1: np.int64}, comment='#')
+    return collections.OrderedDict(zip(sizes[0], sizes[1]))
+
+
+def _strand_values(strands):
+    """Returns strands as an array of '+', '-' and '.' values,
+       converting strands stored as int8 codes if needed."""
+
+    if pd.api.types.is_integer_dtype(strands.dtype):
+        codes = strands.values
+        return np.where(codes > 0, '+', np.where(codes < 0, '-', '.'))
+
+    return np.asarray(strands.astype(object).fillna('.'), dtype=object)
 
 
 class GtfFile(TabixFile):
@@ -181,7 +1508,7 @@ class GtfFile(TabixFile):
     FIELDS = ('contig', 'source', 'feature', 'start',
               'end', 'score', 'strand', 'frame', 'attribute')
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, persistent=False, region_cache=None):
         file_path = str(file_path)
         if not file_path.endswith('.gz'):
             if os.path.exists(file_path + '.gz'):
@@ -189,66 +1516,221 @@ class GtfFile(TabixFile):
             else:
                 file_path = self.compress(file_path)
 
-        super().__init__(file_path, parser=pysam.asGTF())
+        super().__init__(file_path, parser=pysam.asGTF(),
+                         persistent=persistent, region_cache=region_cache)
+        self._gene_index = None
 
     @classmethod
     def _to_series(cls, record):
         rec_values = tuple((cls.TYPE_MAP.get(i, lambda x: x)(val)
                             for i, val in enumerate(record)))
-        attr_keys, attr_values = zip(*dict(record).items())
+
+        # Records are either pysam proxies or tuples of raw fields.
+        if isinstance(record, tuple):
+            attrs = _parse_gtf_attributes(record[-1])
+        else:
+            attrs = dict(record)
+
+        attr_keys, attr_values = zip(*attrs.items())
         return pd.Series(rec_values[:-1] + attr_values,
                          index=cls.FIELDS[:-1] + attr_keys)
 
+    @classmethod
+    def _to_frame(cls, records, attributes=None):
+        # Transpose records into field columns.
+        rows = [tuple(r) for r in records]
+
+        if len(rows) == 0:
+            frame = GtfFrame.from_records([])
+            if attributes is not None:
+                frame = cls._select_attributes(frame, attributes)
+            return frame
+
+        columns = list(zip(*rows))
+
+        # Build typed arrays for the fixed gtf fields.
+        data = {name: list(values) for name, values
+                in zip(cls.FIELDS[:-1], columns[:-1])}
+        data['start'] = _parse_int_array(data['start'])
+        data['end'] = _parse_int_array(data['end'])
+        data['score'] = _parse_float_array(data['score'])
+
+        # Parse (selected) attributes into separate columns.
+        data.update(_parse_gtf_attribute_column(
+            columns[-1], attributes=attributes))
+
+        return GtfFrame._format_frame(GtfFrame(data))
+
+    @classmethod
+    def _concat_frames(cls, frames):
+        frame = super()._concat_frames(frames)
+        return GtfFrame._format_frame(frame)
+
+    @classmethod
+    def _select_attributes(cls, frame, attributes):
+        # Add attributes that are absent from all records as missing
+        # values, as for frames built by _to_frame.
+        missing = [a for a in attributes if a not in frame.columns]
+        if missing:
+            frame = frame.assign(**{
+                a: np.full(len(frame), np.nan, dtype=object)
+                for a in missing})
+
+        return _reorder_columns(
+            frame[list(cls.FIELDS[:-1]) + list(attributes)],
+            cls.FIELDS[:-1])
+
+    @classmethod
+    def _attribute_columns(cls, attributes):
+        if attributes is None:
+            return None
+        return list(cls.FIELDS[:-1]) + list(attributes)
+
     @classmethod
     def _frame_constructor(cls):
         return GtfFrame
 
+    @property
+    def gene_index(self):
+        """Sidecar gene index of the file, or None if no index exists.
+
+        The index is loaded lazily and rebuilt if the file has changed.
+        """
+
+        if self._gene_index is None or \
+                self._gene_index.is_stale(self._file_path):
+            index_path = GtfGeneIndex.index_path(self._file_path)
+            if not os.path.exists(index_path):
+                return None
+            self._gene_index = GtfGeneIndex.open(self._file_path)
+
+        return self._gene_index
+
+    def build_gene_index(self):
+        """Builds the sidecar gene index, used by get_gene(s)."""
+        self._gene_index = GtfGeneIndex.build(self._file_path)
+        return self._gene_index
+
     def get_gene(self, gene_id, feature_type='gene',
-                 field_name='gene_id', **kwargs):
-        # Add feature filter to filters (if given).
-        filters = kwargs.pop('filter', {})
-        filters['feature'] = feature_type
+                 field_name='gene_id', use_index=True, **kwargs):
+        """Fetches the record of a gene as a series.
+
+        The gene is looked up using the gene index if available (and
+        use_index is True), otherwise the file is scanned for the gene.
+        Any further keyword arguments are passed to fetch, which also
+        bypasses the gene index.
+        """
+
+        index = self.gene_index if use_index else None
+
+        if index is not None and field_name in index.KEYS and not kwargs:
+            # Seek to gene record using the gene index.
+            records = self._fetch_indexed(
+                index, [gene_id], feature_type=feature_type,
+                field_name=field_name)
+        else:
+            # Add feature and gene filters to filters (if given).
+            filters = dict(kwargs.pop('filter', {}))
+            filters['feature'] = feature_type
+            filters[field_name] = gene_id
+
+            # Search for gene record.
+            records = self._iterator.fetch(filters=filters, **kwargs)
 
-        # Search for gene record.
-        records = self._iterator.fetch(filters=filters, **kwargs)
         for record in records:
-            if record[native_str(field_name)] == gene_id:
-                return self._to_series(record)
+            return self._to_series(record)
 
         raise ValueError('Gene {} does not exist'.format(gene_id))
 
+    def get_genes(self, gene_ids, feature_type='gene', field_name='gene_id',
+                  use_index=True):
+        """Fetches records of multiple genes as a frame.
+
+        Genes are looked up using the gene index if available (and
+        use_index is True), otherwise the file is scanned once for all
+        genes. Missing genes are skipped.
+        """
+
+        index = self.gene_index if use_index else None
+
+        if index is not None and field_name in index.KEYS:
+            records = self._fetch_indexed(
+                index, gene_ids, feature_type=feature_type,
+                field_name=field_name)
+        else:
+            gene_ids = set(gene_ids)
+            records = (
+                r for r in self._iterator.fetch(
+                    filters={'feature': feature_type})
+                if _parse_gtf_attributes(
+                    r.attributes, keys={field_name}).get(field_name)
+                in gene_ids)
+
+        return self._to_frame(records)
+
+    def _fetch_indexed(self, index, gene_ids, feature_type='gene',
+                       field_name='gene_id'):
+        # Look up entries, reading them in file order.
+        entries = sorted(((entry, gene_id) for gene_id in set(gene_ids)
+                          for entry in index.lookup(gene_id, field_name)),
+                         key=lambda e: e[0][3])
+
+        with BGZFile(native_str(self._file_path), 'rb') as file_:
+            for (contig, _, end, offset), gene_id in entries:
+                file_.seek(offset)
+
+                # Scan from the first record of the gene until we pass
+                # the end of the gene, yielding any matching records.
+                for line in iter(file_.readline, b''):
+                    fields = tuple(line.decode('utf-8')
+                                   .rstrip('\n').split('\t'))
+
+                    if fields[0] != contig or int(fields[3]) > end:
+                        break
+
+                    if fields[2] == feature_type and _parse_gtf_attributes(
+                            fields[8]).get(field_name) == gene_id:
+                        yield fields
+
     @classmethod
-    def compress(cls, file_path, out_path=None, sort=True, create_index=True):
+    def compress(cls, file_path, out_path=None, sort=True, create_index=True,
+                 create_gene_index=False, threads=1):
         """Compresses and indexes a gtf file using bgzip and tabix."""
 
         # Base output path on original file name.
         out_path = out_path or file_path + '.gz'
 
         if sort:
-            # Sort file before compressing and indexing.
-            file_path = cls.sort(file_path, out_path=out_path + '.tmp')
-
-        # Gzip and index file.
-        gzipped_path = bgzip(file_path, out_path=out_path)
+            # Stream sorted lines directly into the compressed file.
+            with open(file_path, 'r') as file_:
+                gzipped_path = _compress_lines(
+                    cls._sort_lines(file_), out_path,
+                    preset='gff' if create_index else None, threads=threads)
+        else:
+            gzipped_path = bgzip(file_path, out_path=out_path,
+                                 threads=threads)
 
-        if create_index:
-            tabix(gzipped_path, preset='gff')
+            if create_index:
+                tabix(gzipped_path, preset='gff')
 
-        # Clean up temp file.
-        if file_path.endswith('.tmp'):
-            os.unlink(file_path)
+        if create_gene_index:
+            GtfGeneIndex.build(gzipped_path)
 
         return gzipped_path
 
     @classmethod
     def sort(cls, file_path, out_path):
         """Sorts a gtf file by position, as required for tabix."""
-        with open(out_path, 'w') as out_file:
-            cmd = '(grep ^"#" {0}; grep -v ^"#" {0} ''| sort -k1,1 -k4,4n)'
-            subprocess.check_call(cmd.format(file_path),
-                                  stdout=out_file, shell=True)
+        with open(file_path, 'r') as in_file, open(out_path, 'w') as out_file:
+            out_file.writelines(cls._sort_lines(in_file))
         return out_path
 
+    @classmethod
+    def _sort_lines(cls, lines, buffer_size=256 * 1024 ** 2):
+        # Comments first, followed by records sorted on contig and start.
+        return sort_.sort_file(lines, key=sort_.gtf_key,
+                               buffer_size=buffer_size)
+
     def __repr__(self):
         return '<GtfFile file_path={!r}>'.format(self._file_path)
 
@@ -260,9 +1742,72 @@ class GtfFrame(TabixFrame):
         return GtfFrame
 
     @classmethod
-    def read_csv(cls, path, *args, **kwargs):
-        frame = pd.read_csv(path, *args, sep='\t', comment='#', **kwargs)
-        return cls._format_frame(frame)
+    def read_csv(cls, path, **kwargs):
+        """Reads a gtf file into a frame, parsing attributes into separate
+           columns (as for frames fetched using GtfFile).
+
+        If attributes is given, only the given attributes are parsed into
+        columns. If chunksize is given, an iterator is returned that yields
+        frames of (at most) chunksize records. If compact is True, frames
+        are returned in a compact memory layout (see compact). Any further
+        keyword arguments are passed to pandas.read_csv.
+
+        If cache is given (either a FrameCache or True for the default
+        cache), the parsed frame is cached on disk and read from the
+        cache for subsequent reads of the same (unchanged) file.
+        """
+
+        attributes = kwargs.pop('attributes', None)
+        chunksize = kwargs.pop('chunksize', None)
+        compact = kwargs.pop('compact', False)
+        cache = kwargs.pop('cache', None)
+
+        if cache is not None and cache is not False:
+            if chunksize is not None:
+                raise ValueError('Caching is not supported for chunked reads')
+
+            cache = get_cache(cache)
+
+            key = cache.key(path, method='read_csv', version=_FRAME_VERSION,
+                            attributes=attributes, compact=compact,
+                            kwargs=kwargs)
+
+            frame = cache.get_or_create(
+                key, lambda: cls.read_csv(path, attributes=attributes,
+                                          compact=compact, **kwargs))
+
+            return cls(frame)
+
+        reader = pd.read_csv(
+            path, sep='\t', comment='#', header=None,
+            names=GtfFile.FIELDS, dtype=cls._CSV_DTYPES,
+            na_values={'score': ['.']}, keep_default_na=False,
+            chunksize=chunksize, **kwargs)
+
+        if chunksize is not None:
+            return (cls._parse_attributes(chunk, attributes=attributes,
+                                          compact=compact)
+                    for chunk in reader)
+
+        return cls._parse_attributes(reader, attributes=attributes,
+                                     compact=compact)
+
+    _CSV_DTYPES = {'contig': str, 'source': str, 'feature': str,
+                   'start': np.int64, 'end': np.int64, 'score': float,
+                   'strand': str, 'frame': str, 'attribute': str}
+
+    @classmethod
+    def _parse_attributes(cls, frame, attributes=None, compact=False):
+        data = {name: frame[name].values for name in GtfFile.FIELDS[:-1]}
+        data.update(_parse_gtf_attribute_column(
+            frame['attribute'].values, attributes=attributes))
+
+        frame = cls._format_frame(cls(data, index=frame.index))
+
+        if compact:
+            frame = frame.compact()
+
+        return frame
 
     @classmethod
     def from_records(cls, data, *args, **kwargs):
@@ -288,9 +1833,64 @@ class GtfFrame(TabixFrame):
 
         return frame
 
+    _STRAND_CODES = {'+': 1, '-': -1, '.': 0}
+
+    def compact(self, max_cardinality=0.5, strand='category',
+                return_report=False):
+        """Returns a copy of the frame using a compact memory layout.
+
+        Start and end positions are downcast to int32 (or uint32 if needed),
+        strands are stored as a categorical or as int8 codes (strand='int8',
+        with 1 for '+', -1 for '-' and 0 for unknown strands) and attribute
+        columns are categorised if their ratio of unique to non-missing
+        values is at most max_cardinality. If return_report is True, a
+        frame with the memory usage (in bytes) of each column before and
+        after compacting is returned as well.
+        """
+
+        frame = self.copy()
+
+        for col in ('start', 'end'):
+            frame[col] = _downcast_positions(frame[col].values)
+
+        if strand == 'category':
+            frame['strand'] = frame['strand'].astype('category')
+        elif strand == 'int8':
+            frame['strand'] = (frame['strand'].map(self._STRAND_CODES)
+                               .fillna(0).astype(np.int8))
+        else:
+            raise ValueError('Unknown strand layout {!r}'.format(strand))
+
+        fields = set(GtfFile.FIELDS)
+        for col in frame.columns:
+            values = frame[col]
+
+            if (col in fields or
+                    isinstance(values.dtype, pd.CategoricalDtype) or
+                    not (pd.api.types.is_object_dtype(values.dtype) or
+                         pd.api.types.is_string_dtype(values.dtype))):
+                continue
+
+            n_values = values.count()
+            if n_values > 0 and (values.nunique() / n_values <=
+                                 max_cardinality):
+                frame[col] = values.astype('category')
+
+        if return_report:
+            before = self.memory_usage(index=False, deep=True)
+            after = frame.memory_usage(index=False, deep=True)
+
+            report = pd.DataFrame({'before': before, 'after': after},
+                                  columns=['before', 'after'])
+            report['saved'] = report['before'] - report['after']
+
+            return frame, report
+
+        return frame
+
     def get_gene(self, gene_id):
-        result = self.ix[((self['feature'] == 'gene') &
-                         (self['gene_id'] == gene_id))]
+        result = self.loc[((self['feature'] == 'gene') &
+                          (self['gene_id'] == gene_id))]
 
         if len(result) == 0:
             raise ValueError('Gene {} does not exist'.format(gene_id))
@@ -301,11 +1901,14 @@ class GtfFrame(TabixFrame):
 class BedFile(TabixFile):
     TYPE_MAP = {1: int, 2: int, 4: _parse_float}
 
+    # Header lines, which are not included in compressed files.
+    HEADER_PREFIXES = ('track', 'browser')
+
     FIELDS = ('chrom', 'chromStart', 'chromEnd', 'name',
               'score', 'strand', 'thickStart', 'thickEnd',
               'itemRgb', 'blockCount', 'blockSizes', 'blockStarts')
 
-    def __init__(self, file_path):
+    def __init__(self, file_path, persistent=False, region_cache=None):
         file_path = str(file_path)
         if not file_path.endswith('.gz'):
             if os.path.exists(file_path + '.gz'):
@@ -313,7 +1916,8 @@ class BedFile(TabixFile):
             else:
                 file_path = self.compress(file_path)
 
-        super().__init__(file_path, parser=pysam.asBed())
+        super().__init__(file_path, parser=pysam.asBed(),
+                         persistent=persistent, region_cache=region_cache)
 
     @classmethod
     def _to_series(cls, record):
@@ -321,49 +1925,110 @@ class BedFile(TabixFile):
                         for i, val in enumerate(record)))
         return pd.Series(values, index=cls.FIELDS[:len(values)])
 
+    @classmethod
+    def _to_frame(cls, records, attributes=None):
+        # Transpose records into field columns, padding
+        # records that have fewer fields than others.
+        rows = [tuple(r) for r in records]
+
+        if len(rows) == 0:
+            return BedFrame.from_records([])
+
+        columns = list(zip_longest(*rows))
+        fields = cls.FIELDS[:len(columns)]
+
+        # Build typed arrays for numeric fields.
+        data = {}
+        for i, (name, values) in enumerate(zip(fields, columns)):
+            if cls.TYPE_MAP.get(i) is int:
+                data[name] = _parse_int_array(values)
+            elif cls.TYPE_MAP.get(i) is _parse_float:
+                data[name] = _parse_float_array(values)
+            else:
+                data[name] = list(values)
+
+        return BedFrame(data, columns=fields)
+
     @classmethod
     def _frame_constructor(cls):
         return BedFrame
 
     @classmethod
-    def compress(cls, file_path, out_path=None, sort=True, create_index=True):
-        """Compresses and indexes a bed file using bgzip and tabix."""
+    def compress(cls, file_path, out_path=None, sort=True, create_index=True,
+                 threads=1, buffer_size=256 * 1024 ** 2, tmp_dir=None,
+                 contig_order=None, processes=1):
+        """Compresses and indexes a bed file using bgzip and tabix.
+
+        Sorting is done using an external merge sort, which spills sorted
+        runs to disk (in tmp_dir) once the buffered lines exceed roughly
+        buffer_size bytes of memory. Runs are merged directly into the
+        compressed output, so large files never need to fit in memory.
+        See sort for the sorting options.
+        """
 
         # Base output path on original file name.
         out_path = out_path or file_path + '.gz'
 
-        if sort:
-            # Read and sort bed file.
-            frame = BedFrame.read(file_path)
-            frame.sort_values(inplace=True)
+        with open(file_path, 'r') as file_:
+            if sort:
+                lines = cls._sort_lines(
+                    file_, contig_order=contig_order, processes=processes,
+                    buffer_size=buffer_size, tmp_dir=tmp_dir)
+            else:
+                lines = cls._drop_header(file_)
 
-            file_path = out_path + '.tmp'
-            frame.write(file_path)
+            return _compress_lines(
+                lines, out_path, preset='bed' if create_index else None,
+                threads=threads)
 
-        # Gzip and index file.
-        gzipped_path = bgzip(file_path, out_path=out_path)
+    @classmethod
+    def sort(cls, file_path, out_path, contig_order=None, processes=1,
+             buffer_size=256 * 1024 ** 2, tmp_dir=None):
+        """Sorts a bed file by position, as required for tabix.
+
+        Records are sorted on chrom, chromStart and chromEnd. Chromosomes
+        are sorted lexicographically by default, but can also be sorted
+        naturally (contig_order='natural') or in the order of a given list
+        of chromosomes (see sort.read_contig_order for reading this order
+        from a reference .fai file). If processes > 1, chromosomes are
+        sorted in parallel (using all cores if processes is None).
+        """
+
+        with open(file_path, 'r') as in_file, open(out_path, 'w') as out_file:
+            out_file.writelines(cls._sort_lines(
+                in_file, contig_order=contig_order, processes=processes,
+                buffer_size=buffer_size, tmp_dir=tmp_dir))
 
-        if create_index:
-            tabix(gzipped_path, preset='bed')
+        return out_path
 
-        # Clean up temp file.
-        if file_path.endswith('.tmp'):
-            os.unlink(file_path)
+    @classmethod
+    def _sort_lines(cls, lines, contig_order=None, processes=1,
+                    buffer_size=256 * 1024 ** 2, tmp_dir=None):
+        lines = cls._drop_header(lines)
 
-        return gzipped_path
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        if processes > 1:
+            return sort_.sort_bed_parallel(
+                lines, processes=processes, contig_order=contig_order,
+                buffer_size=buffer_size, tmp_dir=tmp_dir)
+
+        return sort_.sort_bed(lines, contig_order=contig_order,
+                              buffer_size=buffer_size, tmp_dir=tmp_dir)
 
     @classmethod
-    def sort(cls, file_path, out_path):
-        """Sorts a gtf file by position, as required for tabix."""
-        with open(out_path, 'w') as out_file:
-            cmd = '(grep ^"#" {0}; grep -v ^"#" {0} ''| sort -k1,1 -k4,4n)'
-            subprocess.check_call(cmd.format(file_path),
-                                  stdout=out_file, shell=True)
-        return out_path
+    def _drop_header(cls, lines):
+        return (line for line in lines
+                if not line.startswith(cls.HEADER_PREFIXES))
 
 
 class BedFrame(TabixFrame):
 
+    REGION_COLUMNS = ('chrom', 'chromStart', 'chromEnd')
+
+    HALF_OPEN = True
+
     COL_NAMES = ('chrom', 'chromStart', 'chromEnd', 'name', 'score', 'strand',
                  'thickStart', 'thickEnd', 'itemRgb', 'blockCount',
                  'blockSizes', 'blockStarts')
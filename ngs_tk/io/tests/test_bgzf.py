@@ -0,0 +1,56 @@
+import gzip
+
+import pysam
+import pytest
+
+from ngs_tk.io import bgzf
+
+
+@pytest.fixture
+def text_path(tmpdir):
+    lines = ['1\t{}\t{}\tfeature_{}\n'.format(i, i + 10, i)
+             for i in range(50000)]
+
+    text_path = str(tmpdir.join('test.bed'))
+    with open(text_path, 'w') as file_:
+        file_.writelines(lines)
+
+    return text_path
+
+
+class TestBgzip(object):
+
+    @pytest.mark.parametrize('threads', [1, 3])
+    def test_roundtrip(self, text_path, threads):
+        """Tests if compressed files decompress to the original data."""
+
+        out_path = bgzf.bgzip(text_path, threads=threads)
+
+        with gzip.open(out_path, 'rb') as file_:
+            result = file_.read()
+
+        with open(text_path, 'rb') as file_:
+            assert result == file_.read()
+
+    def test_tabix(self, text_path):
+        """Tests if compressed files can be indexed and fetched by tabix."""
+
+        out_path = bgzf.bgzip(text_path, threads=2)
+        pysam.tabix_index(out_path, preset='bed', force=True)
+
+        tb_file = pysam.TabixFile(out_path)
+        records = list(tb_file.fetch('1', 1000, 1100))
+
+        assert len(records) == 109
+
+    def test_incompressible_block(self, tmpdir):
+        """Tests if incompressible data is stored in valid blocks."""
+
+        data = bytes(bytearray(range(256))) * 1000
+
+        out_path = str(tmpdir.join('random.gz'))
+        with bgzf.BgzfWriter(out_path) as writer:
+            writer.write(data)
+
+        with gzip.open(out_path, 'rb') as file_:
+            assert file_.read() == data
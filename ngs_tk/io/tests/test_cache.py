@@ -0,0 +1,102 @@
+import os
+import pkg_resources
+import shutil
+import time
+
+import pandas as pd
+import pytest
+
+from ngs_tk.io import tabix
+
+pytest.importorskip('pyarrow')
+
+from ngs_tk.io.cache import FrameCache  # noqa: E402
+
+
+@pytest.fixture
+def gtf_path(tmpdir):
+    rel_path = os.path.join('tests', 'data', 'mm10.test.gtf.gz')
+    src_path = pkg_resources.resource_filename(tabix.__name__, rel_path)
+
+    gtf_path = str(tmpdir.join('mm10.test.gtf.gz'))
+    shutil.copy(src_path, gtf_path)
+    shutil.copy(src_path + '.tbi', gtf_path + '.tbi')
+
+    return gtf_path
+
+
+@pytest.fixture
+def cache(tmpdir):
+    return FrameCache(str(tmpdir.join('cache')))
+
+
+class TestFrameCache(object):
+
+    def test_roundtrip(self, cache, gtf_path):
+        """Tests caching of frames, including categorical columns."""
+
+        frame = pd.DataFrame({'contig': pd.Categorical(['1', '2', '1']),
+                              'start': [10, 20, 30]})
+
+        key = cache.key(gtf_path, option=1)
+        assert cache.get(key) is None
+
+        cache.put(key, frame)
+        cached = cache.get(key)
+
+        assert cached['contig'].dtype.name == 'category'
+        pd.testing.assert_frame_equal(cached, frame)
+
+        assert list(cache.get(key, columns=['start']).columns) == ['start']
+
+    def test_key(self, cache, gtf_path):
+        """Tests that keys change with the options and source file."""
+
+        key = cache.key(gtf_path, option=1)
+        assert cache.key(gtf_path, option=2) != key
+
+        os.utime(gtf_path, (time.time() + 10, time.time() + 10))
+        assert cache.key(gtf_path, option=1) != key
+
+    def test_evict(self, tmpdir, gtf_path):
+        """Tests eviction of least recently used entries by size."""
+
+        frame = pd.DataFrame({'value': range(1000)})
+
+        cache = FrameCache(str(tmpdir.join('cache')))
+        cache.put('a', frame)
+        entry_size = cache.size()
+
+        cache = FrameCache(cache.cache_dir, max_size=entry_size * 2)
+        os.utime(os.path.join(cache.cache_dir, 'a.feather'), (0, 0))
+        cache.put('b', frame)
+        cache.put('c', frame)
+
+        assert 'a' not in cache
+        assert 'b' in cache and 'c' in cache
+
+        # Entries older than the max age are evicted.
+        cache = FrameCache(cache.cache_dir, max_age=60)
+        os.utime(os.path.join(cache.cache_dir, 'b.feather'), (0, 0))
+        cache.evict()
+
+        assert 'b' not in cache and 'c' in cache
+
+    def test_get_region(self, cache, gtf_path):
+        """Tests caching of parsed regions."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        result = gtf.get_region('1', 182409172, 182462432, cache=cache)
+        assert len(cache.entries()) == 1
+
+        cached = gtf.get_region('1', 182409172, 182462432, cache=cache)
+        assert isinstance(cached, tabix.GtfFrame)
+        assert cached['contig'].dtype.name == 'category'
+        pd.testing.assert_frame_equal(cached, result)
+
+        selected = gtf.get_region('1', 182409172, 182462432, cache=cache,
+                                  attributes=['gene_id'])
+        assert list(selected.columns) == \
+            list(tabix.GtfFile.FIELDS[:-1]) + ['gene_id']
+        assert len(cache.entries()) == 1
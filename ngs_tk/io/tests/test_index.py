@@ -0,0 +1,106 @@
+import os
+import pkg_resources
+import shutil
+
+import pytest
+
+from ngs_tk.io import tabix
+from ngs_tk.io.index import GtfGeneIndex
+
+
+@pytest.fixture
+def gtf_path(tmpdir):
+    rel_path = os.path.join('tests', 'data', 'mm10.test.gtf.gz')
+    src_path = pkg_resources.resource_filename(tabix.__name__, rel_path)
+
+    # Copy gtf to temp dir to avoid writing indices into the package.
+    gtf_path = str(tmpdir.join('mm10.test.gtf.gz'))
+    shutil.copy(src_path, gtf_path)
+    shutil.copy(src_path + '.tbi', gtf_path + '.tbi')
+
+    return gtf_path
+
+
+class TestGtfGeneIndex(object):
+
+    def test_lookup(self, gtf_path):
+        """Tests lookup of genes and transcripts in the index."""
+
+        index = GtfGeneIndex.build(gtf_path)
+
+        entries = index.lookup('ENSMUSG00000026510')
+        assert len(entries) == 1
+        assert entries[0][:3] == ('1', 182409172, 182462432)
+
+        assert len(index.lookup('Trp53bp2', field_name='gene_name')) == 1
+        assert len(index.lookup('ENSMUST00000035295',
+                                field_name='transcript_id')) == 1
+        assert index.lookup('ENSMUSG00000000000') == []
+
+    def test_open_rebuilds_stale(self, gtf_path):
+        """Tests if opening a stale index rebuilds the index."""
+
+        index = GtfGeneIndex.build(gtf_path)
+
+        stat = os.stat(gtf_path)
+        os.utime(gtf_path, (stat.st_atime, stat.st_mtime + 10))
+
+        assert index.is_stale(gtf_path)
+        assert not GtfGeneIndex.open(gtf_path).is_stale(gtf_path)
+
+    def test_get_gene(self, gtf_path):
+        """Tests if indexed gene retrieval matches a full scan."""
+
+        gtf = tabix.GtfFile(gtf_path)
+        expected = gtf.get_gene('ENSMUSG00000026510')
+
+        gtf.build_gene_index()
+        result = gtf.get_gene('ENSMUSG00000026510')
+
+        assert result.sort_index().equals(expected.sort_index())
+
+        with pytest.raises(ValueError):
+            gtf.get_gene('ENSMUSG00000000000')
+
+    def test_get_genes(self, gtf_path):
+        """Tests retrieval of multiple genes with and without index."""
+
+        gene_ids = ['ENSMUSG00000026510', 'ENSMUSG00000017146',
+                    'ENSMUSG00000000000']
+
+        gtf = tabix.GtfFile(gtf_path)
+        expected = gtf.get_genes(gene_ids)
+
+        gtf.build_gene_index()
+        result = gtf.get_genes(gene_ids)
+
+        assert len(result) == 2
+        assert set(result['gene_id']) == set(gene_ids[:2])
+        assert result.equals(expected)
+
+    def test_get_genes_shared_name(self, tmpdir):
+        """Tests if names shared across contigs are found on each contig."""
+
+        attrs = 'gene_id "{}"; gene_name "DUP"; gene_biotype "protein_coding";'
+        lines = ['1\ttest\tgene\t100\t200\t.\t+\t.\t' + attrs.format('G1'),
+                 '1\ttest\tgene\t5000\t6000\t.\t+\t.\t' + attrs.format('G2')
+                 .replace('DUP', 'OTHER'),
+                 '2\ttest\tgene\t300\t400\t.\t-\t.\t' + attrs.format('G3')]
+
+        txt_path = str(tmpdir.join('shared.gtf'))
+        with open(txt_path, 'w') as file_:
+            file_.write('\n'.join(lines) + '\n')
+
+        gtf = tabix.GtfFile(tabix.GtfFile.compress(
+            txt_path, create_gene_index=True))
+
+        expected = gtf.get_genes(['DUP'], field_name='gene_name',
+                                 use_index=False)
+        result = gtf.get_genes(['DUP'], field_name='gene_name')
+
+        assert list(result['gene_id']) == ['G1', 'G3']
+        assert result.equals(expected)
+
+        entries = gtf.gene_index.lookup('DUP', field_name='gene_name')
+        assert [entry[:3] for entry in entries] == \
+            [('1', 100, 200), ('2', 300, 400)]
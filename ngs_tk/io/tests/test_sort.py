@@ -0,0 +1,133 @@
+import random
+
+from ngs_tk.io import sort
+
+
+def _gtf_lines(n=2000, seed=0):
+    rng = random.Random(seed)
+    return ['{}\tsrc\texon\t{}\t{}\t.\t+\t.\tgene_id "g{}";\n'.format(
+        rng.choice(['1', '2', '11']), start, start + 10, i)
+        for i, start in enumerate(rng.randint(1, 10 ** 6)
+                                  for _ in range(n))]
+
+
+class TestSortLines(object):
+
+    def test_in_memory(self):
+        """Tests sorting of lines that fit in memory."""
+
+        lines = _gtf_lines()
+        result = list(sort.sort_lines(lines, key=sort.gtf_key))
+
+        assert result == sorted(lines, key=sort.gtf_key)
+
+    def test_external(self, tmpdir):
+        """Tests sorting of lines that are spilled to disk in runs."""
+
+        lines = _gtf_lines()
+        result = list(sort.sort_lines(lines, key=sort.gtf_key,
+                                      buffer_size=50000,
+                                      tmp_dir=str(tmpdir)))
+
+        assert result == sorted(lines, key=sort.gtf_key)
+
+        # Check if runs have been cleaned up.
+        assert tmpdir.listdir() == []
+
+
+class TestSortFile(object):
+
+    def test_comments(self):
+        """Tests if comment lines are moved before sorted lines."""
+
+        lines = _gtf_lines(n=100)
+        lines.insert(50, '#comment')
+
+        result = list(sort.sort_file(lines, key=sort.gtf_key,
+                                     buffer_size=1000))
+
+        assert result[0] == '#comment\n'
+        assert result[1:] == sorted(lines[:50] + lines[51:],
+                                    key=sort.gtf_key)
+
+
+def _bed_lines(n=2000, seed=0):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        start = rng.randint(0, 10 ** 6)
+        lines.append('{}\t{}\t{}\tpeak_{}\n'.format(
+            rng.choice(['chr1', 'chr2', 'chr10', 'chrX']),
+            start, start + rng.randint(1, 100), i))
+    return lines
+
+
+def _bed_contig(line):
+    return line.split('\t')[0]
+
+
+def _bed_position(line):
+    fields = line.split('\t')
+    return int(fields[1]), int(fields[2])
+
+
+def _bed_key(line):
+    return (_bed_contig(line),) + _bed_position(line)
+
+
+class TestSortBed(object):
+
+    def test_lexicographic(self):
+        """Tests sorting of bed lines on chrom, start and end."""
+
+        lines = _bed_lines()
+        result = list(sort.sort_bed(lines))
+
+        assert result == sorted(lines, key=_bed_key)
+
+    def test_natural(self):
+        """Tests natural ordering of chromosomes."""
+
+        result = list(sort.sort_bed(_bed_lines(), contig_order='natural'))
+
+        contigs = [_bed_contig(line) for line in result]
+        assert _unique(contigs) == ['chr1', 'chr2', 'chr10', 'chrX']
+
+    def test_reference(self):
+        """Tests ordering of chromosomes following a reference."""
+
+        result = list(sort.sort_bed(
+            _bed_lines(), contig_order=['chrX', 'chr2']))
+
+        contigs = [_bed_contig(line) for line in result]
+        assert _unique(contigs) == ['chrX', 'chr2', 'chr1', 'chr10']
+
+    def test_parallel(self, tmpdir):
+        """Tests if parallel sorting matches sequential sorting."""
+
+        lines = _bed_lines()
+
+        expected = list(sort.sort_bed(lines, contig_order='natural'))
+        result = list(sort.sort_bed_parallel(
+            lines, processes=2, contig_order='natural',
+            buffer_size=50000, tmp_dir=str(tmpdir)))
+
+        assert result == expected
+        assert tmpdir.listdir() == []
+
+    def test_partition_contigs(self, tmpdir):
+        """Tests partitioning with fewer open files than contigs."""
+
+        lines = _bed_lines()
+        paths = sort._partition_contigs(lines, str(tmpdir), max_open=2)
+
+        assert len(paths) == 4
+
+        for contig, path in paths.items():
+            with open(path, 'r') as file_:
+                assert file_.readlines() == [
+                    line for line in lines if _bed_contig(line) == contig]
+
+
+def _unique(values):
+    return [v for i, v in enumerate(values) if i == 0 or values[i - 1] != v]
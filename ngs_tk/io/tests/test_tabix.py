@@ -1,7 +1,9 @@
+import gzip
 import os
 import pkg_resources
 
 import numpy as np
+import pandas as pd
 import pysam
 import pytest
 
@@ -20,6 +22,17 @@ def gtf_iterator(gtf_path):
     return tabix.TabixIterator(gtf_path, parser=pysam.asGTF())
 
 
+@pytest.fixture
+def event_loop():
+    asyncio = pytest.importorskip('asyncio')
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
+
+
 class TestTabixIterator(object):
 
     def test_fetch(self, gtf_iterator):
@@ -61,6 +74,30 @@ class TestTabixIterator(object):
         assert len(records) > 0
         assert all(r.strand == '+' for r in records)
 
+    def test_fetch_filter_attribute(self, gtf_iterator):
+        records = list(gtf_iterator.fetch(
+            filters={'feature': 'exon', 'transcript_id': 'ENSMUST00000035295'}))
+
+        # Test if all records are exons from the given transcript.
+        assert len(records) > 0
+        assert all(r.feature == 'exon' for r in records)
+        assert all(r.transcript_id == 'ENSMUST00000035295' for r in records)
+
+    def test_fetch_filter_attribute_prefix(self, gtf_iterator):
+        records = list(gtf_iterator.fetch(
+            filters={'gene_id': 'ENSMUSG0000002651'}))
+
+        # Test if partial attribute values do not match.
+        assert len(records) == 0
+
+    def test_fetch_filter_multiple(self, gtf_iterator):
+        records = list(gtf_iterator.fetch(
+            filters={'feature': ['exon', 'CDS'],
+                     'transcript_id': ('ENSMUST00000035295', )}))
+
+        assert {r.feature for r in records} == {'exon', 'CDS'}
+        assert all(r.transcript_id == 'ENSMUST00000035295' for r in records)
+
     def test_fetch_incl_left_true(self, gtf_iterator):
         records = list(gtf_iterator.fetch(
             '1', 182409431, 182464436, incl_left=True))
@@ -134,6 +171,18 @@ class TestGtfFile(object):
 
         assert gene['gene_name'] == 'Trp53bp2'
 
+    def test_get_gene_scan(self, gtf_path):
+        """Tests if lookups without the gene index match indexed lookups."""
+
+        gtf = tabix.GtfFile(gtf_path)
+        expected = gtf.get_gene('ENSMUSG00000026510')
+
+        result = gtf.get_gene('ENSMUSG00000026510', use_index=False)
+        assert result.equals(expected)
+
+        genes = gtf.get_genes(['ENSMUSG00000026510'], use_index=False)
+        assert list(genes['gene_id']) == ['ENSMUSG00000026510']
+
     def test_get_gene_missing(self, gtf_path):
         """Tests if retrieval of a missing gene raises a ValueError."""
 
@@ -141,3 +190,824 @@ class TestGtfFile(object):
 
         with pytest.raises(ValueError):
             gtf.get_gene('ENSMUSG00000000000')
+
+    def test_compress(self, gtf_path, tmpdir):
+        """Tests sorting, compressing and indexing of a gtf file."""
+
+        with gzip.open(gtf_path, 'rt') as file_:
+            lines = [line for line in file_ if not line.startswith('#')]
+
+        # Write lines in reverse order, so the file needs to be sorted.
+        txt_path = str(tmpdir.join('test.gtf'))
+        with open(txt_path, 'w') as file_:
+            file_.writelines(reversed(lines))
+
+        gtf = tabix.GtfFile(tabix.GtfFile.compress(txt_path, threads=2))
+        result = gtf.get_region('1')
+
+        expected = tabix.GtfFile(gtf_path).get_region('1')
+
+        # Records with equal start positions may be ordered differently.
+        assert list(result['start']) == list(expected['start'])
+        assert (sorted(zip(result['start'], result['feature'])) ==
+                sorted(zip(expected['start'], expected['feature'])))
+
+    def test_get_region_columnar(self, gtf_path):
+        """Tests if the columnar engine matches the records engine."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        expected = gtf.get_region('1', 182409431, 182461830)
+        result = gtf.get_region('1', 182409431, 182461830, engine='columnar')
+
+        assert list(result.columns) == list(expected.columns)
+        assert result.equals(expected)
+
+    def test_get_region_columnar_attributes(self, gtf_path):
+        """Tests if the columnar engine only parses selected attributes."""
+
+        gtf = tabix.GtfFile(gtf_path)
+        frame = gtf.get_region('1', engine='columnar',
+                               attributes=['gene_id', 'exon_number'])
+
+        assert list(frame.columns) == (list(tabix.GtfFile.FIELDS[:-1]) +
+                                       ['exon_number', 'gene_id'])
+        assert frame['start'].dtype == np.int64
+
+    @pytest.mark.parametrize('region', [('1', 182409431, 182461830),
+                                        ('1', 0, 100)])
+    def test_get_region_engines_attributes(self, gtf_path, region):
+        """Tests if both engines return the same selected attributes,
+           including attributes that are absent from all records."""
+
+        gtf = tabix.GtfFile(gtf_path)
+        attributes = ['gene_id', 'missing', 'exon_number']
+
+        expected = gtf.get_region(*region, attributes=attributes)
+        result = gtf.get_region(*region, engine='columnar',
+                                attributes=attributes)
+
+        assert 'missing' in result.columns
+        pd.testing.assert_frame_equal(result, expected)
+
+    def test_get_region_workers(self, gtf_path):
+        """Tests if parallel fetches match sequential fetches."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        expected = gtf.get_region(engine='columnar')
+        result = gtf.get_region(workers=2)
+
+        assert result.equals(expected)
+
+    def test_get_region_workers_chunked(self, gtf_path):
+        """Tests if chunked parallel fetches include records only once."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        expected = gtf.get_region('1', 182409431, 182565007,
+                                  engine='columnar', incl_right=False)
+        result = gtf.get_region('1', 182409431, 182565007, workers=2,
+                                chunk_size=10000, incl_right=False)
+
+        assert len(result) > 0
+        assert result.equals(expected)
+
+    def test_get_regions(self, gtf_path):
+        """Tests if bulk region queries match per-region queries."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        regions = pd.DataFrame(
+            {'contig': ['1', '11', '1', 'X'],
+             'start': [182409431, 0, 182409000, 0],
+             'end': [182461830, 10 ** 9, 182410000, 100]},
+            index=['a', 'b', 'c', 'd'])
+
+        result = gtf.get_regions(regions, incl_left=False)
+
+        for query_id, region in regions.iloc[:3].iterrows():
+            expected = gtf.get_region(region.contig, region.start,
+                                      region.end, incl_left=False)
+            subset = result.loc[result['query_id'] == query_id]
+
+            assert len(subset) == len(expected) > 0
+            assert list(subset['start']) == list(expected['start'])
+            assert list(subset['end']) == list(expected['end'])
+
+        # Check if regions are returned in query order.
+        assert list(result['query_id'].unique()) == ['a', 'b', 'c']
+
+    def test_get_regions_chained(self, gtf_path):
+        """Tests bulk queries for many chained, overlapping regions."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        starts = np.arange(182409000, 182462000, 1000)
+        regions = pd.DataFrame({'contig': '1', 'start': starts,
+                                'end': starts + 1500})
+
+        result = gtf.get_regions(regions, incl_right=False)
+
+        for query_id, region in regions.iterrows():
+            expected = gtf.get_region(region.contig, region.start,
+                                      region.end, incl_right=False)
+            subset = result.loc[result['query_id'] == query_id]
+            assert list(subset['start']) == list(expected['start'])
+
+    def test_get_regions_empty(self, gtf_path):
+        """Tests bulk region queries without any regions."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        regions = pd.DataFrame({'contig': [], 'start': [], 'end': []})
+        result = gtf.get_regions(regions)
+
+        assert len(result) == 0
+        assert 'query_id' in result.columns
+
+    def test_iter_chunks(self, gtf_path):
+        """Tests iterating over records in fixed-size chunks."""
+
+        gtf = tabix.GtfFile(gtf_path)
+        chunks = list(gtf.iter_chunks(chunksize=100))
+
+        assert all(isinstance(chunk, tabix.GtfFrame) for chunk in chunks)
+        assert [len(chunk) for chunk in chunks[:-1]] == \
+            [100] * (len(chunks) - 1)
+
+        # Categories differ between chunks, so compare values only.
+        expected = gtf.get_region(engine='columnar')
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks)[expected.columns], expected,
+            check_dtype=False, check_categorical=False)
+
+    def test_iter_chunks_region(self, gtf_path):
+        """Tests iterating over the records of a region in chunks."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        chunks = list(gtf.iter_chunks('1', 182409172, 182462432,
+                                      chunksize=5, attributes=['gene_id']))
+        expected = gtf.get_region('1', 182409172, 182462432,
+                                  engine='columnar', attributes=['gene_id'])
+
+        assert len(chunks) == -(-len(expected) // 5)
+        pd.testing.assert_frame_equal(
+            pd.concat(chunks), expected,
+            check_dtype=False, check_categorical=False)
+
+    def test_region_cache(self, gtf_path):
+        """Tests caching of region results in memory."""
+
+        gtf = tabix.GtfFile(gtf_path, region_cache=True)
+
+        first = gtf.get_region('1', 182409172, 182462432)
+        first['start'] = 0
+
+        second = gtf.get_region('1', 182409172, 182462432)
+        assert (second['start'] > 0).all()
+
+        gtf.get_region('1', 182409172, 182462432, incl_left=False)
+
+        stats = gtf.region_cache.stats()
+        assert (stats.hits, stats.misses, stats.entries) == (1, 2, 2)
+        assert stats.size > 0
+
+    def test_region_cache_eviction(self, gtf_path):
+        """Tests eviction of least recently used region results."""
+
+        region = ('1', 182409172, 182462432)
+        size = tabix.GtfFile(gtf_path).get_region(*region) \
+            .memory_usage(index=True, deep=True).sum()
+
+        cache = tabix.RegionCache(max_size=int(size * 1.2))
+        gtf = tabix.GtfFile(gtf_path, region_cache=cache)
+
+        gtf.get_region(*region)
+        gtf.get_region(*region, incl_right=False)
+        gtf.get_region(*region)
+
+        stats = cache.stats()
+        assert (stats.hits, stats.misses, stats.evictions) == (0, 3, 2)
+        assert stats.size <= cache.max_size
+
+    def test_region_cache_invalidation(self, gtf_path, tmpdir):
+        """Tests invalidation of region results if the file changes."""
+
+        copy_path = str(tmpdir.join('test.gtf.gz'))
+        for suffix in ('', '.tbi'):
+            with open(gtf_path + suffix, 'rb') as src, \
+                    open(copy_path + suffix, 'wb') as dest:
+                dest.write(src.read())
+
+        gtf = tabix.GtfFile(copy_path, region_cache=True)
+        gtf.get_region('1', 182409172, 182462432)
+
+        for suffix in ('', '.tbi'):
+            stat = os.stat(copy_path + suffix)
+            os.utime(copy_path + suffix, (stat.st_atime, stat.st_mtime + 10))
+
+        gtf.get_region('1', 182409172, 182462432)
+        assert gtf.region_cache.stats().misses == 2
+
+    def test_aget_region(self, gtf_path, event_loop):
+        """Tests fetching regions concurrently from an event loop."""
+
+        asyncio = pytest.importorskip('asyncio')
+
+        gtf = tabix.GtfFile(gtf_path)
+        regions = [('1', 182409172, 182462432), ('11', None, None)]
+
+        frames = event_loop.run_until_complete(asyncio.gather(
+            *(gtf.aget_region(*region, engine='columnar')
+              for region in regions)))
+
+        for frame, region in zip(frames, regions):
+            expected = gtf.get_region(*region, engine='columnar')
+            assert frame.equals(expected)
+
+    def test_aget_region_processes(self, gtf_path, event_loop):
+        """Tests fetching regions using a process pool."""
+
+        futures = pytest.importorskip('concurrent.futures')
+
+        gtf = tabix.GtfFile(gtf_path)
+        executor = futures.ProcessPoolExecutor(1)
+
+        try:
+            frame = event_loop.run_until_complete(gtf.aget_region(
+                '1', 182409172, 182462432, executor=executor))
+        finally:
+            executor.shutdown()
+
+        assert frame.equals(gtf.get_region('1', 182409172, 182462432))
+
+    def test_aiter_chunks(self, gtf_path, event_loop):
+        """Tests asynchronous iteration over record chunks and records."""
+
+        gtf = tabix.GtfFile(gtf_path)
+
+        chunks = _collect_async(
+            event_loop, gtf.aiter_chunks('1', 182409172, 182462432,
+                                         chunksize=5))
+        records = _collect_async(
+            event_loop, gtf.afetch('1', 182409172, 182462432, batch_size=4))
+
+        expected = gtf.get_region('1', 182409172, 182462432,
+                                  engine='columnar')
+
+        assert len(chunks) == -(-len(expected) // 5)
+        assert sum(len(chunk) for chunk in chunks) == len(expected)
+        assert [r['start'] for r in records] == list(expected['start'])
+
+    def test_afetch_cancelled(self, gtf_path, event_loop):
+        """Tests if records of a cancelled fetch are not lost."""
+
+        asyncio = pytest.importorskip('asyncio')
+
+        gtf = tabix.GtfFile(gtf_path)
+        expected = gtf.get_region('1', 182409172, 182462432,
+                                  engine='columnar')
+
+        records = gtf.afetch('1', 182409172, 182462432, batch_size=4)
+
+        # Cancel the first fetch while its batch is being read.
+        with pytest.raises(asyncio.TimeoutError):
+            event_loop.run_until_complete(
+                asyncio.wait_for(records.__anext__(), timeout=0))
+
+        records = _collect_async(event_loop, records)
+        assert [r['start'] for r in records] == list(expected['start'])
+
+
+def _collect_async(loop, async_iter):
+    items = []
+    while True:
+        try:
+            items.append(loop.run_until_complete(async_iter.__anext__()))
+        except StopAsyncIteration:
+            return items
+
+
+@pytest.fixture
+def gtf_frame(gtf_path):
+    return tabix.GtfFile(gtf_path).get_region(engine='columnar')
+
+
+def _get_region_mask(frame, reference, start, end):
+    mask = ((frame['contig'] == reference) &
+            (frame['start'] <= end) & (frame['end'] >= start))
+    return frame.loc[mask]
+
+
+class TestGtfFrame(object):
+
+    def test_get_region(self, gtf_frame):
+        """Tests if indexed region queries match a full scan."""
+
+        for start, end in [(182409431, 182461830), (182409172, 182409172),
+                           (0, 10 ** 10), (10 ** 10, 10 ** 10 + 1)]:
+            result = gtf_frame.get_region('1', start, end)
+            expected = _get_region_mask(gtf_frame, '1', start, end)
+            assert result.index.equals(expected.index)
+
+        assert len(gtf_frame.get_region('X', 0, 10 ** 10)) == 0
+
+    def test_get_region_incl(self, gtf_frame):
+        """Tests inclusiveness of indexed region queries."""
+
+        result = gtf_frame.get_region('1', 182409431, 182461830,
+                                      incl_left=False, incl_right=False)
+
+        assert len(result) > 0
+        assert result['start'].min() > 182409431
+        assert result['end'].max() < 182461830
+
+    def test_get_region_unsorted(self, gtf_frame):
+        """Tests if queries on sorted frames use views, and
+           match queries on unsorted frames."""
+
+        region = ('1', 182409431, 182461830)
+        shuffled = gtf_frame.sample(frac=1, random_state=0)
+
+        assert gtf_frame.region_index().is_sorted
+        assert not shuffled.region_index().is_sorted
+
+        result = gtf_frame.get_region(*region)
+        expected = shuffled.get_region(*region)
+
+        assert result.index.equals(expected.sort_index().index)
+
+        # Selecting a full contig should not copy any rows.
+        result = gtf_frame.get_region('1')
+        assert np.shares_memory(result['start'].values,
+                                gtf_frame['start'].values)
+
+    def test_get_region_span(self):
+        """Tests if a long row doesn't widen the span of sorted queries."""
+
+        starts = np.arange(0, 10 ** 6, 100)
+        frame = tabix.GtfFrame({'contig': '1', 'start': starts,
+                                'end': starts + 10})
+        frame.loc[0, 'end'] = 5 * 10 ** 5
+
+        index = frame.region_index()
+        assert index.span('1', 8 * 10 ** 5, 8 * 10 ** 5 + 150) == (8000, 8002)
+        assert index.span('1', 1000, 1005) == (0, 11)
+
+    def test_get_region_filters(self, gtf_frame):
+        """Tests single and multi-value filters in region queries."""
+
+        result = gtf_frame.get_region(
+            '1', 182409431, 182461830,
+            filters={'feature': ['exon', 'CDS'], 'strand': '+'})
+
+        expected = _get_region_mask(gtf_frame, '1', 182409431, 182461830)
+        expected = expected.loc[expected['feature'].isin(['exon', 'CDS']) &
+                                (expected['strand'] == '+')]
+
+        assert len(result) > 0
+        assert result.index.equals(expected.index)
+
+        # Queries without reference scan all contigs.
+        result = gtf_frame.get_region(filters={'feature': ['gene']})
+        assert result.index.equals(
+            gtf_frame.index[gtf_frame['feature'] == 'gene'])
+
+    def test_get_region_numexpr(self, gtf_frame, monkeypatch):
+        """Tests building region masks using numexpr."""
+
+        pytest.importorskip('numexpr')
+        monkeypatch.setattr(tabix, '_NUMEXPR_MIN_ROWS', 0)
+
+        region = ('1', 182409431, 182461830)
+        result = gtf_frame.get_region(*region, incl_left=False)
+
+        monkeypatch.setattr(tabix, 'ne', None)
+        expected = gtf_frame.get_region(*region, incl_left=False)
+
+        assert result.index.equals(expected.index)
+
+    def test_get_region_cache(self, gtf_frame):
+        """Tests if the region index is cached and invalidated."""
+
+        index = gtf_frame.region_index()
+        assert gtf_frame.region_index() is index
+
+        # Replacing a region column should invalidate the index.
+        gtf_frame['end'] = gtf_frame['end'] + 10 ** 9
+        assert gtf_frame.region_index() is not index
+
+        result = gtf_frame.get_region('1', 10 ** 9 + 182409431,
+                                      10 ** 9 + 182409431)
+        assert len(result) > 0
+
+    def test_get_regions(self, gtf_frame):
+        """Tests if bulk region queries match per-region queries."""
+
+        regions = pd.DataFrame(
+            {'contig': ['11', '1', 'X', '1'],
+             'start': [0, 182409431, 0, 182409172],
+             'end': [10 ** 10, 182461830, 100, 182409172]},
+            index=['a', 'b', 'c', 'd'])
+
+        result = gtf_frame.get_regions(regions, incl_left=False)
+
+        for query_id, region in regions.iterrows():
+            expected = gtf_frame.get_region(
+                region.contig, region.start, region.end, incl_left=False)
+            subset = result.loc[result['query_id'] == query_id]
+            assert subset.index.equals(expected.index)
+
+    def test_overlap(self, gtf_frame):
+        """Tests overlap joins between bed and gtf frames."""
+
+        peaks = tabix.BedFrame(
+            {'chrom': ['1', '1', 'X'],
+             'chromStart': [182409430, 182409171, 0],
+             'chromEnd': [182409431, 182409172, 100],
+             'strand': ['+', '-', '+']})
+
+        result = peaks.overlap(gtf_frame)
+
+        for _, peak in peaks.iterrows():
+            # Bed peaks cover the single (one-based) position chromEnd.
+            expected = _get_region_mask(
+                gtf_frame, peak.chrom, peak.chromEnd, peak.chromEnd)
+            subset = result.loc[result['chromStart'] == peak.chromStart]
+            assert len(subset) == len(expected)
+            assert (subset['start'].values == expected['start'].values).all()
+
+        assert isinstance(result, tabix.BedFrame)
+        assert (result['overlap'] == 1).all()
+        assert 'strand_other' in result.columns
+
+        same = peaks.overlap(gtf_frame, strand='same')
+        assert (same['strand'] == same['strand_other']).all()
+
+        left = peaks.overlap(gtf_frame, how='left')
+        assert len(left) == len(result) + 1
+        assert left['contig'].isnull().sum() == 1
+
+    def test_read_csv(self, gtf_path, gtf_frame):
+        """Tests reading frames with parsed attributes."""
+
+        frame = tabix.GtfFrame.read_csv(gtf_path)
+
+        assert isinstance(frame, tabix.GtfFrame)
+        assert list(frame.columns) == list(gtf_frame.columns)
+
+        pd.testing.assert_frame_equal(
+            frame.reset_index(drop=True), gtf_frame.reset_index(drop=True),
+            check_categorical=False)
+
+    def test_read_csv_attributes(self, gtf_path):
+        """Tests reading a selection of attributes."""
+
+        frame = tabix.GtfFrame.read_csv(
+            gtf_path, attributes=['gene_id', 'missing'])
+
+        assert list(frame.columns) == \
+            list(tabix.GtfFile.FIELDS[:-1]) + ['gene_id', 'missing']
+        assert frame['missing'].isnull().all()
+
+    def test_read_csv_chunksize(self, gtf_path, gtf_frame):
+        """Tests reading frames in chunks."""
+
+        chunks = list(tabix.GtfFrame.read_csv(gtf_path, chunksize=100,
+                                              attributes=['gene_id']))
+
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        assert list(pd.concat(chunks)['gene_id']) == \
+            list(gtf_frame['gene_id'])
+
+    def test_read_csv_regex(self, gtf_path, monkeypatch):
+        """Tests that the regex tokenizer matches the arrow tokenizer."""
+
+        frame = tabix.GtfFrame.read_csv(gtf_path)
+
+        monkeypatch.setattr(tabix, 'pa', None)
+        pd.testing.assert_frame_equal(
+            tabix.GtfFrame.read_csv(gtf_path), frame)
+
+    def test_compact(self, gtf_frame):
+        """Tests compacting of the frame memory layout."""
+
+        compact, report = gtf_frame.compact(return_report=True)
+
+        assert isinstance(compact, tabix.GtfFrame)
+        assert compact['start'].dtype == np.int32
+        assert compact['strand'].dtype.name == 'category'
+        assert compact['gene_biotype'].dtype.name == 'category'
+        assert report['saved'].sum() > 0
+
+        pd.testing.assert_frame_equal(
+            compact, gtf_frame, check_dtype=False, check_categorical=False)
+
+    def test_compact_int8_strand(self, gtf_frame):
+        """Tests storing strands as int8 codes."""
+
+        compact = gtf_frame.compact(strand='int8', max_cardinality=0)
+
+        assert compact['strand'].dtype == np.int8
+        assert set(compact['strand']) <= {-1, 0, 1}
+        assert compact['gene_id'].dtype == gtf_frame['gene_id'].dtype
+
+    def test_read_csv_compact(self, gtf_path):
+        """Tests reading frames in the compact layout."""
+
+        frame = tabix.GtfFrame.read_csv(gtf_path, compact=True)
+        assert frame['end'].dtype == np.int32
+
+
+class TestTabixHandlePool(object):
+
+    def test_reuse(self, gtf_path):
+        """Tests if released handles are reused for the same file."""
+
+        pool = tabix.TabixHandlePool(max_size=2)
+
+        handle = pool.acquire(gtf_path)
+        pool.release(gtf_path, handle)
+
+        assert pool.acquire(gtf_path) is handle
+
+    def test_max_size(self, gtf_path):
+        """Tests if the pool evicts handles beyond its maximum size."""
+
+        pool = tabix.TabixHandlePool(max_size=1)
+
+        handles = [pool.acquire(gtf_path), pool.acquire(gtf_path)]
+        assert handles[0] is not handles[1]
+
+        for handle in handles:
+            pool.release(gtf_path, handle)
+
+        assert pool.acquire(gtf_path) is handles[1]
+        assert pool.acquire(gtf_path) is not handles[0]
+
+    def test_persistent_fetch(self, gtf_path):
+        """Tests if persistent fetches match non-persistent fetches."""
+
+        iterator = tabix.TabixIterator(gtf_path, parser=pysam.asGTF())
+        expected = [tuple(r) for r in iterator.fetch('1')]
+
+        with iterator:
+            result = [tuple(r) for r in iterator.fetch('1')]
+            result2 = [tuple(r) for r in iterator.fetch('1')]
+
+        assert result == expected
+        assert result2 == expected
+
+    def test_persistent_nested_fetch(self, gtf_path):
+        """Tests if nested fetches do not share the same handle."""
+
+        with tabix.TabixIterator(gtf_path, parser=pysam.asGTF()) as iterator:
+            outer = iterator.fetch('1')
+            first = tuple(next(outer))
+
+            inner = [tuple(r) for r in iterator.fetch('11')]
+            rest = [tuple(r) for r in outer]
+
+        assert first[0] == '1'
+        assert all(r[0] == '1' for r in rest)
+        assert all(r[0] == '11' for r in inner)
+
+
+@pytest.fixture
+def bed_lines():
+    return ['{}\t{}\t{}\tpeak_{}\t{}\t{}\n'.format(
+        chrom, start, start + 50, i, i % 10, '+-'[i % 2])
+        for i, (chrom, start) in enumerate(
+            (chrom, start) for start in range(10000, 0, -100)
+            for chrom in ('2', '1'))]
+
+
+def _bed_sort_key(line):
+    fields = line.split('\t')
+    return fields[0], int(fields[1])
+
+
+class TestBedFile(object):
+
+    def test_compress(self, bed_lines, tmpdir):
+        """Tests external sorting, compressing and indexing of a bed file."""
+
+        bed_path = str(tmpdir.join('test.bed'))
+        with open(bed_path, 'w') as file_:
+            file_.write('track name=peaks\n')
+            file_.writelines(bed_lines)
+
+        gz_path = tabix.BedFile.compress(
+            bed_path, buffer_size=5000, tmp_dir=str(tmpdir))
+
+        with gzip.open(gz_path, 'rt') as file_:
+            result = file_.readlines()
+
+        assert result == sorted(bed_lines, key=_bed_sort_key)
+
+    def test_sort_processes(self, bed_lines, tmpdir):
+        """Tests sorting using all cores (processes=None)."""
+
+        bed_path = str(tmpdir.join('test.bed'))
+        with open(bed_path, 'w') as file_:
+            file_.writelines(bed_lines)
+
+        sorted_path = tabix.BedFile.sort(
+            bed_path, str(tmpdir.join('sorted.bed')), processes=None)
+
+        with open(sorted_path, 'r') as file_:
+            result = file_.readlines()
+
+        assert result == sorted(bed_lines, key=_bed_sort_key)
+
+    def test_get_region(self, bed_lines, tmpdir):
+        """Tests fetching of bed records for a region."""
+
+        bed_path = str(tmpdir.join('test.bed'))
+        with open(bed_path, 'w') as file_:
+            file_.writelines(bed_lines)
+
+        bed = tabix.BedFile(bed_path)
+        frame = bed.get_region('1', 1000, 2000)
+
+        assert list(frame.columns) == list(tabix.BedFile.FIELDS[:6])
+        assert set(frame['chrom']) == {'1'}
+        assert frame['chromStart'].min() == 1000
+        assert frame['chromStart'].max() == 1900
+
+        columnar = bed.get_region('1', 1000, 2000, engine='columnar')
+        assert columnar.equals(frame)
+
+    def test_iter_chunks(self, bed_lines, tmpdir):
+        """Tests iterating over bed records in chunks."""
+
+        bed_path = str(tmpdir.join('test.bed'))
+        with open(bed_path, 'w') as file_:
+            file_.writelines(bed_lines)
+
+        bed = tabix.BedFile(bed_path)
+        chunks = list(bed.iter_chunks(chunksize=30))
+
+        assert all(isinstance(chunk, tabix.BedFrame) for chunk in chunks)
+        assert max(len(chunk) for chunk in chunks) == 30
+        assert pd.concat(chunks).equals(bed.get_region(engine='columnar'))
+
+
+@pytest.fixture
+def bed_frame():
+    return tabix.BedFrame(
+        {'chrom': ['1', '1', '1', '2'],
+         'chromStart': [100, 150, 300, 100],
+         'chromEnd': [200, 250, 400, 200],
+         'name': ['a', 'b', 'c', 'd'],
+         'strand': ['+', '-', '+', '+']})
+
+
+class TestBedFrame(object):
+
+    def test_get_region_incl(self, bed_frame):
+        """Tests inclusiveness using the bed region columns."""
+
+        result = bed_frame.get_region('1', 150, 400, incl_left=False)
+        assert list(result['name']) == ['c']
+
+        result = bed_frame.get_region('1', 100, 250, incl_right=False)
+        assert list(result['name']) == ['a']
+
+    def test_merge_regions(self, bed_frame):
+        """Tests merging of overlapping regions."""
+
+        result = bed_frame.merge_regions()
+
+        assert isinstance(result, tabix.BedFrame)
+        assert result.values.tolist() == [
+            ['1', 100, 250], ['1', 300, 400], ['2', 100, 200]]
+
+        result = bed_frame.merge_regions(distance=50)
+        assert result.values.tolist() == [['1', 100, 400], ['2', 100, 200]]
+
+        result = bed_frame.merge_regions(strand=True)
+        assert len(result) == 4
+
+    def test_complement_regions(self, bed_frame):
+        """Tests computing regions not covered by the frame."""
+
+        result = bed_frame.complement_regions(
+            {'1': 500, '2': 200, '3': 100})
+
+        assert result.values.tolist() == [
+            ['1', 0, 100], ['1', 250, 300], ['1', 400, 500],
+            ['2', 0, 100], ['3', 0, 100]]
+
+    def test_complement_regions_file(self, bed_frame, tmpdir):
+        """Tests reading contig sizes from a fasta index."""
+
+        fai_path = str(tmpdir.join('genome.fa.fai'))
+        with open(fai_path, 'w') as file_:
+            file_.write('1\t500\t3\t60\t61\n2\t200\t512\t60\t61\n')
+
+        result = bed_frame.complement_regions(fai_path)
+        assert len(result) == 4
+
+    def test_complement_regions_disjoint(self, bed_frame):
+        """Tests complements for contigs without any rows."""
+
+        result = bed_frame.complement_regions({'3': 100, '4': 50})
+        assert result.values.tolist() == [['3', 0, 100], ['4', 0, 50]]
+
+    def test_subtract_regions(self, bed_frame):
+        """Tests subtracting regions from rows."""
+
+        other = tabix.BedFrame({'chrom': ['1', '1', '2'],
+                                'chromStart': [120, 180, 0],
+                                'chromEnd': [130, 220, 1000]})
+
+        result = bed_frame.subtract_regions(other)
+
+        assert result[['name', 'chromStart', 'chromEnd']].values.tolist() == [
+            ['a', 100, 120], ['a', 130, 180], ['b', 150, 180],
+            ['b', 220, 250], ['c', 300, 400]]
+
+    def test_subtract_regions_disjoint(self, bed_frame):
+        """Tests if rows on contigs absent from other are kept."""
+
+        other = tabix.BedFrame({'chrom': ['1', '3'],
+                                'chromStart': [120, 0],
+                                'chromEnd': [130, 1000]})
+
+        result = bed_frame.subtract_regions(other)
+        assert result[['name', 'chromStart', 'chromEnd']].values.tolist() == [
+            ['a', 100, 120], ['a', 130, 200], ['b', 150, 250],
+            ['c', 300, 400], ['d', 100, 200]]
+
+        other = tabix.BedFrame({'chrom': ['3'], 'chromStart': [0],
+                                'chromEnd': [1000]})
+
+        result = bed_frame.subtract_regions(other)
+        assert result[['name', 'chromStart', 'chromEnd']].values.tolist() == \
+            bed_frame[['name', 'chromStart', 'chromEnd']].values.tolist()
+
+    def test_nearest(self, bed_frame):
+        """Tests finding the nearest region of each row."""
+
+        other = tabix.BedFrame({'chrom': ['1', '1'],
+                                'chromStart': [260, 500],
+                                'chromEnd': [270, 510],
+                                'name': ['x', 'y']})
+
+        result = bed_frame.nearest(other)
+
+        assert result['name_other'].tolist()[:3] == ['x', 'x', 'x']
+        assert result['distance'].tolist()[:3] == [61, 11, 31]
+        assert pd.isnull(result['name_other'].iloc[3])
+
+    def test_nearest_disjoint(self, bed_frame):
+        """Tests nearest rows if other has no rows on the same contigs."""
+
+        other = tabix.BedFrame({'chrom': ['3'], 'chromStart': [0],
+                                'chromEnd': [10], 'name': ['x']})
+
+        result = bed_frame.nearest(other)
+
+        assert len(result) == len(bed_frame)
+        assert result['name_other'].isnull().all()
+        assert result['distance'].isnull().all()
+
+    def test_count_overlaps(self, bed_frame):
+        """Tests counting overlapping rows within a window."""
+
+        result = bed_frame.count_overlaps(bed_frame)
+        assert result['count'].tolist() == [2, 2, 1, 1]
+
+        result = bed_frame.count_overlaps(bed_frame, window=100)
+        assert result['count'].tolist() == [2, 3, 2, 1]
+
+    def test_overlap_random(self):
+        """Tests overlap joins against a brute-force join."""
+
+        random = np.random.RandomState(0)
+
+        def _random_frame(n, max_len):
+            starts = random.randint(0, 10000, n)
+            return tabix.BedFrame(
+                {'chrom': random.choice(['1', '2'], n),
+                 'chromStart': starts,
+                 'chromEnd': starts + random.randint(1, max_len, n)})
+
+        left, right = _random_frame(200, 50), _random_frame(300, 2000)
+        result = left.overlap(right, suffixes=('', '_other'))
+
+        expected = []
+        for i, row in enumerate(left.itertuples()):
+            for j, other in enumerate(right.itertuples()):
+                if row.chrom == other.chrom and \
+                        row.chromStart < other.chromEnd and \
+                        other.chromStart < row.chromEnd:
+                    expected.append((row.chromStart, row.chromEnd,
+                                     other.chromStart, other.chromEnd))
+
+        assert list(zip(result['chromStart'], result['chromEnd'],
+                        result['chromStart_other'],
+                        result['chromEnd_other'])) == expected
@@ -1,13 +1,22 @@
+import collections
 import itertools
+import json
+import multiprocessing
+import os
+import shutil
 
 try:
     from io import StringIO
 except ImportError:
     from StringIO import StringIO
 
+import numpy as np
 import pandas as pd
 
 
+_INDEX_COLUMNS = ['gene_id', 'chr', 'start', 'end', 'strand']
+
+
 def read_csv_startswith(file_path, prefix, **kwargs):
     """Reads sorted csv file, using only lines that
        start with the given prefix."""
@@ -36,19 +45,193 @@ def read_csv_startswith(file_path, prefix, **kwargs):
     return df
 
 
-def read_exon_counts(file_path, gene_id, name_map=None):
-    """Reads exon counts for the given gene, mapping sample_ids if needed."""
+class ExonCountIndex(object):
+    """Sidecar index mapping gene ids to the byte range of their lines
+       in an exon count file, in which lines are grouped by gene.
 
-    # Read counts.
-    counts = read_csv_startswith(file_path, sep='\t',
-                                 prefix=gene_id, dtype={'chr': str})
-    counts.set_index(['gene_id', 'chr', 'start',
-                      'end', 'strand'], inplace=True)
+    The index is stored as json, together with the header of the count
+    file and the modification time and size of the count file, which
+    are used to detect outdated indices.
+    """
 
-    # Remove extra \n from column.
-    counts.columns = [c.strip() for c in counts.columns]
+    SUFFIX = '.idx'
+
+    def __init__(self, columns, genes, source_mtime=None, source_size=None):
+        self._columns = columns
+        self._genes = genes
+        self._source_mtime = source_mtime
+        self._source_size = source_size
+
+    def __len__(self):
+        return len(self._genes)
+
+    def __contains__(self, gene_id):
+        return gene_id in self._genes
+
+    @property
+    def columns(self):
+        """Column names of the count file."""
+        return list(self._columns)
+
+    @property
+    def gene_ids(self):
+        """Indexed gene ids, in the order of the count file."""
+        return sorted(self._genes, key=lambda g: self._genes[g][0])
+
+    @classmethod
+    def index_path(cls, file_path):
+        """Returns the sidecar index path for the given count file."""
+        return str(file_path) + cls.SUFFIX
+
+    @classmethod
+    def open(cls, file_path, index_path=None, rebuild=True):
+        """Loads the index for the given count file, (re)building the
+           index if it is missing or if the count file has changed."""
+
+        index_path = index_path or cls.index_path(file_path)
+
+        if os.path.exists(index_path):
+            index = cls.load(index_path)
+            if not index.is_stale(file_path):
+                return index
+
+        if not rebuild:
+            raise ValueError('Missing or outdated exon count '
+                             'index for {}'.format(file_path))
+
+        return cls.build(file_path, index_path=index_path)
+
+    def is_stale(self, file_path):
+        """Checks if the count file changed since the index was built."""
+        stat = os.stat(str(file_path))
+        return (stat.st_mtime != self._source_mtime or
+                stat.st_size != self._source_size)
+
+    @classmethod
+    def build(cls, file_path, index_path=None, sep='\t'):
+        """Builds the index for the given count file and writes
+           it to the sidecar index path."""
+
+        file_path = str(file_path)
+        index_path = index_path or cls.index_path(file_path)
+
+        stat = os.stat(file_path)
+        sep_bytes = sep.encode('utf-8')
+
+        genes = collections.OrderedDict()
+
+        with open(file_path, 'rb') as file_:
+            header = file_.readline()
+            columns = [c.strip() for c in header.decode('utf-8').split(sep)]
+
+            offset = len(header)
+            current, start = None, offset
+
+            for line in file_:
+                gene_id = line.split(sep_bytes, 1)[0].decode('utf-8')
+
+                if gene_id != current:
+                    if current is not None:
+                        genes[current] = (start, offset - start)
+
+                    if gene_id in genes:
+                        raise ValueError(
+                            'Lines of gene {} are not grouped in {}'
+                            .format(gene_id, file_path))
+
+                    current, start = gene_id, offset
+
+                offset += len(line)
+
+            if current is not None:
+                genes[current] = (start, offset - start)
+
+        index = cls(columns, genes, source_mtime=stat.st_mtime,
+                    source_size=stat.st_size)
+        index.write(index_path)
+
+        return index
+
+    def write(self, index_path):
+        """Writes the index to the given path."""
+
+        gene_ids = list(self._genes.keys())
+
+        payload = {'source_mtime': self._source_mtime,
+                   'source_size': self._source_size,
+                   'columns': self._columns,
+                   'gene_ids': gene_ids,
+                   'offsets': [self._genes[g][0] for g in gene_ids],
+                   'lengths': [self._genes[g][1] for g in gene_ids]}
+
+        with open(index_path, 'w') as file_:
+            json.dump(payload, file_)
+
+    @classmethod
+    def load(cls, index_path):
+        """Loads an index from the given path."""
+
+        with open(index_path, 'r') as file_:
+            payload = json.load(file_)
+
+        genes = collections.OrderedDict(zip(
+            payload['gene_ids'], zip(payload['offsets'], payload['lengths'])))
+
+        return cls(payload['columns'], genes,
+                   source_mtime=payload['source_mtime'],
+                   source_size=payload['source_size'])
+
+    def lookup(self, gene_id):
+        """Returns the (offset, length) byte range of the lines of
+           the given gene, or None if the gene is not indexed."""
+        return self._genes.get(gene_id)
+
+    def read_blocks(self, file_path, gene_ids):
+        """Reads the lines of the given genes, skipping genes that are not
+           indexed. Returns an ordered dict of gene id to lines, in which
+           genes are ordered (and read) in file order."""
+
+        ranges = sorted((self._genes[g], g) for g in set(gene_ids)
+                        if g in self._genes)
+
+        blocks = collections.OrderedDict()
+        with open(str(file_path), 'rb') as file_:
+            for (offset, length), gene_id in ranges:
+                file_.seek(offset)
+                blocks[gene_id] = file_.read(length).decode('utf-8')
+
+        return blocks
+
+
+# Opened indices, shared between reads of the same count file.
+_OPEN_INDICES = {}
+
+
+def _open_index(file_path, index):
+    if index is True:
+        key = os.path.abspath(str(file_path))
+        index = _OPEN_INDICES.get(key)
+
+        if index is None or index.is_stale(file_path):
+            index = ExonCountIndex.open(file_path)
+            _OPEN_INDICES[key] = index
+
+    return index
+
+
+def _parse_exon_counts(lines, columns, name_map=None):
+    """Parses exon count lines into a frame indexed by exon."""
+
+    counts = pd.read_csv(StringIO(lines), sep='\t', names=columns,
+                         dtype={'chr': str})
+    counts.set_index(_INDEX_COLUMNS, inplace=True)
+
+    return _map_names(counts, name_map)
+
+
+def _map_names(counts, name_map):
+    """Selects and renames sample columns using name_map (if given)."""
 
-    # Map names to sample_ids.
     if name_map is not None:
         sel_cols = [c for c in counts.columns if c in name_map]
 
@@ -56,3 +239,403 @@ def read_exon_counts(file_path, gene_id, name_map=None):
         counts.columns = [name_map[c] for c in sel_cols]
 
     return counts
+
+
+def read_exon_counts(file_path, gene_id, name_map=None, index=True):
+    """Reads exon counts for the given gene, mapping sample_ids if needed.
+
+    By default, the lines of the gene are looked up using the sidecar
+    ExonCountIndex of the file, which is built on first use and kept
+    open for subsequent reads of the same file. Index can
+    also be an (opened) ExonCountIndex, or None to scan the file from
+    the top for lines starting with the gene id.
+    """
+
+    index = _open_index(file_path, index)
+
+    if index is not None:
+        lines = index.read_blocks(file_path, [gene_id]).get(gene_id, u'')
+        return _parse_exon_counts(lines, index.columns, name_map=name_map)
+
+    # Read counts.
+    counts = read_csv_startswith(file_path, sep='\t',
+                                 prefix=gene_id, dtype={'chr': str})
+    counts.set_index(_INDEX_COLUMNS, inplace=True)
+
+    # Remove extra \n from column.
+    counts.columns = [c.strip() for c in counts.columns]
+
+    return _map_names(counts, name_map)
+
+
+def read_exon_counts_many(file_path, gene_ids, name_map=None, index=True):
+    """Reads exon counts for multiple genes, returning an ordered dict
+       of gene id to counts (in the order of gene_ids).
+
+    Lines of the genes are read in file order using the sidecar index
+    (see read_exon_counts) and parsed at once. Genes that are absent from
+    the file have empty counts. If index is None, the file is scanned
+    for each of the genes instead (as for read_exon_counts).
+    """
+
+    index = _open_index(file_path, index)
+
+    if index is None:
+        return collections.OrderedDict(
+            (gene_id, read_exon_counts(file_path, gene_id,
+                                       name_map=name_map, index=None))
+            for gene_id in gene_ids)
+
+    blocks = index.read_blocks(file_path, gene_ids)
+    counts = _parse_exon_counts(u''.join(blocks.values()), index.columns,
+                                name_map=name_map)
+
+    return collections.OrderedDict(
+        zip(gene_ids, _split_genes(counts, gene_ids)))
+
+
+def _split_genes(counts, gene_ids):
+    """Splits counts into the (contiguous) rows of each of the given
+       genes, returning an empty frame for genes without counts."""
+
+    genes = counts.index.get_level_values('gene_id').values
+
+    if len(genes) == 0:
+        return [counts.iloc[0:0] for _ in gene_ids]
+
+    starts = np.flatnonzero(np.r_[True, genes[1:] != genes[:-1]])
+    ends = np.r_[starts[1:], len(genes)]
+
+    bounds = {genes[start]: (start, end) for start, end in zip(starts, ends)}
+
+    return [counts.iloc[slice(*bounds.get(gene_id, (0, 0)))]
+            for gene_id in gene_ids]
+
+
+def iter_exon_counts(file_path, gene_ids, name_map=None, index=True,
+                     processes=None, batch_bytes=4 * 1024 ** 2):
+    """Reads exon counts for multiple genes in a pool of processes,
+       yielding (gene_id, counts) tuples in the order of gene_ids.
+
+    Genes are looked up in the sidecar index (see read_exon_counts) and
+    their byte ranges are split, in file order, into batches of roughly
+    batch_bytes on gene boundaries. Each batch is read and parsed by a
+    worker process, in which the line ranges of genes that are adjacent
+    in the file are read at once. Genes are yielded as soon as they (and
+    all genes before them in gene_ids) have been read, so that memory
+    usage is bounded if gene_ids is (roughly) in file order. Genes that
+    are absent from the file have empty counts. If processes is 1,
+    batches are read in the current process.
+    """
+
+    gene_ids = list(gene_ids)
+
+    index = _open_index(file_path, True if index is None else index)
+    empty = _parse_exon_counts(u'', index.columns, name_map=name_map)
+
+    tasks = _exon_count_batches(str(file_path), index, gene_ids,
+                                name_map=name_map, batch_bytes=batch_bytes)
+
+    if processes == 1:
+        batches = map(_read_exon_count_batch, tasks)
+        for item in _order_genes(batches, gene_ids, index, empty):
+            yield item
+        return
+
+    pool = multiprocessing.Pool(processes)
+
+    try:
+        batches = pool.imap(_read_exon_count_batch, tasks)
+        for item in _order_genes(batches, gene_ids, index, empty):
+            yield item
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _exon_count_batches(file_path, index, gene_ids, name_map=None,
+                        batch_bytes=4 * 1024 ** 2):
+    """Splits the byte ranges of the given genes (in file order) into
+       batches of roughly batch_bytes, yielding (file_path, columns,
+       gene_ids, spans, name_map) tasks, in which spans are the merged
+       (offset, length) ranges of the genes in the batch."""
+
+    ranges = sorted((index.lookup(gene_id), gene_id)
+                    for gene_id in set(gene_ids) if gene_id in index)
+
+    batch_genes, spans, size = [], [], 0
+
+    for (offset, length), gene_id in ranges:
+        if spans and spans[-1][0] + spans[-1][1] == offset:
+            spans[-1][1] += length
+        else:
+            spans.append([offset, length])
+
+        batch_genes.append(gene_id)
+        size += length
+
+        if size >= batch_bytes:
+            yield file_path, index.columns, batch_genes, spans, name_map
+            batch_genes, spans, size = [], [], 0
+
+    if batch_genes:
+        yield file_path, index.columns, batch_genes, spans, name_map
+
+
+def _read_exon_count_batch(args):
+    file_path, columns, gene_ids, spans, name_map = args
+
+    with open(file_path, 'rb') as file_:
+        blocks = []
+        for offset, length in spans:
+            file_.seek(offset)
+            blocks.append(file_.read(length).decode('utf-8'))
+
+    counts = _parse_exon_counts(u''.join(blocks), columns, name_map=name_map)
+
+    return list(zip(gene_ids, _split_genes(counts, gene_ids)))
+
+
+def _order_genes(batches, gene_ids, index, empty):
+    """Yields (gene_id, counts) tuples from the given batches in the
+       order of gene_ids, holding back genes that arrive early. Genes
+       that are not in the index are yielded with empty counts."""
+
+    remaining = collections.Counter(gene_ids)
+    pending = {}
+
+    batches = iter(batches)
+
+    for gene_id in gene_ids:
+        if gene_id not in index:
+            # Gene is not in the file, so it is not in any batch.
+            yield gene_id, empty
+            continue
+
+        while gene_id not in pending:
+            pending.update(next(batches))
+
+        counts = pending[gene_id]
+
+        remaining[gene_id] -= 1
+        if remaining[gene_id] == 0:
+            del pending[gene_id]
+
+        yield gene_id, counts
+
+
+class ExonCountMatrix(object):
+    """Exon count table stored as a memory-mapped binary count matrix.
+
+    Counts are stored as a (row-major) exons x samples matrix in the npy
+    format, together with the exon annotation and the row range of each
+    gene. As the exons of a gene are stored in consecutive rows, the
+    counts of a gene are read as a view of the memory-mapped matrix,
+    without parsing or copying any counts. Sample selections are also
+    views if they select a contiguous range of samples.
+    """
+
+    _COUNTS_FILE = 'counts.npy'
+    _META_FILE = 'meta.json'
+    _EXON_COLUMNS = ('chr', 'start', 'end', 'strand')
+
+    def __init__(self, counts, exons, gene_ids, gene_bounds, samples):
+        self._counts = counts
+        self._exons = exons
+        self._gene_ids = gene_ids
+        self._gene_bounds = gene_bounds
+        self._samples = samples
+
+        self._gene_pos = {gene_id: i for i, gene_id in enumerate(gene_ids)}
+        self._sample_pos = {sample: i for i, sample in enumerate(samples)}
+
+    def __len__(self):
+        return len(self._gene_ids)
+
+    def __contains__(self, gene_id):
+        return gene_id in self._gene_pos
+
+    @property
+    def gene_ids(self):
+        return list(self._gene_ids)
+
+    @property
+    def samples(self):
+        return list(self._samples)
+
+    @property
+    def counts(self):
+        """The full (memory-mapped) exons x samples count matrix."""
+        return self._counts
+
+    @classmethod
+    def convert(cls, file_path, out_path=None, dtype=np.uint32,
+                chunksize=100000):
+        """Converts an exon count file to a count matrix directory.
+
+        The count file is read in chunks of chunksize lines, which are
+        written directly into the memory-mapped matrix. Counts are stored
+        using the given (integer) dtype. Lines of each gene should be
+        grouped together, as for ExonCountIndex.
+        """
+
+        file_path = str(file_path)
+        out_path = out_path or file_path + '.counts'
+
+        created = not os.path.exists(out_path)
+        if created:
+            os.makedirs(out_path)
+
+        try:
+            cls._convert(file_path, out_path, dtype=dtype,
+                         chunksize=chunksize)
+        except Exception:
+            # Don't leave a partial store behind.
+            if created:
+                shutil.rmtree(out_path, ignore_errors=True)
+            else:
+                for name in ((cls._COUNTS_FILE, cls._META_FILE) +
+                             tuple(c + '.npy' for c in cls._EXON_COLUMNS)):
+                    path = os.path.join(out_path, name)
+                    if os.path.exists(path):
+                        os.unlink(path)
+            raise
+
+        return cls.open(out_path)
+
+    @classmethod
+    def _convert(cls, file_path, out_path, dtype, chunksize):
+        """Writes the count matrix files of convert into out_path."""
+
+        with open(file_path, 'rb') as file_:
+            header = file_.readline().decode('utf-8')
+            n_rows = sum(1 for line in file_ if line.strip())
+
+        columns = [c.strip() for c in header.split('\t')]
+        samples = columns[len(_INDEX_COLUMNS):]
+
+        counts = np.lib.format.open_memmap(
+            os.path.join(out_path, cls._COUNTS_FILE), mode='w+',
+            dtype=dtype, shape=(n_rows, len(samples)))
+
+        info = np.iinfo(dtype)
+        genes, exons = [], {c: [] for c in cls._EXON_COLUMNS}
+
+        chunks = pd.read_csv(file_path, sep='\t', skiprows=1, names=columns,
+                             dtype={'chr': str}, chunksize=chunksize)
+
+        offset = 0
+        for chunk in chunks:
+            values = chunk[samples].values
+
+            if values.size > 0 and (values.min() < info.min or
+                                    values.max() > info.max):
+                raise ValueError('Counts do not fit in {}'.format(
+                    np.dtype(dtype).name))
+
+            counts[offset:offset + len(chunk)] = values
+            offset += len(chunk)
+
+            genes.append(chunk['gene_id'].values.astype(str))
+            for name in cls._EXON_COLUMNS:
+                exons[name].append(chunk[name].values)
+
+        counts.flush()
+        del counts
+
+        # Determine the row range of each gene.
+        genes = np.concatenate(genes) if genes else np.array([], dtype=str)
+
+        starts = np.flatnonzero(np.r_[True, genes[1:] != genes[:-1]]) \
+            if len(genes) > 0 else np.array([], dtype=np.int64)
+        gene_ids = genes[starts]
+
+        if len(set(gene_ids)) != len(gene_ids):
+            raise ValueError('Lines of genes are not grouped '
+                             'in {}'.format(file_path))
+
+        # Store exon annotation, using fixed-width strings (rather than
+        # objects), so that columns can be memory-mapped.
+        for name in cls._EXON_COLUMNS:
+            values = np.concatenate(exons[name]) if exons[name] else []
+            if name in {'chr', 'strand'}:
+                values = np.asarray(values).astype(str)
+            np.save(os.path.join(out_path, name + '.npy'), values)
+
+        with open(os.path.join(out_path, cls._META_FILE), 'w') as file_:
+            json.dump({'samples': samples,
+                       'gene_ids': [str(g) for g in gene_ids],
+                       'gene_bounds': np.r_[starts, len(genes)].tolist()},
+                      file_)
+
+    @classmethod
+    def open(cls, path):
+        """Opens a count matrix directory, memory-mapping the counts."""
+
+        with open(os.path.join(path, cls._META_FILE), 'r') as file_:
+            meta = json.load(file_)
+
+        counts = np.load(os.path.join(path, cls._COUNTS_FILE),
+                         mmap_mode='r')
+
+        exons = {name: np.load(os.path.join(path, name + '.npy'),
+                               mmap_mode='r')
+                 for name in cls._EXON_COLUMNS}
+
+        return cls(counts, exons, meta['gene_ids'],
+                   np.array(meta['gene_bounds'], dtype=np.int64),
+                   meta['samples'])
+
+    def _rows(self, gene_id):
+        try:
+            pos = self._gene_pos[gene_id]
+        except KeyError:
+            return slice(0, 0)
+        return slice(self._gene_bounds[pos], self._gene_bounds[pos + 1])
+
+    def _columns(self, samples):
+        """Returns a column selector for the given samples, which is a
+           slice if the samples form a contiguous range."""
+
+        if samples is None:
+            return slice(None)
+
+        positions = [self._sample_pos[s] for s in samples]
+
+        if len(positions) > 0 and positions == list(
+                range(positions[0], positions[0] + len(positions))):
+            return slice(positions[0], positions[0] + len(positions))
+
+        return np.array(positions, dtype=np.int64)
+
+    def values(self, gene_id, samples=None):
+        """Returns the exons x samples counts of the given gene (for the
+           given samples) as an array, without the exon annotation."""
+        return self._counts[self._rows(gene_id), self._columns(samples)]
+
+    def read(self, gene_id, name_map=None):
+        """Reads exon counts for the given gene as a frame (as for
+           read_exon_counts), mapping sample_ids if needed."""
+
+        if name_map is not None:
+            samples = [s for s in self._samples if s in name_map]
+            names = [name_map[s] for s in samples]
+        else:
+            samples, names = None, self._samples
+
+        rows = self._rows(gene_id)
+
+        index = pd.MultiIndex.from_arrays(
+            [np.repeat(gene_id, rows.stop - rows.start)] +
+            [self._exons[name][rows] for name in self._EXON_COLUMNS],
+            names=_INDEX_COLUMNS)
+
+        return pd.DataFrame(self.values(gene_id, samples=samples),
+                            index=index, columns=names, copy=False)
+
+    def read_many(self, gene_ids, name_map=None):
+        """Reads exon counts for multiple genes, returning an ordered dict
+           of gene id to counts (in the order of gene_ids)."""
+        return collections.OrderedDict(
+            (gene_id, self.read(gene_id, name_map=name_map))
+            for gene_id in gene_ids)
@@ -6,22 +6,347 @@ from builtins import (ascii, bytes, chr, dict, filter, hex, input,
                       int, map, next, oct, open, pow, range, round,
                       str, super, zip)
 
+import warnings
+
 import numpy as np
+import pandas as pd
+
+
+def normalize_counts(counts, dtype=np.float64, chunksize=None, out=None):
+    """Normalizes a genes x samples count matrix using size factors
+       estimated by the median-of-ratios method.
+
+    If chunksize is given, counts are processed in chunks of rows (see
+    estimate_size_factors) and the normalized counts are written
+    chunk-wise to out, which can be any array-like supporting slice
+    assignment (e.g. a memory-mapped array or a HDF5 dataset) or a path,
+    to which a (memory-mapped) .npy file is written. Returns out, or a
+    new array/DataFrame if out is not given.
+    """
+
+    size_factors = estimate_size_factors(
+        counts, dtype=dtype, chunksize=chunksize)
+
+    if chunksize is None and out is None:
+        normalized = counts / size_factors
+
+        if isinstance(normalized, pd.DataFrame):
+            return normalized.astype(dtype)
+
+        return normalized.astype(dtype, copy=False)
+
+    if isinstance(out, str):
+        out = np.lib.format.open_memmap(
+            out, mode='w+', dtype=dtype, shape=counts.shape)
+    elif out is None:
+        out = np.empty(counts.shape, dtype=dtype)
+
+    factors = np.asarray(size_factors, dtype=dtype)
+    for start, stop, chunk in _iter_chunks(counts, chunksize or len(counts)):
+        out[start:stop] = chunk / factors
+
+    if isinstance(counts, pd.DataFrame) and isinstance(out, np.ndarray):
+        return pd.DataFrame(out, index=counts.index, columns=counts.columns)
+
+    return out
+
+
+def estimate_size_factors(counts, dtype=np.float64, chunksize=None):
+    """Estimates size factors using the median-of-ratios method (as used
+       by DESeq), for a genes x samples count matrix.
+
+    Genes with a zero count in any sample are excluded. Missing (NaN)
+    counts are ignored, both in the geometric mean of a gene and in the
+    median ratio of a sample. Computations are done in the given
+    (floating point) dtype, e.g. float32 to halve memory usage for large
+    matrices. For a DataFrame, size factors are returned as a Series
+    indexed by sample, otherwise as an array.
+
+    If chunksize is given, counts are streamed in chunks of rows instead
+    of being loaded into memory, which allows estimating size factors for
+    memory-mapped or HDF5-backed matrices that do not fit into memory.
+    The resulting (exact) size factors are identical to those of the
+    in-memory computation, but require several passes over the matrix.
+    """
+
+    if chunksize is not None:
+        size_factors = _estimate_size_factors_chunked(
+            counts, chunksize=chunksize, dtype=dtype)
+    else:
+        size_factors = _estimate_size_factors(counts, dtype=dtype)
+
+    if isinstance(counts, pd.DataFrame):
+        return pd.Series(size_factors, index=counts.columns)
+
+    return size_factors
+
+
+def _estimate_size_factors(counts, dtype=np.float64):
+
+    # Take logs into a single (copied) matrix.
+    log_counts = np.array(counts, dtype=dtype)
+
+    with np.errstate(divide='ignore'):
+        np.log(log_counts, out=log_counts)
+
+    # Use the (faster) non-NaN-aware reductions if nothing is missing.
+    if np.isnan(log_counts).any():
+        mean, median = np.nanmean, np.nanmedian
+    else:
+        mean, median = np.mean, _median
+
+    with warnings.catch_warnings():
+        # Genes without any (non-missing) counts give empty slices.
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        log_geo_means = mean(log_counts, axis=1)
+
+        # Compute log-ratios for genes without zero counts, in-place.
+        valid = np.isfinite(log_geo_means)
+
+        log_counts = log_counts[valid]
+        log_counts -= log_geo_means[valid, None]
+
+        return np.exp(median(log_counts, axis=0))
+
+
+def _median(values, axis=0):
+    """Computes the medians of the columns of a matrix, by partitioning
+       a (row-major) transposed copy of the matrix in-place."""
+
+    if axis != 0:
+        raise ValueError('Only axis=0 is supported')
+
+    n_rows = values.shape[0]
+    if n_rows == 0:
+        return np.full(values.shape[1], np.nan, dtype=values.dtype)
+
+    columns = np.array(values.T, order='C')
+    mid = n_rows // 2
+
+    if n_rows % 2 == 1:
+        columns.partition(mid, axis=1)
+        return columns[:, mid]
+
+    columns.partition([mid - 1, mid], axis=1)
+    return (columns[:, mid - 1] + columns[:, mid]) / 2
+
+
+def _iter_chunks(counts, chunksize):
+    """Iterates over chunks of rows of a (possibly out-of-core) matrix,
+       yielding start, stop and the chunk as an in-memory array."""
+
+    for start in range(0, len(counts), chunksize):
+        stop = min(start + chunksize, len(counts))
+
+        if isinstance(counts, pd.DataFrame):
+            chunk = counts.iloc[start:stop].values
+        else:
+            chunk = np.asarray(counts[start:stop])
+
+        yield start, stop, chunk
+
+
+def _log_ratios(chunk, dtype):
+    """Computes log-ratios (against the geometric mean of each gene) for
+       a chunk of counts. Ratios of excluded genes and missing counts
+       are returned as NaN."""
+
+    log_counts = np.array(chunk, dtype=dtype)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        np.log(log_counts, out=log_counts)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', category=RuntimeWarning)
+
+        if np.isnan(log_counts).any():
+            log_geo_means = np.nanmean(log_counts, axis=1)
+        else:
+            log_geo_means = np.mean(log_counts, axis=1)
+
+    log_counts[~np.isfinite(log_geo_means)] = np.nan
+    log_counts -= log_geo_means[:, None]
+
+    return log_counts
+
+
+def _to_keys(values):
+    """Maps floats to unsigned integer keys with the same ordering."""
+
+    key_type = np.dtype('u{}'.format(values.dtype.itemsize))
+    sign = key_type.type(1) << key_type.type(8 * key_type.itemsize - 1)
+
+    bits = values.view(key_type)
+    return np.where(bits & sign, ~bits, bits | sign)
+
+
+def _from_keys(keys, dtype):
+    """Inverse of _to_keys."""
+
+    sign = keys.dtype.type(1) << keys.dtype.type(8 * keys.dtype.itemsize - 1)
+
+    bits = np.where(keys & sign, keys ^ sign, ~keys)
+    return bits.view(dtype)
+
+
+def _iter_candidates(counts, chunksize, dtype, lower, upper, resolved):
+    """Iterates over chunks of log-ratios, yielding the number of ratios
+       below the (key) range of each sample, together with the keys and
+       samples of ratios within these ranges. Resolved samples are
+       skipped."""
+
+    lower_bounds = _from_keys(lower, dtype)
+    upper_bounds = _from_keys(upper, dtype)
+
+    # Ranges of resolved samples are emptied to exclude them.
+    lower_bounds[resolved] = np.inf
+    upper_bounds[resolved] = -np.inf
+
+    for _, _, chunk in _iter_chunks(counts, chunksize):
+        log_ratios = _log_ratios(chunk, dtype=dtype)
+
+        below = (log_ratios < lower_bounds).sum(axis=0)
+        rows, cols = np.nonzero((log_ratios >= lower_bounds) &
+                                (log_ratios <= upper_bounds))
+
+        yield below, _to_keys(log_ratios[rows, cols]), cols
+
+
+def _estimate_size_factors_chunked(counts, chunksize, dtype=np.float64,
+                                   n_bins=1024, max_candidates=2**22):
+    """Estimates size factors by streaming over chunks of rows.
+
+    As the geometric mean of a gene only depends on its own row, log-ratios
+    can be computed per chunk. The (exact) median log-ratio of each sample
+    is then found by selection: each pass over the matrix counts ratios
+    in n_bins bins per sample, narrowing the range containing the
+    median(s) of each sample. To avoid rounding issues, bins are defined
+    over integer keys with the same ordering as the ratios. Once at most
+    max_candidates ratios remain within these ranges, a final pass
+    collects the remaining ratios, from which the medians are selected.
+    """
+
+    dtype = np.dtype(dtype)
+
+    n_samples = counts.shape[1]
+    samples = np.arange(n_samples)
+
+    # First pass: determine the number and range of ratios per sample.
+    n_ratios = np.zeros(n_samples, dtype=np.int64)
+    min_ratios = np.full(n_samples, np.nan, dtype=dtype)
+    max_ratios = np.full(n_samples, np.nan, dtype=dtype)
+
+    for _, _, chunk in _iter_chunks(counts, chunksize):
+        log_ratios = _log_ratios(chunk, dtype=dtype)
+
+        n_ratios += (~np.isnan(log_ratios)).sum(axis=0)
+        min_ratios = np.fmin(min_ratios, np.fmin.reduce(log_ratios, axis=0))
+        max_ratios = np.fmax(max_ratios, np.fmax.reduce(log_ratios, axis=0))
+
+    lower, upper = _to_keys(min_ratios), _to_keys(max_ratios)
+    key_type = lower.dtype
+
+    # Subtracting logs never gives a negative zero, so a range ending at
+    # its key can end at the preceding key (avoiding -0.0 == 0.0).
+    neg_zero = _to_keys(np.array([-0.0], dtype=dtype))[0]
+
+    # Ranks of the two middle values (equal for an odd number of ratios).
+    rank_lo = (n_ratios - 1) // 2
+    rank_hi = n_ratios // 2
+
+    median_lo = lower.copy()
+    median_hi = lower.copy()
+
+    resolved = (n_ratios == 0) | (lower == upper)
+    n_candidates = np.where(resolved, 0, n_ratios)
+
+    # Narrow down ranges until the candidates fit into memory.
+    while n_candidates.sum() > max_candidates:
+        # Use bins of a power of two keys, so binning is a shift.
+        shift = np.frexp(((upper - lower) // key_type.type(n_bins))
+                         .astype(np.float64))[1].astype(key_type)
+        width = key_type.type(1) << shift
+
+        below = np.zeros(n_samples, dtype=np.int64)
+        hist = np.zeros(n_samples * n_bins, dtype=np.int64)
+
+        for chunk_below, keys, cols in _iter_candidates(
+                counts, chunksize, dtype, lower, upper, resolved):
+            below += chunk_below
+
+            bins = ((keys - lower[cols]) >> shift[cols]).astype(np.intp)
+            hist += np.bincount(cols * n_bins + bins, minlength=len(hist))
+
+        cum_hist = np.cumsum(hist.reshape(n_samples, n_bins), axis=1)
+
+        # Clipped, as histograms of resolved samples are empty.
+        bin_lo = (cum_hist <= (rank_lo - below)[:, None]).sum(axis=1)
+        bin_lo = np.minimum(bin_lo, n_bins - 1)
+
+        bin_hi = (cum_hist <= (rank_hi - below)[:, None]).sum(axis=1)
+        bin_hi = np.minimum(bin_hi, n_bins - 1)
+
+        n_in_range = (cum_hist[samples, bin_hi] -
+                      np.where(bin_lo > 0, cum_hist[samples, bin_lo - 1], 0))
+
+        active = ~resolved
+
+        # The two middle values may lie far apart, in which case the
+        # range cannot be narrowed any further.
+        if (n_in_range[active] == n_candidates[active]).all():
+            break
+
+        # New upper bounds are clipped without overflowing the keys.
+        offset_hi = bin_hi.astype(key_type) * width
+
+        new_lower = lower + bin_lo.astype(key_type) * width
+        new_upper = lower + offset_hi + np.minimum(
+            width - key_type.type(1), upper - lower - offset_hi)
+
+        new_upper[new_upper == neg_zero] -= key_type.type(1)
+
+        # Bins of a single key directly give the median keys.
+        exact = active & (width == 1)
+
+        median_lo[exact] = new_lower[exact]
+        median_hi[exact] = (lower + bin_hi.astype(key_type))[exact]
+
+        lower[active] = new_lower[active]
+        upper[active] = new_upper[active]
+
+        n_candidates[active] = n_in_range[active]
+
+        resolved |= exact
+        n_candidates[resolved] = 0
+
+    # Final pass: collect candidates and select the medians.
+    if not resolved.all():
+        below = np.zeros(n_samples, dtype=np.int64)
+        candidate_keys, candidate_cols = [], []
+
+        for chunk_below, keys, cols in _iter_candidates(
+                counts, chunksize, dtype, lower, upper, resolved):
+            below += chunk_below
+            candidate_keys.append(keys)
+            candidate_cols.append(cols)
 
+        candidate_keys = np.concatenate(candidate_keys)
+        candidate_cols = np.concatenate(candidate_cols)
 
-def normalize_counts(counts):
-    size_factors = estimate_size_factors(counts)
-    return counts / size_factors
+        order = np.lexsort((candidate_keys, candidate_cols))
+        candidate_keys = candidate_keys[order]
 
+        offsets = np.searchsorted(candidate_cols[order], samples)
 
-def estimate_size_factors(counts):
-    log_geo_means = np.mean(np.log(counts), axis=1)
-    sf = np.apply_along_axis(_estimate_size_factors_col, axis=0,
-                             arr=counts, log_geo_means=log_geo_means)
-    return sf
+        unresolved = ~resolved
+        median_lo[unresolved] = candidate_keys[
+            (offsets + rank_lo - below)[unresolved]]
+        median_hi[unresolved] = candidate_keys[
+            (offsets + rank_hi - below)[unresolved]]
 
+    medians = (_from_keys(median_lo, dtype) +
+               _from_keys(median_hi, dtype)) / 2
+    medians[n_ratios == 0] = np.nan
 
-def _estimate_size_factors_col(counts, log_geo_means):
-    log_counts = np.log(counts)
-    mask = np.isfinite(log_geo_means) & (counts > 0)
-    return np.exp(np.median((log_counts - log_geo_means)[mask]))
+    return np.exp(medians)
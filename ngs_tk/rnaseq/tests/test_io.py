@@ -0,0 +1,242 @@
+import os
+
+import numpy as np
+import pytest
+
+from ngs_tk.rnaseq import io
+
+
+SAMPLES = ['S1', 'S2', 'S3']
+
+
+@pytest.fixture
+def counts_path(tmpdir):
+    random = np.random.RandomState(0)
+
+    lines = ['\t'.join(['gene_id', 'chr', 'start', 'end', 'strand'] +
+                       SAMPLES) + '\n']
+
+    for i in range(50):
+        for j in range(i % 4 + 1):
+            start = i * 1000 + j * 100
+            lines.append('\t'.join(
+                ['ENSG{:05d}'.format(i), '1', str(start), str(start + 50),
+                 '+'] + [str(c) for c in random.randint(0, 100, 3)]) + '\n')
+
+    counts_path = str(tmpdir.join('counts.txt'))
+    with open(counts_path, 'w') as file_:
+        file_.writelines(lines)
+
+    return counts_path
+
+
+class TestExonCountIndex(object):
+
+    def test_build(self, counts_path):
+        """Tests building and reloading the sidecar index."""
+
+        index = io.ExonCountIndex.open(counts_path)
+
+        assert os.path.exists(io.ExonCountIndex.index_path(counts_path))
+        assert len(index) == 50
+        assert index.columns[-3:] == SAMPLES
+
+        loaded = io.ExonCountIndex.open(counts_path, rebuild=False)
+        assert loaded.lookup('ENSG00010') == index.lookup('ENSG00010')
+        assert loaded.lookup('ENSG0001') is None
+
+    def test_stale(self, counts_path):
+        """Tests rebuilding the index if the count file changed."""
+
+        io.ExonCountIndex.open(counts_path)
+
+        with open(counts_path, 'a') as file_:
+            file_.write('ENSG99999\t1\t0\t10\t+\t1\t2\t3\n')
+
+        with pytest.raises(ValueError):
+            io.ExonCountIndex.open(counts_path, rebuild=False)
+
+        assert 'ENSG99999' in io.ExonCountIndex.open(counts_path)
+
+
+class TestReadExonCounts(object):
+
+    def test_indexed(self, counts_path):
+        """Tests if indexed reads match reads that scan the file."""
+
+        result = io.read_exon_counts(counts_path, 'ENSG00011')
+        expected = io.read_exon_counts(counts_path, 'ENSG00011', index=None)
+
+        assert len(result) == 4
+        assert result.equals(expected)
+
+    def test_exact_gene_id(self, counts_path):
+        """Tests if genes sharing a prefix are not matched."""
+
+        result = io.read_exon_counts(counts_path, 'ENSG0001')
+        assert len(result) == 0
+
+    def test_name_map(self, counts_path):
+        result = io.read_exon_counts(counts_path, 'ENSG00011',
+                                     name_map={'S3': 'c', 'S1': 'a'})
+        assert list(result.columns) == ['a', 'c']
+
+    def test_many(self, counts_path):
+        """Tests reading multiple genes at once."""
+
+        gene_ids = ['ENSG00040', 'ENSG00002', 'missing']
+        result = io.read_exon_counts_many(counts_path, gene_ids,
+                                          name_map={'S2': 'b'})
+
+        assert list(result.keys()) == gene_ids
+        assert len(result['missing']) == 0
+
+        for gene_id in gene_ids[:2]:
+            expected = io.read_exon_counts(counts_path, gene_id,
+                                           name_map={'S2': 'b'})
+            assert result[gene_id].equals(expected)
+
+    @pytest.mark.parametrize('gene_ids', [[], ['missing']])
+    def test_many_empty(self, counts_path, gene_ids):
+        """Tests reading multiple genes without any matching lines."""
+
+        result = io.read_exon_counts_many(counts_path, gene_ids)
+
+        assert list(result.keys()) == gene_ids
+        assert all(len(counts) == 0 for counts in result.values())
+
+    def test_many_scan(self, counts_path):
+        """Tests if index=None scans the file, as for read_exon_counts."""
+
+        gene_ids = ['ENSG00040', 'ENSG00002']
+        result = io.read_exon_counts_many(counts_path, gene_ids, index=None)
+
+        assert not os.path.exists(io.ExonCountIndex.index_path(counts_path))
+
+        for gene_id in gene_ids:
+            expected = io.read_exon_counts(counts_path, gene_id, index=None)
+            assert result[gene_id].equals(expected)
+
+    @pytest.mark.parametrize('processes', [1, 2])
+    def test_iter(self, counts_path, processes):
+        """Tests reading genes in batches using a pool of processes."""
+
+        gene_ids = ['ENSG{:05d}'.format(i) for i in range(50)][::-1]
+        gene_ids.insert(10, 'missing')
+
+        result = list(io.iter_exon_counts(
+            counts_path, gene_ids, name_map={'S3': 'c'},
+            processes=processes, batch_bytes=200))
+
+        assert [gene_id for gene_id, _ in result] == gene_ids
+
+        for gene_id, counts in result:
+            expected = io.read_exon_counts_many(
+                counts_path, [gene_id], name_map={'S3': 'c'})[gene_id]
+            assert counts.equals(expected)
+
+    def test_iter_missing(self, counts_path):
+        """Tests reading genes that are absent from the file."""
+
+        result = list(io.iter_exon_counts(
+            counts_path, ['missing', 'missing'], processes=1))
+
+        assert [gene_id for gene_id, _ in result] == ['missing', 'missing']
+        assert all(len(counts) == 0 for _, counts in result)
+
+    def test_iter_missing_lazy(self, counts_path, monkeypatch):
+        """Tests if absent genes are yielded without reading batches."""
+
+        read_batch = io._read_exon_count_batch
+        batches = []
+
+        def _read_batch(args):
+            batches.append(args[2])
+            return read_batch(args)
+
+        monkeypatch.setattr(io, '_read_exon_count_batch', _read_batch)
+
+        gene_ids = ['missing'] + ['ENSG{:05d}'.format(i) for i in range(50)]
+        result = io.iter_exon_counts(counts_path, gene_ids, processes=1,
+                                     batch_bytes=200)
+
+        gene_id, counts = next(result)
+        assert gene_id == 'missing' and len(counts) == 0
+        assert batches == []
+
+        assert next(result)[0] == 'ENSG00000'
+        assert len(batches) == 1
+
+    def test_iter_batches(self, counts_path):
+        """Tests if batches are split on gene boundaries in file order."""
+
+        index = io.ExonCountIndex.open(counts_path)
+        gene_ids = ['ENSG{:05d}'.format(i) for i in range(0, 50, 2)][::-1]
+
+        batches = list(io._exon_count_batches(
+            counts_path, index, gene_ids, batch_bytes=200))
+
+        genes = [g for batch in batches for g in batch[2]]
+        assert genes == sorted(gene_ids)
+
+        spans = [span for batch in batches for span in batch[3]]
+        assert spans == sorted(spans)
+        assert sum(length for _, length in spans) == sum(
+            index.lookup(g)[1] for g in gene_ids)
+
+
+class TestExonCountMatrix(object):
+
+    def test_convert(self, counts_path, tmpdir):
+        """Tests if converted counts match the count file."""
+
+        matrix = io.ExonCountMatrix.convert(
+            counts_path, str(tmpdir.join('counts')), chunksize=7)
+
+        assert len(matrix) == 50
+        assert matrix.samples == SAMPLES
+        assert matrix.counts.shape == (123, 3)
+
+        for gene_id in ['ENSG00000', 'ENSG00031']:
+            result = matrix.read(gene_id)
+            expected = io.read_exon_counts(counts_path, gene_id)
+
+            assert result.index.equals(expected.index)
+            assert np.array_equal(result.values, expected.values)
+
+    def test_views(self, counts_path, tmpdir):
+        """Tests if gene and sample selections are views of the matrix."""
+
+        io.ExonCountMatrix.convert(counts_path, str(tmpdir.join('counts')))
+        matrix = io.ExonCountMatrix.open(str(tmpdir.join('counts')))
+
+        values = matrix.values('ENSG00003', samples=['S2', 'S3'])
+        assert values.shape == (4, 2)
+        assert np.shares_memory(values, matrix.counts)
+
+        result = matrix.read('ENSG00003', name_map={'S2': 'b', 'S3': 'c'})
+        assert list(result.columns) == ['b', 'c']
+        assert np.shares_memory(result.values, matrix.counts)
+
+        assert len(matrix.read('missing')) == 0
+
+    def test_convert_overflow(self, counts_path, tmpdir):
+        with open(counts_path, 'a') as file_:
+            file_.write('ENSG99999\t1\t0\t10\t+\t1\t1000\t3\n')
+
+        with pytest.raises(ValueError):
+            io.ExonCountMatrix.convert(counts_path, str(tmpdir.join('c')),
+                                       dtype=np.uint8, chunksize=10)
+
+        assert not os.path.exists(str(tmpdir.join('c')))
+
+    def test_convert_blank_lines(self, counts_path, tmpdir):
+        """Tests if blank lines are not counted as rows."""
+
+        with open(counts_path, 'a') as file_:
+            file_.write('\n\n')
+
+        matrix = io.ExonCountMatrix.convert(counts_path,
+                                            str(tmpdir.join('counts')))
+
+        assert matrix.counts.shape == (123, 3)
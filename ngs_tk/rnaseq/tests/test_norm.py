@@ -0,0 +1,153 @@
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ngs_tk.rnaseq import norm
+
+
+def _reference_size_factors(counts):
+    """Straightforward (looped) median-of-ratios implementation."""
+
+    counts = np.asarray(counts, dtype=float)
+    keep = (counts > 0).all(axis=1)
+
+    log_counts = np.log(counts[keep])
+    log_ratios = log_counts - log_counts.mean(axis=1)[:, None]
+
+    return np.array([np.exp(np.median(log_ratios[:, j]))
+                     for j in range(counts.shape[1])])
+
+
+@pytest.fixture
+def counts():
+    random = np.random.RandomState(0)
+
+    values = random.negative_binomial(5, 0.1, size=(200, 4))
+    values = values * np.array([1, 2, 3, 4])
+
+    return pd.DataFrame(values, columns=['S1', 'S2', 'S3', 'S4'])
+
+
+class TestEstimateSizeFactors(object):
+
+    def test_reference(self, counts):
+        expected = _reference_size_factors(counts)
+        result = norm.estimate_size_factors(counts)
+
+        assert isinstance(result, pd.Series)
+        assert list(result.index) == list(counts.columns)
+        assert np.allclose(result.values, expected)
+
+    def test_odd_rows(self, counts):
+        counts = counts.loc[(counts > 0).all(axis=1)]
+        counts = counts.iloc[:len(counts) // 2 * 2 - 1]
+
+        assert len(counts) % 2 == 1
+        assert np.allclose(norm.estimate_size_factors(counts).values,
+                           _reference_size_factors(counts))
+
+    def test_array(self, counts):
+        result = norm.estimate_size_factors(counts.values)
+
+        assert isinstance(result, np.ndarray)
+        assert np.allclose(result, _reference_size_factors(counts))
+
+    def test_float32(self, counts):
+        result = norm.estimate_size_factors(counts.values, dtype=np.float32)
+
+        assert result.dtype == np.float32
+        assert np.allclose(result, _reference_size_factors(counts),
+                           rtol=1e-4)
+
+    def test_zero_rows(self):
+        counts = np.array([[0, 0], [1, 2], [2, 4], [0, 5]])
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            result = norm.estimate_size_factors(counts)
+
+        assert np.allclose(result, [np.sqrt(0.5), np.sqrt(2)])
+
+    def test_missing(self, counts):
+        values = counts.values.astype(float)
+        values[0, 0] = np.nan
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error')
+            result = norm.estimate_size_factors(values)
+
+        # Missing value is ignored, rather than excluding the gene.
+        assert np.all(np.isfinite(result))
+        assert np.allclose(result, _reference_size_factors(counts),
+                           rtol=0.05)
+
+    def test_normalize(self, counts):
+        normalized = norm.normalize_counts(counts)
+        factors = norm.estimate_size_factors(counts)
+
+        assert np.allclose(normalized.values,
+                           counts.values / factors.values[None, :])
+
+    def test_normalize_dtype(self, counts):
+        normalized = norm.normalize_counts(counts, dtype=np.float32)
+        assert (normalized.dtypes == np.float32).all()
+
+        normalized = norm.normalize_counts(counts.values, dtype=np.float32)
+        assert normalized.dtype == np.float32
+
+
+class TestChunked(object):
+
+    def test_estimate(self, counts):
+        expected = norm.estimate_size_factors(counts)
+        result = norm.estimate_size_factors(counts, chunksize=15)
+
+        assert isinstance(result, pd.Series)
+        assert np.array_equal(result.values, expected.values)
+
+    @pytest.mark.parametrize('dtype', [np.float32, np.float64])
+    def test_selection(self, counts, dtype):
+        values = counts.values.astype(float)
+        values[1:10, 0] = np.nan
+
+        # Force narrowing down ranges over multiple passes.
+        result = norm._estimate_size_factors_chunked(
+            values, chunksize=15, dtype=dtype, n_bins=4, max_candidates=0)
+
+        expected = norm.estimate_size_factors(values, dtype=dtype)
+        assert np.array_equal(result, expected)
+
+    def test_ties(self):
+        counts = np.tile([[1, 1, 2]], (10, 1))
+
+        result = norm._estimate_size_factors_chunked(
+            counts, chunksize=3, max_candidates=0)
+
+        assert np.allclose(result, [2**(-1 / 3.0)] * 2 + [2**(2 / 3.0)])
+
+    def test_memmap(self, counts, tmpdir):
+        path = str(tmpdir.join('counts.npy'))
+        np.save(path, counts.values.astype(np.uint32))
+
+        mmapped = np.load(path, mmap_mode='r')
+
+        result = norm.estimate_size_factors(mmapped, chunksize=15)
+        expected = norm.estimate_size_factors(counts.values)
+
+        assert np.array_equal(result, expected)
+
+    def test_normalize(self, counts, tmpdir):
+        expected = norm.normalize_counts(counts)
+
+        result = norm.normalize_counts(counts, chunksize=15)
+        assert isinstance(result, pd.DataFrame)
+        assert np.allclose(result.values, expected.values)
+
+        path = str(tmpdir.join('normalized.npy'))
+        result = norm.normalize_counts(
+            counts.values, chunksize=15, dtype=np.float32, out=path)
+
+        assert isinstance(result, np.memmap)
+        assert np.allclose(np.load(path), expected.values, rtol=1e-5)
@@ -1,3 +1,5 @@
+import sys
+
 from setuptools import setup, find_packages
 
 from version import get_git_version
@@ -6,6 +8,9 @@ from version import get_git_version
 install_requires = ['future', 'numpy', 'pandas', 'matplotlib',
                     'seaborn', 'pysam']
 
+if sys.version_info < (3, 2):
+    install_requires.append('futures')
+
 setup(
     name='ngs_tk',
     version=get_git_version(),
@@ -19,6 +24,8 @@ setup(
     zip_safe=True,
     classifiers=[],
     install_requires=install_requires,
+    extras_require={'cache': ['pyarrow'],
+                    'benchmark': ['pytest', 'pytest-benchmark']},
     package_data={
         'ngs_tk.io.tests': ['data/*'],
     }